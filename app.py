@@ -1,27 +1,57 @@
 # app.py
 import os
 import logging
-from flask import Flask, render_template, request, jsonify, session as flask_session
+from flask import Flask, render_template, request, jsonify, Response, session as flask_session
 from datetime import datetime, timedelta
 import json
+import queue
+import threading
+from functools import wraps
 
-from utils import gemini_utils, newsapi_helpers, sentiment_analyzer 
+from utils import gemini_utils, newsapi_helpers, sentiment_analyzer, log_utils, batch_analysis, newsapi_quota, llm_hedging, llm_concurrency, analysis_reuse, prompt_cache, request_profiling, watchlist, article_store, columnar_export, sentiment_analytics, article_scores, text_corpus, news_search
+from utils.rate_limiter import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from utils.deadline import deadline_from_request
 import config 
 
 app = Flask(__name__)
 app.secret_key = config.FLASK_SECRET_KEY
 
-# --- Logging Setup --- (Keep as is)
-logging.basicConfig(
-    level=logging.DEBUG, 
-    format='%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d (%(funcName)s)] - %(message)s',
-    handlers=[logging.StreamHandler()]
-)
+# --- Logging Setup ---
+# Records are handed to a background QueueListener; request threads never block on stream I/O.
+log_utils.configure_logging(config.LOG_LEVEL)
 logger = logging.getLogger(__name__) 
 logging.getLogger("werkzeug").setLevel(logging.WARNING)
 # ... (other library log levels) ...
 logging.getLogger("nltk").setLevel(logging.INFO)
 
+# --- NewsAPI quota ledger (persisted so the daily count survives restarts) ---
+newsapi_quota.configure_ledger(config.NEWSAPI_QUOTA_LEDGER_PATH, config.NEWSAPI_DAILY_REQUEST_LIMIT)
+# --- Optional memory-mapped text corpus: article text stored once on disk, shared page-cache pages across processes ---
+text_corpus.configure_corpus(config.TEXT_CORPUS_DIR)
+# --- SQLite article store (filled by backfill.py and scheduler.py; read by the export endpoints) ---
+article_store.configure_store(config.ARTICLE_STORE_PATH)
+# --- Upstream endpoints (overridden by the load test to hit local stand-ins) and NewsAPI call pacing ---
+newsapi_helpers.configure_newsapi(config.NEWSAPI_BASE_URL or None, config.NEWSAPI_MIN_CALL_INTERVAL_SECONDS)
+gemini_utils.configure_gemini_endpoint(config.GEMINI_API_ENDPOINT)
+# --- Opt-in per-request profiling for admins (X-Profile-Token header); disabled without PROFILING_ADMIN_TOKEN ---
+request_profiling.configure_profiling(config.PROFILING_ADMIN_TOKEN, config.PROFILING_DIR)
+# --- Optional hedged Gemini requests (duplicate a call that outlives the model's recent latency percentile) ---
+llm_hedging.configure_hedging(config.GEMINI_HEDGING_ENABLED, config.GEMINI_HEDGE_PERCENTILE, config.GEMINI_HEDGE_MAX_EXTRA_FRACTION)
+# --- Schema-constrained JSON output from Gemini (set GEMINI_STRUCTURED_OUTPUT=false for free-form replies) ---
+gemini_utils.configure_structured_output(config.GEMINI_STRUCTURED_OUTPUT)
+# --- Instruction-prefix caching: the shared analysis instructions are uploaded once and referenced by handle ---
+prompt_cache.configure_prompt_cache(config.GEMINI_PROMPT_CACHE_BACKEND, config.GEMINI_PROMPT_CACHE_TTL_SECONDS, config.GEMINI_PROMPT_CACHE_MODEL)
+# --- Adaptive Gemini concurrency: grows while calls succeed, halves on 429/resource-exhausted ---
+llm_concurrency.configure_concurrency(config.GEMINI_INITIAL_CONCURRENCY, maximum=config.GEMINI_MAX_CONCURRENCY)
+# --- Reuse the previous LLM analysis when a target's article set has not materially changed ---
+analysis_reuse.configure_reuse(config.LLM_REUSE_ENABLED, config.LLM_REUSE_MAX_ARTICLE_CHANGE, config.LLM_REUSE_MAX_AGE_SECONDS)
+# --- Incremental re-summarization: send only new articles plus the prior result, with periodic full rebuilds ---
+gemini_utils.configure_incremental(config.LLM_INCREMENTAL_ENABLED, config.LLM_INCREMENTAL_FULL_REBUILD_EVERY, config.LLM_INCREMENTAL_FULL_REBUILD_SECONDS)
+# --- Map-reduce: article sets larger than one prompt are analyzed in parallel chunks and merged ---
+gemini_utils.configure_map_reduce(config.LLM_MAP_REDUCE_ENABLED, config.LLM_MAP_REDUCE_THRESHOLD_CHARS, config.LLM_MAP_REDUCE_MAX_CHUNKS, config.LLM_MAP_REDUCE_MAX_WORKERS)
+# --- Optional per-article scoring: batched Gemini calls, one cached score per article, aggregated per target ---
+article_scores.configure_article_scoring(config.ARTICLE_SCORING_ENABLED, config.ARTICLE_SCORE_BATCH_SIZE, config.ARTICLE_SCORE_MAX_WORKERS)
+
 
 # --- API Key Management & Global Clients --- (Keep as is)
 def get_api_keys_from_session_or_config():
@@ -43,7 +73,7 @@ def get_or_create_newsapi_client_global(api_key_for_check, append_log_local_func
         if err:
             get_or_create_newsapi_client_global._current_newsapi_key = None 
             newsapi_global_client = None 
-            append_log_local_func(f"NEWSAPI_APP: Failed to initialize client: {err}", "ERROR")
+            append_log_local_func("NEWSAPI_APP: Failed to initialize client: %s", "ERROR", err)
         else:
             get_or_create_newsapi_client_global._current_newsapi_key = api_key_for_check
             append_log_local_func("NEWSAPI_APP: Global NewsAPI client ready.", "INFO")
@@ -85,30 +115,113 @@ def update_api_keys_route():
     if not keys_updated_messages:
         return jsonify({"message": "No API keys provided to update in session."}), 200
         
-    logger.info(f"API keys update attempt: {'; '.join(log_updates)}")
+    logger.info("API keys update attempt: %s", '; '.join(log_updates))
     return jsonify({"message": "Selected API keys processed for session successfully."})
 
+# --- Watchlist: cheap incremental polling of a fixed stock list, with sentiment change events ---
+watchlist.configure_watchlist(config.WATCHLIST_POLL_SECONDS, config.WATCHLIST_LOOKBACK_DAYS, config.WATCHLIST_MAX_ARTICLES, config.WATCHLIST_SCORE_THRESHOLD)
+watchlist_feed = watchlist.ChangeFeed(config.WATCHLIST_EVENTS_PATH)
+watchlist_monitor = watchlist.WatchlistMonitor(
+    watchlist.parse_watchlist(config.WATCHLIST, gemini_utils.NIFTY_SECTORS_QUERY_CONFIG), gemini_utils.NIFTY_SECTORS_QUERY_CONFIG,
+    gemini_utils.NEWSAPI_INDIA_MARKET_KEYWORDS, config.WATCHLIST_STATE_PATH, watchlist_feed
+)
+
+_watchlist_client = {'api_key': None, 'client': None}
+
+def _watchlist_newsapi_client():
+    # The monitor keeps its own client: re-keying the global one would swap it under request threads
+    if _watchlist_client['client'] is None or _watchlist_client['api_key'] != config.NEWSAPI_ORG_API_KEY:
+        client, err = newsapi_helpers.get_newsapi_org_client(config.NEWSAPI_ORG_API_KEY)
+        if err:
+            return None
+        _watchlist_client.update(api_key=config.NEWSAPI_ORG_API_KEY, client=client)
+    return _watchlist_client['client']
+
+@app.before_request
+def _start_watchlist_monitor():
+    # Started on the first request rather than at import, so the debug reloader's parent process never polls
+    watchlist_monitor.start(_watchlist_newsapi_client, lambda: config.GEMINI_API_KEY)
+
+def get_request_priority(form_data):
+    # Pre-warm scripts and other bulk callers send "priority": "background" so analysts' requests go first
+    return PRIORITY_BACKGROUND if str(form_data.get('priority', '')).lower() == 'background' else PRIORITY_INTERACTIVE
+
+def get_newsapi_quota_remaining(api_key):
+    return newsapi_quota.get_ledger().remaining(api_key)
+
 # --- Helper for ui_log_messages ---
-def setup_local_logger(ui_log_list):
-    def append_log_local(message, level='INFO'):
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        level_upper = level.upper()
-        entry = {'timestamp': timestamp, 'message': str(message), 'level': level_upper}
-        ui_log_list.append(entry)
-        if level_upper == 'ERROR': logger.error(f"API_LOG_UI: {message}")
-        elif level_upper == 'WARNING': logger.warning(f"API_LOG_UI: {message}")
-        elif level_upper == 'DEBUG': logger.debug(f"API_LOG_UI: {message}")
-        else: logger.info(f"API_LOG_UI: {message}")
-    return append_log_local
+def setup_local_logger():
+    # The collector is itself the append_log_func passed to the helpers; .entries() gives the UI list.
+    return log_utils.RequestLogCollector(logger, ui_level=config.UI_LOG_LEVEL, max_entries=config.UI_LOG_MAX_ENTRIES)
+
+def _target_timed_out(request_deadline, analysis, articles, fetch_meta):
+    # Unfinished = the deadline passed and the target never got its LLM analysis (targets with no news are not "timed out")
+    return request_deadline.expired() and analysis is None and bool(articles or fetch_meta.get('timed_out'))
+
+def _timed_out_sector_result(sector_name, sector_full_config, llm_context_date_range_str):
+    return {
+        'sector_name': sector_name,
+        'llm_context_date_range': llm_context_date_range_str,
+        'num_articles_for_llm_sector': 0,
+        'newsapi_pages_used_sector': 0,
+        'gemini_analysis_sector': None,
+        'error_message_sector': f"Timed out before sector {sector_name} was analyzed.",
+        'avg_vader_score_sector': 0.0,
+        'vader_sentiment_label_sector': sentiment_analyzer.get_sentiment_label_from_score(0.0),
+        'constituent_stocks': list(sector_full_config.get("stocks", {}).keys()),
+        'timed_out': True
+    }
+
+def profiled_route(label):
+    """
+    Runs the view under request_profiling.RequestProfile when the request carries a valid admin
+    X-Profile-Token: artifacts are saved under PROFILING_DIR and a stage breakdown is added to the
+    JSON response as 'profile'. Without the header the view runs untouched.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            header_value = request.headers.get(request_profiling.PROFILE_HEADER)
+            if not header_value:
+                return view(*args, **kwargs)
+            if not request_profiling.is_authorized(header_value):
+                logger.warning("Rejected profiling request for %s from %s", request.path, request.remote_addr)
+                return jsonify({'error': True, 'messages': ["Profiling is restricted to admins."], 'results': []}), 403
+            with request_profiling.RequestProfile(label) as profile:
+                response = app.make_response(view(*args, **kwargs))
+            breakdown = profile.stage_breakdown()
+            try:
+                breakdown['artifacts'] = profile.save()
+            except OSError as e:
+                logger.warning("Could not save profile %s: %s", profile.profile_id, e)
+            logger.info("Profiled %s: %s", request.path, profile.profile_id)
+            payload = response.get_json(silent=True)
+            if isinstance(payload, dict):
+                payload['profile'] = breakdown
+                response.set_data(app.json.dumps(payload))
+            response.headers['X-Profile-Id'] = profile.profile_id
+            return response
+        return wrapper
+    return decorator
+
+def _completion_message(label, results):
+    timed_out_count = sum(1 for result in results if result.get('timed_out'))
+    if timed_out_count:
+        return f"{label} partially complete: {timed_out_count} of {len(results)} target(s) timed out."
+    return f"{label} complete."
+
+def log_request_data(route, form_data):
+    # API key fields are never logged
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("REQUEST DATA: %s: %s", route, {k: v for k, v in (form_data or {}).items() if 'key' not in k.lower()})
 
 @app.route('/api/sector-analysis', methods=['POST'])
+@profiled_route("sector")
 def perform_sector_analysis_route_only(): # Renamed for clarity
     form_data = request.json
-    loggable_form_data = {k: v for k, v in form_data.items() if 'key' not in k.lower()}
-    logger.info(f"REQUEST DATA: /api/sector-analysis (Sector Only): {json.dumps(loggable_form_data, indent=2)}")
+    log_request_data("/api/sector-analysis (Sector Only)", form_data)
     
-    ui_log_messages_for_this_request = []
-    append_log_local = setup_local_logger(ui_log_messages_for_this_request)
+    append_log_local = setup_local_logger()
     
     results_payload = [] 
     user_facing_errors = []
@@ -123,31 +236,33 @@ def perform_sector_analysis_route_only(): # Renamed for clarity
     if not current_api_keys['newsapi'] or current_api_keys['newsapi'] == "YOUR_NEWSAPI_ORG_API_KEY_HERE":
         user_facing_errors.append("NewsAPI.org API key is not configured.")
     if user_facing_errors:
-        return jsonify({'error': True, 'messages': user_facing_errors, 'logs': ui_log_messages_for_this_request, 'results': []}), 400
+        return jsonify({'error': True, 'messages': user_facing_errors, 'logs': append_log_local.entries(), 'results': []}), 400
 
     # --- Date and Parameter Setup (as before) ---
     actual_system_today = datetime.now().date()
-    append_log_local(f"Actual system date: {actual_system_today.strftime('%Y-%m-%d')}", "INFO")
+    append_log_local("Actual system date: %s", "INFO", actual_system_today)
     try:
         ui_end_date_str = form_data.get('end_date', actual_system_today.strftime('%Y-%m-%d'))
         ui_selected_end_date_obj = datetime.strptime(ui_end_date_str, '%Y-%m-%d').date()
     except ValueError:
         ui_selected_end_date_obj = actual_system_today
-        append_log_local(f"Invalid end_date format, defaulting to system today: {ui_selected_end_date_obj.strftime('%Y-%m-%d')}", "WARNING")
+        append_log_local("Invalid end_date format, defaulting to system today: %s", "WARNING", ui_selected_end_date_obj)
     
     lookback_days = int(form_data.get('sector_lookback', 7))
     max_articles_llm_sector = int(form_data.get('sector_max_articles', 5))
+    request_priority = get_request_priority(form_data)
+    request_deadline = deadline_from_request(request.headers, form_data, request.environ)
     custom_prompt_from_ui = form_data.get('sector_custom_prompt', '')
 
     api_query_end_date_obj = min(ui_selected_end_date_obj, actual_system_today)
     api_query_start_date_obj = api_query_end_date_obj - timedelta(days=lookback_days - 1)
     llm_context_date_range_str = f"{(ui_selected_end_date_obj - timedelta(days=lookback_days - 1)).strftime('%Y-%m-%d')} to {ui_selected_end_date_obj.strftime('%Y-%m-%d')}"
-    append_log_local(f"LLM Context Range: {llm_context_date_range_str}", "INFO")
-    append_log_local(f"NewsAPI Query Range: {api_query_start_date_obj.strftime('%Y-%m-%d')} to {api_query_end_date_obj.strftime('%Y-%m-%d')}", "INFO")
+    append_log_local("LLM Context Range: %s", "INFO", llm_context_date_range_str)
+    append_log_local("NewsAPI Query Range: %s to %s", "INFO", api_query_start_date_obj, api_query_end_date_obj)
 
     na_client = get_or_create_newsapi_client_global(current_api_keys['newsapi'], append_log_local)
     if not na_client:
-        return jsonify({'error': True, 'messages': ["Failed to initialize NewsAPI client."], 'logs': ui_log_messages_for_this_request, 'results': []}), 500
+        return jsonify({'error': True, 'messages': ["Failed to initialize NewsAPI client."], 'logs': append_log_local.entries(), 'results': []}), 500
 
     newsapi_earliest_allowed = actual_system_today - timedelta(days=29)
     api_query_start_date_obj_constrained = max(api_query_start_date_obj, newsapi_earliest_allowed)
@@ -155,26 +270,29 @@ def perform_sector_analysis_route_only(): # Renamed for clarity
         # ... (error handling for date range) ...
         date_error_msg = "NewsAPI query date range invalid after constraints."
         append_log_local(date_error_msg, "ERROR")
-        return jsonify({'error': True, 'messages': [date_error_msg], 'logs': ui_log_messages_for_this_request, 'results': []}), 400
+        return jsonify({'error': True, 'messages': [date_error_msg], 'logs': append_log_local.entries(), 'results': []}), 400
 
     for sector_name_from_form in selected_sectors:
-        append_log_local(f"--- Processing SECTOR: {sector_name_from_form} ---", "INFO")
         sector_full_config = gemini_utils.NIFTY_SECTORS_QUERY_CONFIG.get(sector_name_from_form, {})
+        if request_deadline.expired():
+            # Remaining sectors are not started; finished ones are still returned below
+            append_log_local("Skipping sector %s: %s.", "WARNING", sector_name_from_form, request_deadline.reason)
+            results_payload.append(_timed_out_sector_result(sector_name_from_form, sector_full_config, llm_context_date_range_str))
+            continue
+        append_log_local("--- Processing SECTOR: %s ---", "INFO", sector_name_from_form)
         sector_news_api_keywords = sector_full_config.get("newsapi_keywords", [sector_name_from_form])
         
         # --- Sector News Fetching and Analysis (as before) ---
-        fetched_sector_articles_data, sector_news_fetch_error = newsapi_helpers.fetch_sector_news_newsapi(
+        fetched_sector_articles_data, sector_news_fetch_error, sector_fetch_meta = newsapi_helpers.fetch_sector_news_newsapi(
             na_client, sector_name_from_form, sector_news_api_keywords, gemini_utils.NEWSAPI_INDIA_MARKET_KEYWORDS,
-            api_query_start_date_obj_constrained, api_query_end_date_obj, max_articles_llm_sector, append_log_local
+            api_query_start_date_obj_constrained, api_query_end_date_obj, max_articles_llm_sector, append_log_local,
+            priority=request_priority, deadline=request_deadline
         )
         # ... (VADER and Gemini analysis for sector as before) ...
         sector_gemini_analysis = None; current_sector_error_message = sector_news_fetch_error
-        sector_article_contents_for_llm = []; sector_vader_scores = []
-        if fetched_sector_articles_data:
-            for art in fetched_sector_articles_data:
-                if art.get('content'): sector_article_contents_for_llm.append(art['content'])
-                if 'vader_score' in art: sector_vader_scores.append(art['vader_score'])
-        avg_vader_score_sector = sentiment_analyzer.get_average_vader_score(sector_vader_scores)
+        # Article objects go straight to VADER averaging and the prompt builder, no per-field copies
+        sector_article_contents_for_llm = fetched_sector_articles_data or []
+        avg_vader_score_sector = sentiment_analyzer.get_average_vader_score([art.vader_score for art in sector_article_contents_for_llm])
         vader_label_sector = sentiment_analyzer.get_sentiment_label_from_score(avg_vader_score_sector)
 
         if not sector_article_contents_for_llm and not sector_news_fetch_error:
@@ -183,7 +301,8 @@ def perform_sector_analysis_route_only(): # Renamed for clarity
         if sector_article_contents_for_llm:
             sector_gemini_analysis, gemini_err = gemini_utils.analyze_news_with_gemini(
                 current_api_keys['gemini'], sector_article_contents_for_llm, sector_name_from_form,
-                llm_context_date_range_str, custom_prompt_from_ui, append_log_local, target_type="sector"
+                llm_context_date_range_str, custom_prompt_from_ui, append_log_local, target_type="sector",
+                deadline=request_deadline
             )
             if gemini_err: current_sector_error_message = gemini_err
 
@@ -191,23 +310,26 @@ def perform_sector_analysis_route_only(): # Renamed for clarity
             'sector_name': sector_name_from_form,
             'llm_context_date_range': llm_context_date_range_str,
             'num_articles_for_llm_sector': len(sector_article_contents_for_llm),
+            'newsapi_pages_used_sector': sector_fetch_meta['pages_used'],
             'gemini_analysis_sector': sector_gemini_analysis,
             'error_message_sector': current_sector_error_message,
             'avg_vader_score_sector': avg_vader_score_sector,
             'vader_sentiment_label_sector': vader_label_sector,
-            'constituent_stocks': list(sector_full_config.get("stocks", {}).keys()) # Send stock names for UI dropdown
+            'constituent_stocks': list(sector_full_config.get("stocks", {}).keys()), # Send stock names for UI dropdown
+            'timed_out': _target_timed_out(request_deadline, sector_gemini_analysis, sector_article_contents_for_llm, sector_fetch_meta)
         })
         
     append_log_local("--- Sector-only analysis finished. ---", "INFO")
-    return jsonify({'error': False, 'messages': ["Sector analysis complete."], 'results': results_payload, 'logs': ui_log_messages_for_this_request})
+    return jsonify({'error': False, 'messages': [_completion_message("Sector analysis", results_payload)], 'results': results_payload,
+                    'newsapi_quota_remaining': get_newsapi_quota_remaining(current_api_keys['newsapi']), 'logs': append_log_local.entries()})
 
 @app.route('/api/stock-analysis', methods=['POST'])
+@profiled_route("stock")
 def perform_stock_analysis_route():
     form_data = request.json # Expects: sector_name, selected_stocks_list, end_date, lookback_days, stock_max_articles, custom_prompt
-    logger.info(f"REQUEST DATA: /api/stock-analysis: {json.dumps(form_data, indent=2)}")
+    log_request_data("/api/stock-analysis", form_data)
 
-    ui_log_messages_for_this_request = []
-    append_log_local = setup_local_logger(ui_log_messages_for_this_request)
+    append_log_local = setup_local_logger()
 
     stock_analysis_results = []
     user_facing_errors = []
@@ -223,7 +345,7 @@ def perform_stock_analysis_route():
     if not current_api_keys['newsapi'] or current_api_keys['newsapi'] == "YOUR_NEWSAPI_ORG_API_KEY_HERE":
         user_facing_errors.append("NewsAPI.org API key is not configured.")
     if user_facing_errors:
-        return jsonify({'error': True, 'messages': user_facing_errors, 'logs': ui_log_messages_for_this_request, 'results': []}), 400
+        return jsonify({'error': True, 'messages': user_facing_errors, 'logs': append_log_local.entries(), 'results': []}), 400
     
     # --- Date and Parameter Setup (mirrors sector analysis, but uses params from this request) ---
     actual_system_today = datetime.now().date() # Recalculate for this endpoint's context
@@ -235,52 +357,56 @@ def perform_stock_analysis_route():
     
     lookback_days = int(form_data.get('lookback_days', 7))
     max_articles_llm_stock = int(form_data.get('stock_max_articles', 3))
+    request_priority = get_request_priority(form_data)
+    request_deadline = deadline_from_request(request.headers, form_data, request.environ)
     custom_prompt_from_ui = form_data.get('custom_prompt', '')
     
     api_query_end_date_obj = min(ui_selected_end_date_obj, actual_system_today)
     api_query_start_date_obj = api_query_end_date_obj - timedelta(days=lookback_days - 1)
     llm_context_date_range_str = f"{(ui_selected_end_date_obj - timedelta(days=lookback_days - 1)).strftime('%Y-%m-%d')} to {ui_selected_end_date_obj.strftime('%Y-%m-%d')}"
-    append_log_local(f"Stock Analysis - LLM Context: {llm_context_date_range_str}, NewsAPI Query: {api_query_start_date_obj.strftime('%Y-%m-%d')} to {api_query_end_date_obj.strftime('%Y-%m-%d')}", "INFO")
+    append_log_local("Stock Analysis - LLM Context: %s, NewsAPI Query: %s to %s", "INFO", llm_context_date_range_str, api_query_start_date_obj, api_query_end_date_obj)
 
     na_client = get_or_create_newsapi_client_global(current_api_keys['newsapi'], append_log_local)
     if not na_client:
-        return jsonify({'error': True, 'messages': ["Failed to initialize NewsAPI client for stock analysis."], 'logs': ui_log_messages_for_this_request, 'results': []}), 500
+        return jsonify({'error': True, 'messages': ["Failed to initialize NewsAPI client for stock analysis."], 'logs': append_log_local.entries(), 'results': []}), 500
     
     newsapi_earliest_allowed = actual_system_today - timedelta(days=29)
     api_query_start_date_obj_constrained = max(api_query_start_date_obj, newsapi_earliest_allowed)
     if api_query_start_date_obj_constrained > api_query_end_date_obj:
         date_error_msg = "NewsAPI query date range invalid for stocks after constraints."
         append_log_local(date_error_msg, "ERROR")
-        return jsonify({'error': True, 'messages': [date_error_msg], 'logs': ui_log_messages_for_this_request, 'results': []}), 400
+        return jsonify({'error': True, 'messages': [date_error_msg], 'logs': append_log_local.entries(), 'results': []}), 400
 
     sector_full_config = gemini_utils.NIFTY_SECTORS_QUERY_CONFIG.get(sector_name, {})
     stocks_master_list_for_sector = sector_full_config.get("stocks", {})
 
+    # One packed NewsAPI query covers several stocks; results are split back per stock locally.
+    stock_keywords_map = {
+        stock_name: stocks_master_list_for_sector.get(stock_name, [stock_name]) # Fallback to stock name
+        for stock_name in selected_stocks if stock_name in stocks_master_list_for_sector
+    }
+    packed_stock_fetch_results, newsapi_queries_used = newsapi_helpers.fetch_stocks_news_newsapi_packed(
+        na_client, stock_keywords_map, gemini_utils.NEWSAPI_INDIA_MARKET_KEYWORDS,
+        api_query_start_date_obj_constrained, api_query_end_date_obj, max_articles_llm_stock, append_log_local,
+        priority=request_priority, deadline=request_deadline
+    )
+
     for stock_name in selected_stocks:
         if stock_name not in stocks_master_list_for_sector:
-            append_log_local(f"Stock '{stock_name}' not found in configuration for sector '{sector_name}'. Skipping.", "WARNING")
+            append_log_local("Stock '%s' not found in configuration for sector '%s'. Skipping.", "WARNING", stock_name, sector_name)
             stock_analysis_results.append({
                 'stock_name': stock_name, 'error_message_stock': 'Stock not configured for this sector.'
             })
             continue
 
-        append_log_local(f"--- Processing Stock: {stock_name} (Sector: {sector_name}) ---", "INFO")
-        stock_specific_news_keywords = stocks_master_list_for_sector.get(stock_name, [stock_name]) # Fallback to stock name
+        append_log_local("--- Processing Stock: %s (Sector: %s) ---", "INFO", stock_name, sector_name)
         
-        # --- Stock News Fetching and Analysis ---
-        fetched_stock_articles_data, stock_news_fetch_error = newsapi_helpers.fetch_stock_news_newsapi(
-            na_client, stock_name, stock_specific_news_keywords, gemini_utils.NEWSAPI_INDIA_MARKET_KEYWORDS,
-            api_query_start_date_obj_constrained, api_query_end_date_obj, max_articles_llm_stock, append_log_local
-        )
+        # --- Stock News (from the packed fetch above) and Analysis ---
+        fetched_stock_articles_data, stock_news_fetch_error, stock_fetch_meta = packed_stock_fetch_results[stock_name]
         # ... (VADER and Gemini analysis for stock as in previous combined function) ...
         stock_gemini_analysis = None; current_stock_error_message = stock_news_fetch_error
-        stock_article_contents_for_llm = []; stock_vader_scores = []
-
-        if fetched_stock_articles_data:
-            for art in fetched_stock_articles_data:
-                if art.get('content'): stock_article_contents_for_llm.append(art['content'])
-                if 'vader_score' in art: stock_vader_scores.append(art['vader_score'])
-        avg_vader_score_stock = sentiment_analyzer.get_average_vader_score(stock_vader_scores)
+        stock_article_contents_for_llm = fetched_stock_articles_data or []
+        avg_vader_score_stock = sentiment_analyzer.get_average_vader_score([art.vader_score for art in stock_article_contents_for_llm])
         vader_label_stock = sentiment_analyzer.get_sentiment_label_from_score(avg_vader_score_stock)
 
         if not stock_article_contents_for_llm and not stock_news_fetch_error : # If no articles and no explicit fetch error
@@ -289,27 +415,347 @@ def perform_stock_analysis_route():
         if stock_article_contents_for_llm:
             stock_gemini_analysis, gemini_err_stock = gemini_utils.analyze_news_with_gemini(
                 current_api_keys['gemini'], stock_article_contents_for_llm, stock_name,
-                llm_context_date_range_str, custom_prompt_from_ui, append_log_local, target_type="stock"
+                llm_context_date_range_str, custom_prompt_from_ui, append_log_local, target_type="stock",
+                deadline=request_deadline
             )
             if gemini_err_stock: current_stock_error_message = gemini_err_stock
         
         stock_analysis_results.append({
             'stock_name': stock_name,
             'num_articles_for_llm_stock': len(stock_article_contents_for_llm),
+            'newsapi_pages_used_stock': stock_fetch_meta['pages_used'],
             'gemini_analysis_stock': stock_gemini_analysis,
             'error_message_stock': current_stock_error_message,
             'avg_vader_score_stock': avg_vader_score_stock,
-            'vader_sentiment_label_stock': vader_label_stock
+            'vader_sentiment_label_stock': vader_label_stock,
+            'timed_out': _target_timed_out(request_deadline, stock_gemini_analysis, stock_article_contents_for_llm, stock_fetch_meta)
         })
 
-    append_log_local(f"--- Individual stock analysis for sector '{sector_name}' finished. ---", "INFO")
-    return jsonify({'error': False, 'messages': [f"Stock analysis for {sector_name} complete."], 
+    append_log_local("--- Individual stock analysis for sector '%s' finished. ---", "INFO", sector_name)
+    return jsonify({'error': False, 'messages': [_completion_message(f"Stock analysis for {sector_name}", stock_analysis_results)], 
                     'results_stocks': stock_analysis_results, # Send only stock results for this call
                     'sector_name': sector_name, # Include sector name for context on frontend
-                    'logs': ui_log_messages_for_this_request})
+                    'newsapi_queries_used': newsapi_queries_used,
+                    'newsapi_quota_remaining': get_newsapi_quota_remaining(current_api_keys['newsapi']),
+                    'logs': append_log_local.entries()})
+
+
+def _resolve_query_window(end_date_str, lookback_days, append_log_local):
+    """
+    Same date handling as the sector/stock routes: returns (llm_context_date_range_str,
+    api_query_start_date_obj_constrained, api_query_end_date_obj, error_message).
+    """
+    actual_system_today = datetime.now().date()
+    try:
+        ui_selected_end_date_obj = datetime.strptime(end_date_str or actual_system_today.strftime('%Y-%m-%d'), '%Y-%m-%d').date()
+    except ValueError:
+        ui_selected_end_date_obj = actual_system_today
+        append_log_local("Invalid end_date format, defaulting to system today: %s", "WARNING", ui_selected_end_date_obj)
+    api_query_end_date_obj = min(ui_selected_end_date_obj, actual_system_today)
+    api_query_start_date_obj = api_query_end_date_obj - timedelta(days=lookback_days - 1)
+    llm_context_date_range_str = f"{(ui_selected_end_date_obj - timedelta(days=lookback_days - 1)).strftime('%Y-%m-%d')} to {ui_selected_end_date_obj.strftime('%Y-%m-%d')}"
+    newsapi_earliest_allowed = actual_system_today - timedelta(days=29)
+    api_query_start_date_obj_constrained = max(api_query_start_date_obj, newsapi_earliest_allowed)
+    if api_query_start_date_obj_constrained > api_query_end_date_obj:
+        return llm_context_date_range_str, None, None, "NewsAPI query date range invalid after constraints."
+    return llm_context_date_range_str, api_query_start_date_obj_constrained, api_query_end_date_obj, None
+
+
+@app.route('/api/llm-metrics', methods=['GET'])
+def llm_metrics_route():
+    return jsonify({'gemini_concurrency': llm_concurrency.gemini_limiters.metrics(),
+                    'hedging': dict(llm_hedging.hedge_stats),
+                    'prompt_cache': dict(prompt_cache.prompt_cache_stats),
+                    'article_scores': article_scores.article_score_cache.snapshot()})
+
+
+def _prepare_batch_request(form_data, append_log_local):
+    """
+    Validates a batch/stream request body. Returns (batch_kwargs, skipped_results, None) on success,
+    or (None, None, (error_payload, status_code)).
+    """
+    user_facing_errors = []
+    current_api_keys = get_api_keys_from_session_or_config()
+
+    sectors_config = gemini_utils.NIFTY_SECTORS_QUERY_CONFIG
+    sector_targets = []; stock_targets = []; skipped_results = []
+    targets = form_data.get('targets')
+    if not targets or not isinstance(targets, list):
+        user_facing_errors.append("Please provide at least one sector or stock target.")
+        targets = []
+    for target in targets:
+        if not isinstance(target, dict): target = {}
+        target_type = target.get('type'); target_name = target.get('name')
+        if target_type == 'sector' and target_name in sectors_config:
+            if target_name not in sector_targets: sector_targets.append(target_name)
+        elif target_type == 'stock' and target_name in sectors_config.get(target.get('sector'), {}).get('stocks', {}):
+            if (target['sector'], target_name) not in stock_targets: stock_targets.append((target['sector'], target_name))
+        else:
+            append_log_local("Target %s not found in configuration. Skipping.", "WARNING", target)
+            skipped_results.append({'target_type': target_type, 'target_name': target_name, 'error_message': 'Target not configured.'})
+    if targets and not sector_targets and not stock_targets:
+        user_facing_errors.append("None of the requested targets are configured.")
+    if not current_api_keys['gemini'] or current_api_keys['gemini'] == "YOUR_GEMINI_API_KEY_HERE":
+        user_facing_errors.append("Gemini API key is not configured.")
+    if not current_api_keys['newsapi'] or current_api_keys['newsapi'] == "YOUR_NEWSAPI_ORG_API_KEY_HERE":
+        user_facing_errors.append("NewsAPI.org API key is not configured.")
+    if user_facing_errors:
+        return None, None, ({'error': True, 'messages': user_facing_errors, 'logs': append_log_local.entries(), 'results': []}, 400)
+
+    lookback_days = int(form_data.get('lookback_days', 7))
+    llm_context_date_range_str, api_query_start_date_obj_constrained, api_query_end_date_obj, date_error_msg = _resolve_query_window(
+        form_data.get('end_date'), lookback_days, append_log_local
+    )
+    if date_error_msg:
+        append_log_local(date_error_msg, "ERROR")
+        return None, None, ({'error': True, 'messages': [date_error_msg], 'logs': append_log_local.entries(), 'results': []}, 400)
+    append_log_local("Batch Analysis - LLM Context: %s, NewsAPI Query: %s to %s", "INFO",
+                     llm_context_date_range_str, api_query_start_date_obj_constrained, api_query_end_date_obj)
+
+    na_client = get_or_create_newsapi_client_global(current_api_keys['newsapi'], append_log_local)
+    if not na_client:
+        return None, None, ({'error': True, 'messages': ["Failed to initialize NewsAPI client."], 'logs': append_log_local.entries(), 'results': []}, 500)
+
+    batch_kwargs = dict(
+        na_client=na_client, gemini_api_key=current_api_keys['gemini'],
+        sector_targets=sector_targets, stock_targets=stock_targets,
+        from_date_obj=api_query_start_date_obj_constrained, to_date_obj=api_query_end_date_obj,
+        llm_context_date_range_str=llm_context_date_range_str,
+        max_articles_sector=int(form_data.get('sector_max_articles', 5)), max_articles_stock=int(form_data.get('stock_max_articles', 3)),
+        custom_prompt=form_data.get('custom_prompt', ''), append_log_func=append_log_local,
+        priority=get_request_priority(form_data), deadline=deadline_from_request(request.headers, form_data, request.environ)
+    )
+    return batch_kwargs, skipped_results, None
+
+
+@app.route('/api/analysis/batch', methods=['POST'])
+@profiled_route("batch")
+def perform_batch_analysis_route():
+    # Expects: targets=[{"type": "sector", "name": ...} | {"type": "stock", "sector": ..., "name": ...}],
+    # end_date, lookback_days, sector_max_articles, stock_max_articles, custom_prompt
+    form_data = request.json or {}
+    log_request_data("/api/analysis/batch", form_data)
+    append_log_local = setup_local_logger()
+    batch_kwargs, skipped_results, error_response = _prepare_batch_request(form_data, append_log_local)
+    if error_response:
+        return jsonify(error_response[0]), error_response[1]
+
+    results_payload = batch_analysis.run_batch_analysis(**batch_kwargs)
+    append_log_local("--- Batch analysis finished. ---", "INFO")
+    return jsonify({'error': False, 'messages': [_completion_message("Batch analysis", results_payload)],
+                    'results': results_payload + skipped_results,
+                    'newsapi_quota_remaining': get_newsapi_quota_remaining(newsapi_quota.client_api_key(batch_kwargs['na_client'])),
+                    'logs': append_log_local.entries()})
+
+
+def _sse_event(event, data, event_id=None):
+    id_line = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{id_line}event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/api/analysis/stream', methods=['POST'])
+def perform_streaming_analysis_route():
+    # Same body as /api/analysis/batch. Responds with Server-Sent Events:
+    # "field" {target_type, target_name, key, value} as each LLM field completes, then one "result"
+    # event carrying the same payload the batch endpoint returns.
+    form_data = request.json or {}
+    log_request_data("/api/analysis/stream", form_data)
+    append_log_local = setup_local_logger()
+    batch_kwargs, skipped_results, error_response = _prepare_batch_request(form_data, append_log_local)
+    if error_response:
+        return jsonify(error_response[0]), error_response[1]
+
+    events = queue.Queue()
+
+    def _on_field(target_type, target_name, key, value):
+        events.put(('field', {'target_type': target_type, 'target_name': target_name, 'key': key, 'value': value}))
+
+    def _run():
+        try:
+            results_payload = batch_analysis.run_batch_analysis(on_field=_on_field, **batch_kwargs)
+            append_log_local("--- Streaming analysis finished. ---", "INFO")
+            payload = {'error': False, 'messages': [_completion_message("Batch analysis", results_payload)], 'results': results_payload + skipped_results}
+        except Exception as e:
+            logger.exception("Streaming analysis failed")
+            payload = {'error': True, 'messages': [f"Streaming analysis failed: {str(e)[:100]}"], 'results': skipped_results}
+        payload['newsapi_quota_remaining'] = get_newsapi_quota_remaining(newsapi_quota.client_api_key(batch_kwargs['na_client']))
+        payload['logs'] = append_log_local.entries()
+        events.put(('result', payload))
+
+    threading.Thread(target=_run, name="analysis-stream", daemon=True).start()
+
+    def _generate():
+        try:
+            while True:
+                event, data = events.get()
+                yield _sse_event(event, data)
+                if event == 'result':
+                    return
+        except GeneratorExit:
+            # The server closes the generator when the client goes away; stop the remaining work
+            batch_kwargs['deadline'].cancel("client disconnected")
+            raise
+
+    return Response(_generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/watchlist', methods=['GET'])
+def watchlist_route():
+    return jsonify(watchlist_monitor.snapshot())
+
+
+@app.route('/api/watchlist/poll', methods=['POST'])
+def watchlist_poll_route():
+    append_log_local = setup_local_logger()
+    current_api_keys = get_api_keys_from_session_or_config()
+    na_client = get_or_create_newsapi_client_global(current_api_keys['newsapi'], append_log_local)
+    if not na_client:
+        return jsonify({'error': True, 'messages': ["Failed to initialize NewsAPI client."], 'logs': append_log_local.entries()}), 500
+    summary = watchlist_monitor.poll(na_client, current_api_keys['gemini'], append_log_local)
+    return jsonify({'error': False, **summary, 'newsapi_quota_remaining': get_newsapi_quota_remaining(current_api_keys['newsapi']),
+                    'logs': append_log_local.entries()})
+
+
+@app.route('/api/watchlist/events', methods=['GET'])
+def watchlist_events_route():
+    """
+    Server-Sent Events feed of watchlist changes. Reconnecting clients resume after the
+    Last-Event-ID header (or ?since=<id>); without either, only new events are sent.
+    """
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_id = int(last_id) if last_id not in (None, "") else None
+    except ValueError:
+        last_id = None
+    if last_id is None:
+        existing = watchlist_feed.since(0)
+        last_id = existing[-1]['id'] if existing else 0
+
+    def _generate():
+        cursor = last_id
+        while True:
+            events = watchlist_feed.wait_for(cursor, timeout=15.0)
+            if not events:
+                yield ": keep-alive\n\n" # Lets the server notice clients that went away
+                continue
+            for event in events:
+                cursor = event['id']
+                yield _sse_event(event['type'], event, event['id'])
+
+    return Response(_generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/export/<dataset>', methods=['GET'])
+def export_route(dataset):
+    """
+    One chunk of a stored dataset (analyses, daily, articles) as a compressed NumPy .npz, one array
+    per column. Query args: from/to (YYYY-MM-DD, inclusive), rows (chunk size), cursor. Fetch the
+    next chunk with ?cursor=<X-Next-Cursor>; the header is absent on the last chunk.
+    """
+    from_day, to_day = request.args.get('from'), request.args.get('to')
+    try:
+        for day in (from_day, to_day):
+            if day: datetime.strptime(day, '%Y-%m-%d')
+        data, next_cursor, row_count = columnar_export.export_chunk(
+            article_store.get_store(), dataset, from_day, to_day, request.args.get('cursor'),
+            request.args.get('rows', columnar_export.EXPORT_CHUNK_ROWS)
+        )
+    except ValueError as e:
+        return jsonify({'error': True, 'messages': [str(e)]}), 400
+    headers = {'X-Row-Count': str(row_count), 'Content-Disposition': f'attachment; filename="{dataset}.npz"'}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+    return Response(data, mimetype='application/octet-stream', headers=headers)
+
+
+sentiment_analytics_engine = sentiment_analytics.SentimentAnalytics(article_store.get_store(), gemini_utils.NIFTY_SECTORS_QUERY_CONFIG)
+
+
+@app.route('/api/analytics/sectors', methods=['GET'])
+def sector_analytics_route():
+    """
+    Cross-sector correlations, lead-lag and constituent dispersion from the stored daily series
+    (no upstream calls). Query args: metric (vader|llm), window, max_lag, min_periods, days.
+    """
+    try:
+        metric = request.args.get('metric', 'vader')
+        if metric not in sentiment_analytics.METRICS:
+            raise ValueError(f"metric must be one of {', '.join(sentiment_analytics.METRICS)}")
+        window = int(request.args.get('window', sentiment_analytics.ROLLING_WINDOW_DAYS))
+        max_lag = int(request.args.get('max_lag', sentiment_analytics.MAX_LAG_DAYS))
+        min_periods = int(request.args.get('min_periods', sentiment_analytics.MIN_OVERLAP_DAYS))
+        max_days = int(request.args.get('days', sentiment_analytics.ANALYTICS_MAX_DAYS))
+        if not (2 <= window <= 90 and 0 <= max_lag <= 30 and 2 <= min_periods <= 90 and window <= max_days <= 730):
+            raise ValueError("Expected 2 <= window <= 90, 0 <= max_lag <= 30, 2 <= min_periods <= 90 and window <= days <= 730.")
+    except ValueError as e:
+        return jsonify({'error': True, 'messages': [str(e)]}), 400
+    return jsonify({'error': False, **sentiment_analytics_engine.report(metric, window, max_lag, min_periods, max_days)})
+
+
+news_search_index = news_search.NewsSearchIndex(article_store.get_store(), gemini_utils.NIFTY_SECTORS_QUERY_CONFIG)
+
+
+def _search_args(source):
+    # Shared by the search and search-analysis routes; raises ValueError for bad input
+    query = (source.get('q') or source.get('query') or "").strip()
+    from_day, to_day = source.get('from'), source.get('to')
+    for day in (from_day, to_day):
+        if day: datetime.strptime(day, '%Y-%m-%d')
+    limit = int(source.get('limit', news_search.SEARCH_DEFAULT_LIMIT))
+    if not 1 <= limit <= news_search.SEARCH_MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {news_search.SEARCH_MAX_LIMIT}.")
+    return query, from_day, to_day, limit
+
+
+@app.route('/api/search', methods=['GET'])
+def search_route():
+    """
+    Full-text search over the stored articles (no NewsAPI calls). Query args: q, from/to
+    (YYYY-MM-DD, inclusive), limit, offset. q supports AND (default), OR, NOT or -term,
+    "quoted phrases", parentheses and stock:<name or alias>; stock names match their aliases.
+    """
+    try:
+        query, from_day, to_day, limit = _search_args(request.args)
+        offset = max(0, int(request.args.get('offset', 0)))
+        result = news_search_index.search(query, from_day, to_day, limit, offset)
+    except ValueError as e:
+        return jsonify({'error': True, 'messages': [str(e)]}), 400
+    return jsonify({'error': False, **result})
+
+
+@app.route('/api/search/analyze', methods=['POST'])
+def search_analysis_route():
+    # Expects: q, from, to, limit (articles sent to Gemini), target_name (defaults to q), custom_prompt
+    form_data = request.json or {}
+    append_log_local = setup_local_logger()
+    try:
+        query, from_day, to_day, limit = _search_args(form_data)
+        search_result = news_search_index.search(query, from_day, to_day, limit, snippets=False)
+    except ValueError as e:
+        return jsonify({'error': True, 'messages': [str(e)]}), 400
+    articles = article_store.get_store().articles_by_hash(hit['content_hash'] for hit in search_result['results'])
+    target_name = form_data.get('target_name') or query
+    avg_vader_score = sentiment_analyzer.get_average_vader_score([art.vader_score for art in articles])
+    analysis, error_message = None, None
+    if not articles:
+        error_message = f"No stored articles match '{query}'."
+    else:
+        days = sorted(art.date for art in articles)
+        analysis, error_message = gemini_utils.analyze_news_with_gemini(
+            get_api_keys_from_session_or_config()['gemini'], articles, target_name, f"{days[0]} to {days[-1]}",
+            form_data.get('custom_prompt', ''), append_log_local, target_type="custom search topic",
+            deadline=deadline_from_request(request.headers, form_data, request.environ)
+        )
+    return jsonify({'error': bool(error_message) and not analysis, 'messages': [error_message] if error_message else [],
+                    'target_name': target_name, 'query': query, 'total_matches': search_result['total'],
+                    'num_articles_for_llm': len(articles), 'avg_vader_score': avg_vader_score,
+                    'vader_sentiment_label': sentiment_analyzer.get_sentiment_label_from_score(avg_vader_score),
+                    'gemini_analysis': analysis, 'articles': [{k: hit[k] for k in ('content_hash', 'day', 'source', 'uri', 'score')}
+                                                              for hit in search_result['results']],
+                    'logs': append_log_local.entries()})
 
 
 if __name__ == '__main__':
-    logger.info(f"Sentiment Analysis Dashboard (Flask) starting...")
+    logger.info("Sentiment Analysis Dashboard (Flask) starting...")
     port = int(os.environ.get("PORT", 5003)) 
-    app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=port)
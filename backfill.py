@@ -0,0 +1,71 @@
+# backfill.py
+"""
+Backfills the article store with everything NewsAPI still serves for the configured sectors and
+stocks (the last ~29 days). Progress is checkpointed per query window in the store itself, so
+the command can be stopped at any time and re-run with the same --run name to resume.
+
+    python backfill.py                      # ingest until done or today's background budget is spent
+    python backfill.py --wait               # keep going across days, sleeping until the quota resets
+    python backfill.py --status             # show progress and the estimated days left
+    python backfill.py --sectors Banking    # on resume, only work through Banking's part of the saved plan
+"""
+import argparse
+import json
+import logging
+import sys
+
+from utils import gemini_utils, newsapi_helpers, newsapi_quota, log_utils, article_store, text_corpus
+from utils.backfill import BackfillRun, plan_backfill_queries, VADER_WORKERS
+from utils.rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+import config
+
+logger = logging.getLogger("backfill")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumable NewsAPI backfill into the article store.")
+    parser.add_argument("--run", default="default", help="Checkpoint name; re-use it to resume (default: %(default)s)")
+    parser.add_argument("--sectors", nargs="*", help="Limit the backfill to these sectors (and their stocks); on resume, narrows the saved plan")
+    parser.add_argument("--max-calls", type=int, default=None, help="Stop after this many NewsAPI calls")
+    parser.add_argument("--interactive-budget", action="store_true",
+                        help="Spend the full daily budget instead of leaving the interactive reserve untouched")
+    parser.add_argument("--vader-workers", type=int, default=VADER_WORKERS, help="Processes scoring articles (default: %(default)s)")
+    parser.add_argument("--wait", action="store_true", help="Sleep until the quota resets instead of exiting")
+    parser.add_argument("--status", action="store_true", help="Print progress and exit")
+    args = parser.parse_args(argv)
+
+    log_utils.configure_logging(config.LOG_LEVEL)
+    newsapi_quota.configure_ledger(config.NEWSAPI_QUOTA_LEDGER_PATH, config.NEWSAPI_DAILY_REQUEST_LIMIT)
+    text_corpus.configure_corpus(config.TEXT_CORPUS_DIR)
+    store = article_store.configure_store(config.ARTICLE_STORE_PATH)
+
+    newsapi_client, err = newsapi_helpers.get_newsapi_org_client(config.NEWSAPI_ORG_API_KEY)
+    if not newsapi_client:
+        print(f"NewsAPI client unavailable: {err}", file=sys.stderr)
+        return 1
+
+    priority = PRIORITY_INTERACTIVE if args.interactive_budget else PRIORITY_BACKGROUND
+    run = BackfillRun(store, newsapi_client, gemini_utils.NIFTY_SECTORS_QUERY_CONFIG, args.run, priority, sector_names=args.sectors)
+    if not args.status:
+        queued = run.initialize(plan_backfill_queries(
+            gemini_utils.NIFTY_SECTORS_QUERY_CONFIG, gemini_utils.NEWSAPI_INDIA_MARKET_KEYWORDS, args.sectors
+        ))
+        if queued:
+            logger.info("Started backfill run '%s' with %d queries.", args.run, queued)
+        elif args.sectors:
+            # Resuming: --sectors narrows the saved plan, it cannot add to it
+            unplanned = sorted(set(args.sectors) - run.planned_sectors())
+            if unplanned:
+                print(f"Backfill run '{args.run}' was planned without sector(s) {', '.join(unplanned)}; "
+                      f"start a new --run for them.", file=sys.stderr)
+                return 2
+            logger.info("Resuming backfill run '%s' for sector(s): %s.", args.run, ", ".join(args.sectors))
+        summary = run.run(max_calls=args.max_calls, vader_workers=args.vader_workers, wait_for_quota=args.wait)
+    else:
+        summary = run.status()
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,46 @@
+# export.py
+"""
+Exports stored analyses, daily per-target aggregates and article-level VADER scores from the
+article store as chunked, compressed NumPy .npz files (one array per column, one file per chunk).
+
+    python export.py                                   # all datasets into data/exports/
+    python export.py --datasets daily --from 2024-05-01 --to 2024-05-31
+    python -c "import numpy as np; d = np.load('data/exports/daily-00000.npz'); print(d['mean_vader'])"
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+
+from utils import article_store, log_utils, text_corpus
+from utils.columnar_export import DATASETS, EXPORT_CHUNK_ROWS, export_to_directory
+import config
+
+
+def _day(value):
+    datetime.strptime(value, '%Y-%m-%d')
+    return value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Columnar (.npz) export of the article store.")
+    parser.add_argument("--datasets", nargs="*", choices=list(DATASETS), default=list(DATASETS), help="Default: all")
+    parser.add_argument("--from", dest="from_day", type=_day, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="to_day", type=_day, help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--out", default="data/exports", help="Output directory (default: %(default)s)")
+    parser.add_argument("--chunk-rows", type=int, default=EXPORT_CHUNK_ROWS, help="Rows per file (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    log_utils.configure_logging(config.LOG_LEVEL)
+    text_corpus.configure_corpus(config.TEXT_CORPUS_DIR)
+    store = article_store.configure_store(config.ARTICLE_STORE_PATH)
+    summary = {}
+    for dataset in args.datasets:
+        paths, rows = export_to_directory(store, dataset, args.out, args.from_day, args.to_day, args.chunk_rows)
+        summary[dataset] = {'rows': rows, 'files': paths}
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+# loadtest.py
+"""
+End-to-end load test: starts local NewsAPI/Gemini stand-ins and the Flask app pointed at them,
+drives /api/sector-analysis and /api/stock-analysis at increasing concurrency, and reports
+throughput, p50/p95/p99 latency and error rates per level. The report is compared with a stored
+baseline (exit code 1 on a regression).
+
+    python loadtest.py                                  # default ramp, compare with loadtest_baseline.json
+    python loadtest.py --save-baseline                  # record this run as the new baseline
+    python loadtest.py --levels 1,4,16 --duration 30 --gemini-latency 1.5 --gemini-error-rate 0.05
+
+Baselines are only comparable between runs with the same settings on the same machine.
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+from utils.fake_upstreams import FakeUpstreams, UpstreamBehaviour
+
+logger = logging.getLogger("loadtest")
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE_PATH = os.path.join(REPO_DIR, "loadtest_baseline.json")
+REQUEST_TIMEOUT_SECONDS = 300
+APP_STARTUP_TIMEOUT_SECONDS = 60
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list (None if empty)."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _load_sectors_config():
+    from utils.gemini_utils import NIFTY_SECTORS_QUERY_CONFIG
+    return {name: list(conf.get("stocks", {})) for name, conf in NIFTY_SECTORS_QUERY_CONFIG.items()}
+
+
+def build_request(rng, sectors, stock_share, vary_prompts):
+    """(endpoint, json body) for one simulated analyst action."""
+    custom_prompt = f"Focus note {rng.randint(0, 10**6)}" if vary_prompts else ""
+    if rng.random() < stock_share:
+        sector = rng.choice([name for name, stocks in sectors.items() if stocks])
+        stocks = rng.sample(sectors[sector], min(len(sectors[sector]), rng.choice([1, 2])))
+        return "stock", "/api/stock-analysis", {
+            'sector_name': sector, 'selected_stocks': stocks, 'lookback_days': rng.choice([3, 7]),
+            'stock_max_articles': 3, 'custom_prompt': custom_prompt,
+        }
+    sector = rng.choice(list(sectors))
+    return "sector", "/api/sector-analysis", {
+        'selected_sectors': [sector], 'sector_lookback': rng.choice([3, 7, 14]),
+        'sector_max_articles': 5, 'sector_custom_prompt': custom_prompt,
+    }
+
+
+def _analysis_errors(kind, payload):
+    results = payload.get('results_stocks' if kind == 'stock' else 'results') or []
+    field = 'error_message_stock' if kind == 'stock' else 'error_message_sector'
+    return sum(1 for result in results if result.get(field)), len(results)
+
+
+def run_level(app_url, concurrency, duration_seconds, sectors, args, seed):
+    """Runs `concurrency` closed-loop clients for `duration_seconds`; returns the level's samples."""
+    samples = []; samples_lock = threading.Lock()
+    stop_at = time.monotonic() + duration_seconds
+
+    def _client(client_index):
+        rng = random.Random(seed * 1000 + client_index)
+        session = requests.Session()
+        while time.monotonic() < stop_at:
+            kind, path, body = build_request(rng, sectors, args.stock_share, args.vary_prompts)
+            started = time.perf_counter()
+            sample = {'kind': kind, 'ok': False, 'analysis_errors': 0, 'analysis_targets': 0}
+            try:
+                response = session.post(app_url + path, json=body, timeout=REQUEST_TIMEOUT_SECONDS)
+                sample['status'] = response.status_code
+                if response.status_code == 200:
+                    sample['ok'] = True
+                    sample['analysis_errors'], sample['analysis_targets'] = _analysis_errors(kind, response.json())
+            except (requests.RequestException, ValueError) as e:
+                sample['status'] = type(e).__name__
+            sample['latency_ms'] = (time.perf_counter() - started) * 1000
+            with samples_lock:
+                samples.append(sample)
+
+    level_started = time.monotonic()
+    threads = [threading.Thread(target=_client, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return samples, time.monotonic() - level_started
+
+
+def summarize(samples, elapsed_seconds):
+    latencies = sorted(s['latency_ms'] for s in samples)
+    failed = sum(1 for s in samples if not s['ok'])
+    analysis_targets = sum(s['analysis_targets'] for s in samples)
+    summary = {
+        'requests': len(samples),
+        'elapsed_seconds': round(elapsed_seconds, 2),
+        'throughput_rps': round(len(samples) / elapsed_seconds, 3) if elapsed_seconds else 0.0,
+        'p50_ms': percentile(latencies, 0.50), 'p95_ms': percentile(latencies, 0.95), 'p99_ms': percentile(latencies, 0.99),
+        'error_rate': round(failed / len(samples), 4) if samples else 0.0,
+        'analysis_error_rate': round(sum(s['analysis_errors'] for s in samples) / analysis_targets, 4) if analysis_targets else 0.0,
+        'statuses': {},
+    }
+    for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+        if summary[key] is not None: summary[key] = round(summary[key], 1)
+    for s in samples:
+        summary['statuses'][str(s['status'])] = summary['statuses'].get(str(s['status']), 0) + 1
+    return summary
+
+
+def compare_with_baseline(report, baseline, latency_tolerance, throughput_tolerance, error_tolerance):
+    """List of human-readable regressions of `report` against `baseline`, level by level."""
+    regressions = []
+    baseline_levels = {level['concurrency']: level for level in baseline.get('levels', [])}
+    for level in report['levels']:
+        base = baseline_levels.get(level['concurrency'])
+        if base is None:
+            continue
+        label = f"concurrency {level['concurrency']}"
+        if base['throughput_rps'] and level['throughput_rps'] < base['throughput_rps'] * (1 - throughput_tolerance):
+            regressions.append(f"{label}: throughput {level['throughput_rps']} rps < baseline {base['throughput_rps']} rps")
+        for key in ('p95_ms', 'p99_ms'):
+            if base.get(key) and level.get(key) and level[key] > base[key] * (1 + latency_tolerance):
+                regressions.append(f"{label}: {key} {level[key]} > baseline {base[key]}")
+        for key in ('error_rate', 'analysis_error_rate'):
+            if level[key] > base.get(key, 0.0) + error_tolerance:
+                regressions.append(f"{label}: {key} {level[key]} > baseline {base.get(key, 0.0)}")
+    return regressions
+
+
+def start_app(upstreams, port, log_path, extra_env):
+    env = dict(os.environ)
+    env.update({
+        'NEWSAPI_BASE_URL': upstreams.newsapi_url,
+        'GEMINI_API_ENDPOINT': upstreams.gemini_endpoint,
+        'NEWSAPI_ORG_API_KEY': 'loadtest-newsapi-key',
+        'GEMINI_API_KEY': 'loadtest-gemini-key',
+        # A private ledger with room for the whole run, so the quota's cache-only mode does not kick in
+        'NEWSAPI_QUOTA_LEDGER_PATH': os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "quota.json"),
+        'NEWSAPI_DAILY_REQUEST_LIMIT': str(10**9),
+        'LOG_LEVEL': 'WARNING',
+    })
+    env.update(extra_env)
+    log_file = open(log_path, 'w', encoding='utf-8')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--no-reload', '--no-debugger'],
+        cwd=REPO_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT
+    )
+    app_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + APP_STARTUP_TIMEOUT_SECONDS
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited during startup (code {process.returncode}); see {log_path}")
+        try:
+            if requests.get(app_url + "/api/llm-metrics", timeout=2).status_code == 200:
+                return process, app_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"App did not become ready within {APP_STARTUP_TIMEOUT_SECONDS}s; see {log_path}")
+
+
+def _print_table(report):
+    print(f"{'conc':>5} {'reqs':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err%':>6} {'an.err%':>8}")
+    for level in report['levels']:
+        print(f"{level['concurrency']:>5} {level['requests']:>6} {level['throughput_rps']:>8} "
+              f"{level['p50_ms'] or 0:>9} {level['p95_ms'] or 0:>9} {level['p99_ms'] or 0:>9} "
+              f"{level['error_rate'] * 100:>6.1f} {level['analysis_error_rate'] * 100:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test app.py against local NewsAPI/Gemini stand-ins.")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Comma-separated concurrency levels (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds per level (default: %(default)s)")
+    parser.add_argument("--stock-share", type=float, default=0.5, help="Fraction of requests hitting /api/stock-analysis")
+    parser.add_argument("--vary-prompts", action="store_true", help="Random custom prompts, so analyses are never reused")
+    parser.add_argument("--newsapi-latency", type=float, default=0.15, help="Stand-in NewsAPI latency in seconds")
+    parser.add_argument("--newsapi-error-rate", type=float, default=0.0)
+    parser.add_argument("--gemini-latency", type=float, default=1.0, help="Stand-in Gemini latency in seconds")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--newsapi-interval", type=float, default=None,
+                        help="Override the app's NewsAPI call pacing (NEWSAPI_MIN_CALL_INTERVAL_SECONDS)")
+    parser.add_argument("--port", type=int, default=5093, help="Port for the app under test")
+    parser.add_argument("--app-url", default=None, help="Test an already running app instead; start it with NEWSAPI_BASE_URL=http://127.0.0.1:8091 "
+                             "and GEMINI_API_ENDPOINT=http://127.0.0.1:8092")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", default=None, help="Write the JSON report here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the baseline instead of comparing")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25, help="Allowed relative p95/p99 increase")
+    parser.add_argument("--throughput-tolerance", type=float, default=0.2, help="Allowed relative throughput drop")
+    parser.add_argument("--error-tolerance", type=float, default=0.02, help="Allowed absolute error-rate increase")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    upstreams = FakeUpstreams(
+        newsapi=UpstreamBehaviour(args.newsapi_latency, error_rate=args.newsapi_error_rate),
+        gemini=UpstreamBehaviour(args.gemini_latency, error_rate=args.gemini_error_rate),
+        seed=args.seed,
+    ).start(newsapi_port=0 if args.app_url is None else 8091, gemini_port=0 if args.app_url is None else 8092)
+    process = None
+    app_log = os.path.join(tempfile.gettempdir(), "loadtest-app.log")
+    try:
+        if args.app_url:
+            app_url = args.app_url.rstrip('/')
+        else:
+            extra_env = {'NEWSAPI_MIN_CALL_INTERVAL_SECONDS': str(args.newsapi_interval)} if args.newsapi_interval is not None else {}
+            process, app_url = start_app(upstreams, args.port, app_log, extra_env)
+        sectors = _load_sectors_config()
+        report = {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'settings': {key: getattr(args, key) for key in (
+                'duration', 'stock_share', 'vary_prompts', 'newsapi_latency', 'newsapi_error_rate',
+                'gemini_latency', 'gemini_error_rate', 'newsapi_interval', 'seed')},
+            'levels': [],
+        }
+        for index, concurrency in enumerate(levels):
+            before = upstreams.snapshot()
+            logger.info("Level %d/%d: %d concurrent client(s) for %.0fs", index + 1, len(levels), concurrency, args.duration)
+            samples, elapsed = run_level(app_url, concurrency, args.duration, sectors, args, args.seed + index)
+            level = {'concurrency': concurrency, **summarize(samples, elapsed)}
+            after = upstreams.snapshot()
+            level['upstream_calls'] = {key: after[key] - before[key] for key in after}
+            report['levels'].append(level)
+        try:
+            report['llm_metrics'] = requests.get(app_url + "/api/llm-metrics", timeout=5).json()
+        except (requests.RequestException, ValueError):
+            pass
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        upstreams.stop()
+
+    _print_table(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != report['settings']:
+        print("Warning: baseline was recorded with different settings; the comparison may not be meaningful.")
+    regressions = compare_with_baseline(report, baseline, args.latency_tolerance, args.throughput_tolerance, args.error_tolerance)
+    if regressions:
+        print("Regressions against the baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+    print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
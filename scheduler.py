@@ -0,0 +1,80 @@
+# scheduler.py
+"""
+Analyzes a whole universe (the built-in sectors, or e.g. Nifty 500 from a JSON file shaped like
+NIFTY_SECTORS_QUERY_CONFIG) by partitioning it into shards, each run in its own process with
+its own fetch queue, caches and share of the NewsAPI/Gemini limits. Results are merged into the
+article store (articles plus one row per target in the 'analyses' table).
+
+    python scheduler.py --shards 4                            # built-in sectors and their stocks
+    python scheduler.py --shards 8 --universe nifty500.json   # larger universe
+    python scheduler.py --sectors "Nifty IT" "Nifty Bank" --no-stocks --max-calls 10
+"""
+import argparse
+import json
+import logging
+import sys
+
+from utils import gemini_utils, newsapi_helpers, newsapi_quota, llm_concurrency, llm_hedging, analysis_reuse, prompt_cache, article_scores, log_utils, article_store, text_corpus
+from utils.sharding import run_sharded, load_universe, SHARD_LOOKBACK_DAYS, SHARD_BATCH_WORKERS
+from utils.rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+import config
+
+logger = logging.getLogger("scheduler")
+
+
+def _configure_process():
+    # Same settings the app applies at startup; runs in the coordinator and in every shard process
+    log_utils.configure_logging(config.LOG_LEVEL)
+    text_corpus.configure_corpus(config.TEXT_CORPUS_DIR)
+    newsapi_helpers.configure_newsapi(config.NEWSAPI_BASE_URL or None, config.NEWSAPI_MIN_CALL_INTERVAL_SECONDS)
+    gemini_utils.configure_gemini_endpoint(config.GEMINI_API_ENDPOINT)
+    llm_hedging.configure_hedging(config.GEMINI_HEDGING_ENABLED, config.GEMINI_HEDGE_PERCENTILE, config.GEMINI_HEDGE_MAX_EXTRA_FRACTION)
+    gemini_utils.configure_structured_output(config.GEMINI_STRUCTURED_OUTPUT)
+    prompt_cache.configure_prompt_cache(config.GEMINI_PROMPT_CACHE_BACKEND, config.GEMINI_PROMPT_CACHE_TTL_SECONDS, config.GEMINI_PROMPT_CACHE_MODEL)
+    llm_concurrency.configure_concurrency(config.GEMINI_INITIAL_CONCURRENCY, maximum=config.GEMINI_MAX_CONCURRENCY)
+    analysis_reuse.configure_reuse(config.LLM_REUSE_ENABLED, config.LLM_REUSE_MAX_ARTICLE_CHANGE, config.LLM_REUSE_MAX_AGE_SECONDS)
+    gemini_utils.configure_incremental(config.LLM_INCREMENTAL_ENABLED, config.LLM_INCREMENTAL_FULL_REBUILD_EVERY, config.LLM_INCREMENTAL_FULL_REBUILD_SECONDS)
+    gemini_utils.configure_map_reduce(config.LLM_MAP_REDUCE_ENABLED, config.LLM_MAP_REDUCE_THRESHOLD_CHARS, config.LLM_MAP_REDUCE_MAX_CHUNKS, config.LLM_MAP_REDUCE_MAX_WORKERS)
+    article_scores.configure_article_scoring(config.ARTICLE_SCORING_ENABLED, config.ARTICLE_SCORE_BATCH_SIZE, config.ARTICLE_SCORE_MAX_WORKERS)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sharded multi-process analysis of a sector/stock universe.")
+    parser.add_argument("--shards", type=int, default=config.SHARD_COUNT, help="Worker processes (default: %(default)s)")
+    parser.add_argument("--universe", help="JSON file shaped like NIFTY_SECTORS_QUERY_CONFIG (default: the built-in sectors)")
+    parser.add_argument("--sectors", nargs="*", help="Limit the run to these sectors")
+    parser.add_argument("--no-stocks", action="store_true", help="Analyze sectors only")
+    parser.add_argument("--lookback", type=int, default=SHARD_LOOKBACK_DAYS, help="Days of news (1-29, default: %(default)s)")
+    parser.add_argument("--max-calls", type=int, default=None, help="Cap on NewsAPI calls across all shards")
+    parser.add_argument("--interactive-budget", action="store_true",
+                        help="Spend the full daily budget instead of leaving the interactive reserve untouched")
+    parser.add_argument("--batch-workers", type=int, default=SHARD_BATCH_WORKERS, help="Task-graph workers per shard (default: %(default)s)")
+    parser.add_argument("--run-id", help="Label stored with this run's analyses (default: a timestamp)")
+    args = parser.parse_args(argv)
+
+    _configure_process()
+    newsapi_quota.configure_ledger(config.NEWSAPI_QUOTA_LEDGER_PATH, config.NEWSAPI_DAILY_REQUEST_LIMIT)
+    store = article_store.configure_store(config.ARTICLE_STORE_PATH)
+    try:
+        universe = load_universe(args.universe) if args.universe else gemini_utils.NIFTY_SECTORS_QUERY_CONFIG
+    except (OSError, ValueError) as e:
+        print(f"Could not load universe: {e}", file=sys.stderr)
+        return 1
+    unknown = [name for name in args.sectors or [] if name not in universe]
+    if unknown:
+        print(f"Unknown sector(s): {', '.join(unknown)}", file=sys.stderr)
+        return 1
+
+    summary = run_sharded(
+        store, universe, config.NEWSAPI_ORG_API_KEY, config.GEMINI_API_KEY, num_shards=max(1, args.shards),
+        sector_names=args.sectors, include_stocks=not args.no_stocks, lookback_days=min(max(1, args.lookback), 29),
+        max_calls=args.max_calls, priority=PRIORITY_INTERACTIVE if args.interactive_budget else PRIORITY_BACKGROUND,
+        batch_workers=args.batch_workers, run_id=args.run_id, process_initializer=_configure_process
+    )
+    print(json.dumps(summary, indent=2))
+    failed = summary.get('error') or all(shard.get('error') for shard in summary['shards'])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
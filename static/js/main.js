@@ -261,6 +261,9 @@ document.addEventListener('DOMContentLoaded', function () {
         if (geminiAnalysis) {
             const llmScore = geminiAnalysis.sentiment_score_llm;
             detailHtml += `<p><strong>LLM Overall Sentiment:</strong> ${escapeHtml(geminiAnalysis.overall_sentiment || 'N/A')} (Score: ${llmScore !== null && typeof llmScore !== 'undefined' && !isNaN(llmScore) ? parseFloat(llmScore).toFixed(2) : 'N/A'})</p>`;
+            if (geminiAnalysis.analysis_freshness === 'stale_but_valid') {
+                detailHtml += `<p><small>LLM analysis reused from ${escapeHtml(geminiAnalysis.analysis_generated_at || 'an earlier run')}: the article set has not materially changed.</small></p>`;
+            }
             detailHtml += `<p><strong>LLM Summary:</strong> ${escapeHtml(geminiAnalysis.summary || 'N/A')}</p>`;
             detailHtml += `<p><strong>LLM Reason:</strong> ${escapeHtml(geminiAnalysis.sentiment_reason || 'N/A')}</p>`;
             
@@ -401,9 +404,9 @@ document.addEventListener('DOMContentLoaded', function () {
         const stockMaxArticles = document.getElementById('stock_max_articles') ? document.getElementById('stock_max_articles').value : 3; // Fallback if input not present
         const customPrompt = document.getElementById('sector_custom_prompt').value;
 
+        // Stock runs go through the batch endpoint so shared keywords are fetched once
         const payload = {
-            sector_name: sectorName,
-            selected_stocks: selectedStocks,
+            targets: selectedStocks.map(stockName => ({ type: 'stock', sector: sectorName, name: stockName })),
             end_date: endDate,
             lookback_days: lookbackDays,
             stock_max_articles: parseInt(stockMaxArticles, 10),
@@ -413,7 +416,7 @@ document.addEventListener('DOMContentLoaded', function () {
         appendToLog({ timestamp: new Date().toLocaleTimeString([], { hour12: false }), message: `Starting analysis for selected stocks in ${sectorName}...`, level: "INFO" });
 
         try {
-            const response = await fetch('/api/stock-analysis', {
+            const response = await fetch('/api/analysis/batch', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(payload)
@@ -432,7 +435,7 @@ document.addEventListener('DOMContentLoaded', function () {
                 displayErrorMessages(errorMessages); // Display globally or locally
                 stockResultsDisplayArea.innerHTML = `<p class="error-message">Stock analysis failed. Check errors.</p>`;
             } else {
-                displayIndividualStockResults(result.results_stocks || [], stockResultsDisplayArea);
+                displayIndividualStockResults((result.results || []).filter(r => r.target_type === 'stock'), stockResultsDisplayArea);
             }
 
         } catch (error) {
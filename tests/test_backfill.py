@@ -0,0 +1,32 @@
+# tests/test_backfill.py
+from datetime import datetime, timezone
+from utils.article_store import ArticleStore
+from utils.backfill import BackfillRun
+
+QUERIES = [
+    ("sector", {"sector": "Banking"}, "banking"),
+    ("sector", {"sector": "Power"}, "power"),
+    ("pack", {"stocks": {"Acme Bank": "Banking", "Volt": "Power"}}, "acme OR volt"),
+    ("pack", {"stocks": {"Gridco": "Power"}}, "gridco"),
+]
+
+
+def _run(store, sector_names=None):
+    return BackfillRun(store, None, {}, "test", sector_names=sector_names)
+
+
+def _pending_queries(run):
+    queries = []
+    while (unit := run._next_unit()) is not None:
+        queries.append(unit[3])
+        run.store.execute("UPDATE backfill_units SET status = 'done' WHERE unit_id = ?", (unit[0],))
+    return queries
+
+
+def test_resume_with_sectors_only_works_through_their_units():
+    store = ArticleStore(":memory:")
+    assert _run(store).initialize(QUERIES, now=datetime(2026, 10, 1, tzinfo=timezone.utc)) == 4
+    resumed = _run(store, ["Banking"])
+    assert resumed.initialize(QUERIES) == 0 and resumed.planned_sectors() == {"Banking", "Power"}
+    assert _pending_queries(resumed) == ["banking", "acme OR volt"]
+    assert _pending_queries(_run(store)) == ["power", "gridco"] # Left pending for an unrestricted resume
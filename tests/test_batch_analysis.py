@@ -0,0 +1,53 @@
+# tests/test_batch_analysis.py
+import datetime
+import pytest
+from utils import batch_analysis, gemini_utils, newsapi_helpers, newsapi_quota
+
+
+class FakeClient:
+    """Every query gets the same page: one headline per sector alias of Acme Ltd, and one naming it outright."""
+
+    def get_everything(self, page_size, page, **_):
+        headlines = ["Acme Bank posts record profit", "Acme Power commissions new plant", "Acme Ltd shares rally"]
+        articles = [{'url': f"https://example.com/{n}", 'title': title, 'description': "Markets rally.",
+                     'publishedAt': "2026-10-01T09:00:00Z", 'source': {'name': "Example"}}
+                    for n, title in enumerate(headlines)]
+        return {'status': 'ok', 'totalResults': len(articles), 'articles': articles}
+
+
+@pytest.fixture(autouse=True)
+def _isolated(monkeypatch):
+    monkeypatch.setattr(gemini_utils, "NIFTY_SECTORS_QUERY_CONFIG", {
+        "Banking": {"newsapi_keywords": ["banking"], "stocks": {"Acme Ltd": ["Acme Bank"]}},
+        "Power": {"newsapi_keywords": ["power"], "stocks": {"Acme Ltd": ["Acme Power"]}},
+    })
+    monkeypatch.setattr(newsapi_helpers._newsapi_rate_limiter, "min_interval_seconds", 0)
+    monkeypatch.setattr(newsapi_helpers, "BM25_RERANK_ENABLED", False)
+    monkeypatch.setattr(newsapi_quota, "_ledger", newsapi_quota.QuotaLedger(None, 100))
+    monkeypatch.setattr(gemini_utils, "analyze_news_with_gemini",
+                        lambda key, articles, name, *args, **kwargs: ({'uris': sorted(a.uri for a in articles)}, None))
+    newsapi_helpers._candidate_cache.clear()
+
+
+def _run(sector_targets, stock_targets):
+    return batch_analysis.run_batch_analysis(
+        FakeClient(), None, sector_targets, stock_targets,
+        datetime.date(2026, 10, 1), datetime.date(2026, 10, 2), "2026-10-01 to 2026-10-02",
+        5, 5, max_workers=2
+    )
+
+
+def test_same_stock_under_two_sectors_is_two_targets():
+    results = _run([], [("Banking", "Acme Ltd"), ("Power", "Acme Ltd")])
+    assert [(r['sector_name'], r['stock_name']) for r in results] == [("Banking", "Acme Ltd"), ("Power", "Acme Ltd")]
+    by_sector = {r['sector_name']: r for r in results}
+    assert all(r['error_message_stock'] is None for r in results)
+    # each target is tagged with its own sector's keywords
+    assert by_sector["Banking"]['gemini_analysis_stock']['uris'] == ["https://example.com/0", "https://example.com/2"]
+    assert by_sector["Power"]['gemini_analysis_stock']['uris'] == ["https://example.com/1", "https://example.com/2"]
+
+
+def test_sector_and_stock_targets_share_one_batch():
+    results = _run(["Banking"], [("Banking", "Acme Ltd")])
+    assert [r['target_type'] for r in results] == ['sector', 'stock']
+    assert results[1]['num_articles_for_llm_stock'] == 2
@@ -0,0 +1,57 @@
+# tests/test_columnar_export.py
+import io
+import numpy as np
+import pytest
+from utils import columnar_export
+from utils.article_store import ArticleStore
+
+
+@pytest.mark.parametrize("key_values", [[0], [123456789012], ["sector", "Banking & Finance", "2026-10-01"], [1.5], ["ünïcode"]])
+def test_cursor_round_trip(key_values):
+    cursor = columnar_export.encode_cursor(key_values)
+    assert "=" not in cursor
+    assert columnar_export.decode_cursor(cursor) == key_values
+
+
+@pytest.mark.parametrize("cursor", [
+    "!!!", "bm90IGpzb24", columnar_export.encode_cursor({"a": 1}), columnar_export.encode_cursor(None),
+    columnar_export.encode_cursor([True]), columnar_export.encode_cursor([None]), columnar_export.encode_cursor([[1]]),
+    columnar_export.encode_cursor([2 ** 63]),
+])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        columnar_export.decode_cursor(cursor)
+
+
+@pytest.fixture
+def store():
+    store = ArticleStore(":memory:")
+    for index in range(7):
+        store.add_analysis("stock", f"Stock {index}", "2026-10-01", {'overall_sentiment': "Neutral", 'sentiment_score_llm': 0.1 * index})
+    return store
+
+
+def _load(data):
+    return np.load(io.BytesIO(data))
+
+
+def test_chunks_walk_the_dataset_once(store):
+    ids = []; cursor = None
+    while True:
+        data, cursor, row_count = columnar_export.export_chunk(store, 'analyses', cursor=cursor, chunk_rows=3)
+        ids.extend(_load(data)['analysis_id'].tolist())
+        assert row_count <= 3
+        if cursor is None:
+            break
+    assert ids == list(range(1, 8))
+
+
+@pytest.mark.parametrize("dataset, key_values", [('analyses', ["1"]), ('analyses', [1, 2]), ('daily', [1, 2, 3]), ('daily', ["sector"])])
+def test_cursor_from_another_dataset_is_rejected(store, dataset, key_values):
+    with pytest.raises(ValueError):
+        columnar_export.export_chunk(store, dataset, cursor=columnar_export.encode_cursor(key_values))
+
+
+def test_unknown_dataset(store):
+    with pytest.raises(ValueError):
+        columnar_export.export_chunk(store, 'nope')
@@ -0,0 +1,14 @@
+# tests/test_deadline.py
+import pytest
+from utils.deadline import deadline_from_request, MAX_REQUEST_TIMEOUT_SECONDS, REQUEST_TIMEOUT_HEADER
+
+
+@pytest.mark.parametrize("raw", ["nan", "NaN", "inf", "-inf", "0", "-5", "soon", float('nan')])
+def test_invalid_timeouts_mean_no_deadline(raw):
+    deadline = deadline_from_request({REQUEST_TIMEOUT_HEADER: raw}, {})
+    assert deadline.expires_at is None and deadline.remaining() is None and not deadline.expired()
+
+
+def test_body_timeout_is_used_and_capped():
+    assert 0 < deadline_from_request({}, {'timeout_seconds': 30}).remaining() <= 30
+    assert deadline_from_request({}, {'timeout_seconds': 10 ** 6}).remaining() <= MAX_REQUEST_TIMEOUT_SECONDS
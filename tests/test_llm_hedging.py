@@ -0,0 +1,59 @@
+# tests/test_llm_hedging.py
+import threading
+import time
+import pytest
+from utils import llm_hedging
+from utils.rate_limiter import AIMDConcurrencyLimiter
+
+
+@pytest.fixture
+def model_name(monkeypatch, request):
+    # Fast latency history and enough plain calls that the hedge budget allows one duplicate
+    monkeypatch.setattr(llm_hedging, "HEDGING_ENABLED", True)
+    name = f"test-model-{request.node.name}"
+    for _ in range(llm_hedging.HEDGE_MIN_SAMPLES):
+        llm_hedging.latency_tracker.record(name, 0.01)
+    for _ in range(20):
+        llm_hedging.hedge_budget.record_call(name)
+    return name
+
+
+def _calls(first, second):
+    attempts = iter([first, second])
+    lock = threading.Lock()
+
+    def _call():
+        with lock:
+            attempt = next(attempts)
+        return attempt()
+    return _call
+
+
+def test_hedge_slot_is_released_when_the_primary_wins(model_name):
+    limiter = AIMDConcurrencyLimiter(initial_limit=4, max_limit=4)
+    hedge_blocked = threading.Event()
+
+    def _slow_primary():
+        time.sleep(0.2)
+        return "primary"
+
+    try:
+        result = llm_hedging.call_with_hedging(_calls(_slow_primary, lambda: hedge_blocked.wait(5) and "hedge"), model_name, limiter=limiter)
+        assert result == "primary"
+        assert limiter.in_flight == 0 # The losing hedge is still running, but no longer holds a slot
+    finally:
+        hedge_blocked.set()
+    time.sleep(0.05)
+    assert limiter.in_flight == 0 # ...and finishing it later does not release twice
+
+
+def test_hedge_win_returns_without_waiting_for_the_primary(model_name):
+    limiter = AIMDConcurrencyLimiter(initial_limit=4, max_limit=4)
+    primary_blocked = threading.Event()
+    try:
+        started = time.monotonic()
+        result = llm_hedging.call_with_hedging(_calls(lambda: primary_blocked.wait(5) and "primary", lambda: "hedge"), model_name, limiter=limiter)
+        assert result == "hedge" and time.monotonic() - started < 1
+        assert limiter.in_flight == 0
+    finally:
+        primary_blocked.set()
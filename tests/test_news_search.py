@@ -0,0 +1,74 @@
+# tests/test_news_search.py
+import pytest
+from utils import news_search
+from utils.article import Article
+from utils.article_store import ArticleStore
+
+SECTORS = {"Banking": {"stocks": {"HDFC Bank": ["HDFC Bank", "HDFC banking"], "State Bank of India": ["SBI", "State Bank of India"]}}}
+
+
+@pytest.mark.parametrize("query, tree", [
+    ("rbi policy", ('and', [('phrase', ['rbi']), ('phrase', ['policy'])])),
+    ("rbi AND policy", ('and', [('phrase', ['rbi']), ('phrase', ['policy'])])),
+    ('"repo rate" OR inflation', ('or', [('phrase', ['repo', 'rate']), ('phrase', ['inflation'])])),
+    ("rbi -inflation", ('and', [('phrase', ['rbi']), ('not', ('phrase', ['inflation']))])),
+    ("NOT (rbi OR sebi) banks", ('and', [('not', ('or', [('phrase', ['rbi']), ('phrase', ['sebi'])])), ('phrase', ['banks'])])),
+    ('stock:"HDFC Bank"', ('stock', 'HDFC Bank')),
+    ("the rbi", ('phrase', ['rbi'])),
+    ("rbi -the", ('phrase', ['rbi'])),
+])
+def test_parse(query, tree):
+    assert news_search._parse_query(query) == tree
+
+
+@pytest.mark.parametrize("query, message", [
+    ("", "Empty search expression"),
+    ("the of", "Empty search expression"),
+    ("()", "Empty search expression"),
+    ("-the", "Empty search expression"),
+    ("NOT", "NOT must be followed by a term"),
+    ("rbi NOT", "NOT must be followed by a term"),
+    ("NOT the", "NOT must be followed by a term"),
+    ("NOT OR rbi", "NOT must be followed by a term"),
+    ("(NOT) rbi", "NOT must be followed by a term"),
+    ("(rbi policy", "Unbalanced parentheses"),
+    ("rbi)", "Unexpected '\\)'"),
+    ("rbi OR", "Empty search expression"),
+])
+def test_unusable_queries_raise_value_error(query, message):
+    with pytest.raises(ValueError, match=message):
+        news_search._parse_query(query)
+
+
+def test_alias_table():
+    aliases = news_search.build_alias_table(SECTORS)
+    assert aliases[('sbi',)] == aliases[('state', 'bank', 'india')] == "State Bank of India"
+    assert aliases[('hdfc', 'bank')] == "HDFC Bank"
+
+
+@pytest.fixture
+def index(tmp_path):
+    store = ArticleStore(str(tmp_path / "articles.sqlite3"))
+    store.add_articles("sector", "Banking", [
+        Article("SBI raises deposit rates", "2026-10-01", "https://example.com/1", "Example", None),
+        Article("HDFC Bank profit jumps on loan growth", "2026-10-02", "https://example.com/2", "Example", None),
+        Article("Monsoon rains lift rural demand", "2026-10-03", "https://example.com/3", "Example", None),
+    ])
+    index = news_search.NewsSearchIndex(store, SECTORS)
+    assert index.refresh() == 3
+    return index
+
+
+def test_search(index):
+    assert [hit['uri'] for hit in index.search('stock:SBI')['results']] == ["https://example.com/1"]
+    assert index.search('stock:"State Bank of India"')['total'] == 1
+    assert index.search('"loan growth" OR rains')['total'] == 2
+    assert index.search('"growth loan"')['total'] == 0
+    assert index.search('NOT rains')['total'] == 2
+    assert index.search('rates', from_day="2026-10-02")['total'] == 0
+
+
+def test_refresh_picks_up_new_articles(index):
+    index.store.add_articles("sector", "Banking", [Article("SBI cuts lending rates", "2026-10-04", "https://example.com/4", "Example", None)])
+    assert index.refresh() == 1
+    assert index.search('stock:SBI')['total'] == 2
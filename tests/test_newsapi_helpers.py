@@ -0,0 +1,72 @@
+# tests/test_newsapi_helpers.py
+import pytest
+from utils import newsapi_helpers, newsapi_quota
+
+
+class FakeClient:
+    """Serves `total` distinct articles; every `duplicate_every`-th one repeats the previous URL."""
+
+    def __init__(self, total, duplicate_every=None):
+        self.total = total
+        self.duplicate_every = duplicate_every
+        self.calls = []
+
+    def get_everything(self, page_size, page, **_):
+        self.calls.append((page, page_size))
+        if page * page_size > newsapi_helpers.NEWSAPI_MAX_RESULTS_DEPTH and page > 1:
+            return {'status': 'error', 'code': 'maximumResultsReached', 'message': "Developer accounts are limited to 100 results."}
+        start = (page - 1) * page_size
+        articles = []
+        for n in range(start, min(start + page_size, self.total)):
+            url_n = n - 1 if self.duplicate_every and n % self.duplicate_every == 0 and n else n
+            articles.append({'url': f"https://example.com/{url_n}", 'title': f"Headline {n}", 'description': "Markets rally.",
+                             'publishedAt': "2026-10-01T09:00:00Z", 'source': {'name': "Example"}})
+        return {'status': 'ok', 'totalResults': self.total, 'articles': articles}
+
+
+@pytest.fixture(autouse=True)
+def _isolated(monkeypatch):
+    monkeypatch.setattr(newsapi_helpers._newsapi_rate_limiter, "min_interval_seconds", 0)
+    monkeypatch.setattr(newsapi_helpers, "BM25_RERANK_ENABLED", False)
+    monkeypatch.setattr(newsapi_quota, "_ledger", newsapi_quota.QuotaLedger(None, 100))
+    newsapi_helpers._candidate_cache.clear()
+
+
+def _fetch(client, pool, page_size_override=None):
+    return newsapi_helpers._fetch_newsapi_articles_paginated(
+        client, "q", "test", "2026-10-01", "2026-10-02", pool, lambda *args: None, page_size_override=page_size_override
+    )
+
+
+@pytest.mark.parametrize("pool, size", [(1, 1), (3, 4), (5, 5), (20, 20), (30, 50), (60, 100), (100, 100), (300, 100)])
+def test_page_size_tiles_the_result_depth(pool, size):
+    assert newsapi_helpers._page_size_for(pool) == size
+
+
+def test_pool_that_does_not_tile_the_depth_uses_one_full_page():
+    client = FakeClient(500, duplicate_every=4)
+    articles, error, meta = _fetch(client, 60)
+    assert error is None and len(articles) == 60
+    assert client.calls == [(1, 100)] and meta['pages_used'] == 1
+
+
+def test_pool_larger_than_a_page_paginates():
+    client = FakeClient(500)
+    articles, error, meta = _fetch(client, 60, page_size_override=20)
+    assert error is None and len(articles) == 60
+    assert [page for page, _ in client.calls] == [1, 2, 3] and meta['pages_used'] == 3
+
+
+def test_duplicates_are_made_up_from_follow_up_pages():
+    client = FakeClient(500, duplicate_every=2)
+    articles, error, meta = _fetch(client, 20)
+    assert error is None and len(articles) == 20
+    assert len({art.uri for art in articles}) == 20
+    assert client.calls[0] == (1, 20) and meta['pages_used'] >= 2
+    assert all(page * size <= newsapi_helpers.NEWSAPI_MAX_RESULTS_DEPTH for page, size in client.calls)
+
+
+def test_stops_when_results_run_out():
+    client = FakeClient(25)
+    articles, error, meta = _fetch(client, 50)
+    assert error is None and len(articles) == 25 and meta['pages_used'] == 1
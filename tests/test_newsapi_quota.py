@@ -0,0 +1,97 @@
+# tests/test_newsapi_quota.py
+import multiprocessing
+import threading
+import pytest
+from utils import newsapi_quota
+from utils.rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+
+def _record(path, count):
+    ledger = newsapi_quota.QuotaLedger(path, 100)
+    for _ in range(count):
+        ledger.record_calls("key")
+
+
+def _reserve(path, attempts):
+    ledger = newsapi_quota.QuotaLedger(path, 10)
+    return sum(ledger.reserve("key") for _ in range(attempts))
+
+
+def test_writers_add_to_each_others_counts(tmp_path):
+    path = str(tmp_path / "quota.json")
+    first, second = newsapi_quota.QuotaLedger(path, 100), newsapi_quota.QuotaLedger(path, 100)
+    first.record_calls("key", 3)
+    second.record_calls("key", 2)
+    first.record_calls("key")
+    assert first.used_today("key") == second.used_today("key") == 6
+    assert newsapi_quota.QuotaLedger(path, 100).used_today("key") == 6
+    assert first.used_today("other key") == 0
+
+
+def test_processes_merge_their_writes(tmp_path):
+    path = str(tmp_path / "quota.json")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_record, args=(path, 25)) for _ in range(4)]
+    for worker in workers: worker.start()
+    for worker in workers: worker.join(30)
+    assert all(worker.exitcode == 0 for worker in workers)
+    assert newsapi_quota.QuotaLedger(path, 100).used_today("key") == 100
+
+
+def test_reserve_never_overspends_across_processes(tmp_path):
+    path = str(tmp_path / "quota.json")
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        granted = sum(pool.starmap(_reserve, [(path, 10)] * 4))
+    assert granted == 10
+    assert newsapi_quota.QuotaLedger(path, 10).used_today("key") == 10
+
+
+def test_reserve_is_atomic_across_threads(tmp_path):
+    ledgers = [newsapi_quota.QuotaLedger(str(tmp_path / "quota.json"), 10) for _ in range(2)]
+    granted = []
+
+    def _worker(ledger):
+        for _ in range(10):
+            granted.append(ledger.reserve("key"))
+    threads = [threading.Thread(target=_worker, args=(ledgers[i % 2],)) for i in range(6)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert sum(granted) == 10
+    assert ledgers[0].used_today("key") == 10
+
+
+def test_background_priority_keeps_the_reserve():
+    ledger = newsapi_quota.QuotaLedger(None, 100)
+    background = sum(ledger.reserve("key", PRIORITY_BACKGROUND) for _ in range(100))
+    assert background == 100 - int(100 * newsapi_quota.BACKGROUND_RESERVE_FRACTION)
+    interactive = sum(ledger.reserve("key", PRIORITY_INTERACTIVE) for _ in range(100))
+    assert background + interactive == 100
+    assert not ledger.admit("key")
+
+
+@pytest.mark.parametrize("priority", [PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE])
+def test_budget_reservation_matches_what_single_reserves_admit(priority):
+    ledger, single = newsapi_quota.QuotaLedger(None, 100), newsapi_quota.QuotaLedger(None, 100)
+    ledger.record_calls("key", 10); single.record_calls("key", 10)
+    admitted = sum(single.reserve("key", priority) for _ in range(100))
+    assert ledger.reserve_budget("key", priority=priority) == admitted
+    assert ledger.used_today("key") == single.used_today("key")
+    assert not ledger.admit("key", priority)
+    assert newsapi_quota.QuotaLedger(None, 100).reserve_budget("key", max_calls=7, priority=priority) == 7
+
+
+def test_handing_back_a_reserved_call(tmp_path):
+    ledger = newsapi_quota.QuotaLedger(str(tmp_path / "quota.json"), 100)
+    assert ledger.reserve("key")
+    ledger.record_calls("key", -1)
+    assert ledger.used_today("key") == 0
+    ledger.record_calls("key", -5)
+    assert ledger.used_today("key") == 0
+
+
+@pytest.mark.parametrize("contents", ["", "{not json"])
+def test_unreadable_file_starts_from_zero(tmp_path, contents):
+    path = tmp_path / "quota.json"
+    path.write_text(contents)
+    ledger = newsapi_quota.QuotaLedger(str(path), 100)
+    assert ledger.used_today("key") == 0
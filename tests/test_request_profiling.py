@@ -0,0 +1,18 @@
+# tests/test_request_profiling.py
+import tracemalloc
+from utils.request_profiling import RequestProfile
+
+
+def test_profiler_stops_only_the_tracing_it_started():
+    assert not tracemalloc.is_tracing()
+    with RequestProfile("own"):
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+
+    tracemalloc.start()
+    try:
+        with RequestProfile("shared"):
+            pass
+        assert tracemalloc.is_tracing() # Started outside the profiler, so it is left running
+    finally:
+        tracemalloc.stop()
@@ -0,0 +1,76 @@
+# tests/test_sentiment_analytics.py
+import numpy as np
+import pytest
+from utils import sentiment_analytics
+
+
+def _reference(a, b, min_periods):
+    # Pairwise-complete Pearson correlation, the slow way
+    both = ~np.isnan(a) & ~np.isnan(b)
+    if both.sum() < min_periods or np.std(a[both]) < 1e-9 or np.std(b[both]) < 1e-9:
+        return np.nan
+    return np.corrcoef(a[both], b[both])[0, 1]
+
+
+@pytest.fixture
+def panel():
+    rng = np.random.default_rng(7)
+    x = rng.normal(size=(5, 40))
+    x[1] = 0.8 * x[0] + 0.2 * x[1] # Correlated pair
+    x[2, 5:] = x[0, :-5] # Row 0 leads row 2 by five days
+    x[rng.random(x.shape) < 0.15] = np.nan
+    return x
+
+
+def test_full_correlation_matches_corrcoef_on_complete_data():
+    x = np.random.default_rng(1).normal(size=(4, 30))
+    np.testing.assert_allclose(sentiment_analytics.full_correlation(x, 2), np.corrcoef(x), atol=1e-9)
+
+
+def test_full_correlation_uses_pairwise_complete_days(panel):
+    r = sentiment_analytics.full_correlation(panel, 5)
+    for i in range(len(panel)):
+        for j in range(len(panel)):
+            np.testing.assert_allclose(r[i, j], _reference(panel[i], panel[j], 5), atol=1e-9)
+
+
+def test_rolling_correlations_match_each_window(panel):
+    window = 10
+    r = sentiment_analytics.rolling_correlations(panel, window, 6)
+    assert r.shape == (5, 5, panel.shape[1] - window + 1)
+    for end in range(window, panel.shape[1] + 1):
+        for i, j in ((0, 1), (0, 2), (3, 4)):
+            np.testing.assert_allclose(r[i, j, end - window], _reference(panel[i, end - window:end], panel[j, end - window:end], 6), atol=1e-9)
+
+
+def test_rolling_correlations_shorter_than_window():
+    assert sentiment_analytics.rolling_correlations(np.zeros((3, 4)), 5).shape == (3, 3, 0)
+
+
+def test_lagged_correlations_match_shifted_series(panel):
+    max_lag = 6
+    r = sentiment_analytics.lagged_correlations(panel, max_lag, 5)
+    cols = panel.shape[1]
+    for lag in range(-max_lag, max_lag + 1):
+        for i, j in ((0, 2), (2, 0), (1, 3)):
+            lead = panel[i, :cols - lag] if lag >= 0 else panel[i, -lag:]
+            follow = panel[j, lag:] if lag >= 0 else panel[j, :cols + lag]
+            np.testing.assert_allclose(r[lag + max_lag, i, j], _reference(lead, follow, 5), atol=1e-9)
+    assert np.nanargmax(r[:, 0, 2]) - max_lag == 5
+
+
+def test_short_overlap_and_constant_series_are_nan():
+    x = np.array([[1.0, 2.0, 3.0, np.nan, np.nan], [2.0, 1.0, np.nan, 4.0, 5.0], [1.0, 1.0, 1.0, 1.0, 1.0]])
+    r = sentiment_analytics.full_correlation(x, 3)
+    assert np.isnan(r[0, 1]) # Two shared days
+    assert np.isnan(r[0, 2]) and np.isnan(r[2, 2]) # Constant row
+
+
+def test_constituent_dispersion():
+    stocks = np.array([[0.1, 0.5, np.nan], [0.3, np.nan, np.nan], [0.8, 0.2, 0.4]])
+    membership = np.array([[1, 1, 0], [0, 0, 1]], dtype=float)
+    mean, std, count = sentiment_analytics.constituent_dispersion(stocks, membership)
+    np.testing.assert_allclose(mean[0], [0.2, 0.5, np.nan])
+    np.testing.assert_allclose(std[0, 0], np.std([0.1, 0.3]))
+    assert np.isnan(std[0, 1]) and np.isnan(std[1]).all() # Fewer than two constituents
+    np.testing.assert_array_equal(count, [[2, 1, 0], [1, 1, 1]])
@@ -0,0 +1,78 @@
+# tests/test_sharding.py
+import sys
+import pytest
+from utils import newsapi_quota, sharding
+from utils.article_store import ArticleStore
+
+
+def _universe(stock_counts):
+    return {f"Sector {index}": {"newsapi_keywords": [f"sector {index}"], "stocks": {f"S{index}-{n}": [f"stock {index} {n}"] for n in range(count)}}
+            for index, count in enumerate(stock_counts)}
+
+
+def _load(shard):
+    return sum(sharding._unit_cost(cfg) for cfg in shard.values())
+
+
+def test_every_sector_lands_in_exactly_one_shard():
+    universe = _universe([5, 3, 8, 1, 0, 2, 6])
+    shards = sharding.partition_universe(universe, 3)
+    assert len(shards) == 3
+    placed = [name for shard in shards for name in shard]
+    assert sorted(placed) == sorted(universe)
+    assert all(shard[name] is universe[name] for shard in shards for name in shard)
+
+
+def test_shard_loads_stay_within_one_sector():
+    universe = _universe([9, 7, 7, 4, 4, 3, 2, 2, 1, 0])
+    shards = sharding.partition_universe(universe, 4)
+    loads = [_load(shard) for shard in shards]
+    largest_sector = max(sharding._unit_cost(cfg) for cfg in universe.values())
+    assert max(loads) - min(loads) <= largest_sector
+
+
+def test_no_more_shards_than_sectors():
+    assert len(sharding.partition_universe(_universe([1, 2]), 8)) == 2
+    assert len(sharding.partition_universe(_universe([1, 2]), 0)) == 1
+    assert sharding.partition_universe({}, 4) == []
+
+
+def test_sector_filter():
+    universe = _universe([3, 2, 1])
+    shards = sharding.partition_universe(universe, 2, sector_names=["Sector 0", "Sector 2"])
+    assert sorted(name for shard in shards for name in shard) == ["Sector 0", "Sector 2"]
+
+
+def test_partition_is_deterministic():
+    universe = _universe([4, 4, 4, 2, 2])
+    assert sharding.partition_universe(universe, 3) == sharding.partition_universe(dict(reversed(list(universe.items()))), 3)
+
+
+def test_shared_stock_is_analyzed_once_with_its_first_sector():
+    universe = _universe([2, 2])
+    universe["Sector 1"]["stocks"]["S0-0"] = ["shared"]
+    shards = sharding.partition_universe(universe, 2)
+    targets = [pair for stocks in sharding._assign_stocks(universe, shards) for pair in stocks]
+    assert [pair for pair in targets if pair[1] == "S0-0"] == [("Sector 0", "S0-0")]
+    assert len(targets) == 4
+
+
+@pytest.mark.parametrize("total_calls", [0, 2, 3, 4, 10, 97])
+def test_budget_split_covers_the_total(total_calls):
+    shards = sharding.partition_universe(_universe([10, 9, 1]), 3)
+    shares = sharding._split_budget(total_calls, shards)
+    assert sum(shares) == total_calls
+    if total_calls >= len(shards):
+        assert min(shares) >= 1
+    costs = [_load(shard) for shard in shards]
+    assert shares[costs.index(max(costs))] == max(shares)
+
+
+def test_crashed_shards_keep_their_reserved_budget(monkeypatch):
+    ledger = newsapi_quota.QuotaLedger(None, 100)
+    monkeypatch.setattr(newsapi_quota, "_ledger", ledger)
+    # sys.exit as the process initializer breaks every shard process before it runs
+    summary = sharding.run_sharded(ArticleStore(":memory:"), _universe([1, 1]), "key", None, num_shards=2, max_calls=10,
+                                   process_initializer=sys.exit, initargs=(1,))
+    assert summary['newsapi_budget'] == 10 and all(shard['error'] for shard in summary['shards'])
+    assert ledger.used_today("key") == 10
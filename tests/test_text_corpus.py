@@ -0,0 +1,80 @@
+# tests/test_text_corpus.py
+import multiprocessing
+import os
+import pytest
+from utils import text_corpus
+from utils.article import Article, CorpusArticle
+
+
+def _hash(n):
+    return f"{n:016x}"
+
+
+def _append_range(directory, start, count):
+    corpus = text_corpus.TextCorpus(directory)
+    corpus.append_many((_hash(n), f"article {n}") for n in range(start, start + count))
+
+
+def test_append_and_lookup(tmp_path):
+    corpus = text_corpus.TextCorpus(str(tmp_path))
+    assert corpus.append_many([(_hash(1), "one"), (_hash(2), "zwei – två"), (_hash(1), "duplicate")]) == 2
+    assert corpus.append_many([(_hash(2), "again")]) == 0
+    assert corpus.text(_hash(1)) == "one"
+    assert bytes(corpus.view(_hash(2))).decode('utf-8') == "zwei – två"
+    assert corpus.text(_hash(3)) is None and _hash(3) not in corpus
+    assert len(corpus) == 2
+
+
+def test_lookups_survive_the_index_rebuild(tmp_path, monkeypatch):
+    monkeypatch.setattr(text_corpus, "CORPUS_TAIL_MAX", 3)
+    corpus = text_corpus.TextCorpus(str(tmp_path))
+    for n in range(20):
+        corpus.append_many([(_hash(1000 - n), f"article {n}")])
+    assert all(corpus.text(_hash(1000 - n)) == f"article {n}" for n in range(20))
+    assert corpus.stats()['unsorted_tail'] <= 3
+
+
+def test_other_processes_appends_are_visible(tmp_path):
+    reader = text_corpus.TextCorpus(str(tmp_path))
+    context = multiprocessing.get_context("fork")
+    writers = [context.Process(target=_append_range, args=(str(tmp_path), start, 50)) for start in (0, 25, 100)]
+    for writer in writers: writer.start()
+    for writer in writers: writer.join(30)
+    assert all(writer.exitcode == 0 for writer in writers)
+    assert all(reader.text(_hash(n)) == f"article {n}" for n in list(range(75)) + list(range(100, 150)))
+    assert len(text_corpus.TextCorpus(str(tmp_path))) == 125
+
+
+@pytest.mark.parametrize("torn_bytes", [1, text_corpus.INDEX_DTYPE.itemsize - 1])
+def test_torn_index_record_is_dropped(tmp_path, torn_bytes):
+    corpus = text_corpus.TextCorpus(str(tmp_path))
+    corpus.append_many([(_hash(1), "one")])
+    with open(os.path.join(str(tmp_path), "corpus.idx"), 'ab') as f:
+        f.write(b"\xff" * torn_bytes) # A writer died mid-record
+    corpus.append_many([(_hash(2), "two")])
+    reopened = text_corpus.TextCorpus(str(tmp_path))
+    assert reopened.text(_hash(1)) == "one" and reopened.text(_hash(2)) == "two"
+    assert os.path.getsize(os.path.join(str(tmp_path), "corpus.idx")) == 2 * text_corpus.INDEX_DTYPE.itemsize
+
+
+def test_to_corpus_articles(tmp_path):
+    corpus = text_corpus.TextCorpus(str(tmp_path))
+    articles = [Article("Bank results beat estimates", "2026-10-01", "https://example.com/a", "Example", 0.4)]
+    converted = text_corpus.to_corpus_articles(articles, corpus)
+    assert isinstance(converted[0], CorpusArticle)
+    assert converted[0].content == articles[0].content
+    assert converted[0].content_hash == articles[0].content_hash and converted[0].vader_score == 0.4
+    assert text_corpus.to_corpus_articles(converted, corpus)[0] is converted[0]
+
+
+def test_candidates_are_not_appended_without_append(tmp_path):
+    corpus = text_corpus.TextCorpus(str(tmp_path))
+    stored = Article("Stored article", "2026-10-01", "https://example.com/s", "Example", 0.1)
+    transient = Article("Transient candidate", "2026-10-01", "https://example.com/t", "Example", 0.2)
+    corpus.append_many([(stored.content_hash, stored.content)])
+    shared = text_corpus.to_corpus_articles([stored, transient], corpus, append=False)
+    assert isinstance(shared[0], CorpusArticle) and shared[1] is transient
+    assert len(corpus) == 1
+    materialized = text_corpus.materialize_articles(shared)
+    assert type(materialized[0]) is Article and materialized[0].content == "Stored article"
+    assert materialized[1] is transient
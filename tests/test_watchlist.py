@@ -0,0 +1,41 @@
+# tests/test_watchlist.py
+import pytest
+from utils import gemini_utils, newsapi_helpers, newsapi_quota
+from utils.watchlist import WatchlistMonitor
+
+SECTORS = {"Banking": {"newsapi_keywords": ["banking"], "stocks": {"Acme Bank": ["Acme Bank"]}}}
+
+
+class FakeClient:
+    def get_everything(self, **_):
+        articles = [{'url': f"https://example.com/{n}", 'title': f"Acme Bank update {n}", 'description': "Shares rise.",
+                     'publishedAt': f"2026-10-1{n}T09:00:00Z", 'source': {'name': "Example"}} for n in range(2)]
+        return {'status': 'ok', 'totalResults': len(articles), 'articles': articles}
+
+
+@pytest.fixture(autouse=True)
+def _isolated(monkeypatch):
+    monkeypatch.setattr(newsapi_helpers._newsapi_rate_limiter, "min_interval_seconds", 0)
+    monkeypatch.setattr(newsapi_quota, "_ledger", newsapi_quota.QuotaLedger(None, 100))
+
+
+def test_failed_analysis_keeps_new_articles_pending_until_a_retry_succeeds(monkeypatch):
+    replies = iter([(None, "Gemini unavailable"), ({'overall_sentiment': "Positive", 'sentiment_score_llm': 0.5}, None)])
+    analyzed = []
+
+    def _analyze(key, articles, *args, **kwargs):
+        analyzed.append(sorted(a.uri for a in articles))
+        return next(replies)
+    monkeypatch.setattr(gemini_utils, "analyze_news_with_gemini", _analyze)
+    monitor = WatchlistMonitor({"Acme Bank": "Banking"}, SECTORS, ["India"])
+
+    monitor.poll(FakeClient(), "key")
+    entry = monitor._stocks["Acme Bank"]
+    assert entry['articles'] == [] and entry['last_published_at'] is None and len(entry['pending']) == 2
+
+    # The second poll sees no unseen articles, but still retries the pending ones
+    monitor.poll(FakeClient(), "key")
+    assert analyzed == [["https://example.com/0", "https://example.com/1"]] * 2
+    assert len(entry['articles']) == 2 and entry['pending'] == []
+    assert entry['last_published_at'] == "2026-10-11T09:00:00Z" and entry['analysis']['overall_sentiment'] == "Positive"
+    assert monitor.snapshot()['stocks']["Acme Bank"]['num_pending'] == 0
@@ -0,0 +1,93 @@
+# utils/analysis_merge.py
+import json
+
+MERGED_LIST_LIMITS = {
+    "key_themes": 5,
+    "key_companies_mentioned_context": 10,
+    "risks_identified": 4,
+    "opportunities_identified": 4,
+}
+
+# Same ranges the prompt asks the model to use for "overall_sentiment"
+_SENTIMENT_LABEL_FLOORS = (
+    (0.6, "Strongly Positive"), (0.2, "Positive"), (-0.19, "Neutral"), (-0.59, "Negative"),
+)
+
+
+def chunk_texts(texts, max_chars_per_chunk, max_chunks):
+    """
+    Greedily packs article texts into chunks of at most `max_chars_per_chunk` characters, in order.
+    An article longer than a whole chunk is cut to fit. Returns (chunks, dropped_count), where
+    dropped_count is the number of articles that did not fit into `max_chunks` chunks.
+    """
+    chunks = []; current = []; current_chars = 0
+    for index, text in enumerate(texts):
+        text = text[:max_chars_per_chunk]
+        if current and current_chars + len(text) > max_chars_per_chunk:
+            chunks.append(current)
+            if len(chunks) >= max_chunks:
+                return chunks, len(texts) - index
+            current = []; current_chars = 0
+        current.append(text); current_chars += len(text)
+    if current:
+        chunks.append(current)
+    return chunks, 0
+
+
+def sentiment_label_for_score(score):
+    for floor, label in _SENTIMENT_LABEL_FLOORS:
+        if score >= floor:
+            return label
+    return "Strongly Negative"
+
+
+def _dedup_key(item):
+    if isinstance(item, dict):
+        name = item.get("name") or item.get("company") or item.get("entity")
+        if isinstance(name, str):
+            return name.strip().lower()
+        return json.dumps(item, sort_keys=True).lower()
+    return str(item).strip().lower().rstrip('.')
+
+
+def _merge_lists(lists, limit):
+    # Round-robin over the (weight-ordered) partials so every chunk gets a say before the cap
+    merged = []; seen = set()
+    for position in range(max((len(l) for l in lists), default=0)):
+        for items in lists:
+            if position >= len(items):
+                continue
+            key = _dedup_key(items[position])
+            if key and key not in seen:
+                seen.add(key); merged.append(items[position])
+    return merged[:limit]
+
+
+def merge_partial_results(partials):
+    """
+    Merges per-chunk analyses [(result_dict, article_count), ...] into one result with the same schema.
+    The score is the article-count-weighted mean and the label is re-derived from it; text fields
+    come from the heaviest chunks; list fields are de-duplicated (case-insensitive) and capped.
+    """
+    partials = sorted(partials, key=lambda p: p[1], reverse=True)
+    total_weight = sum(weight for _, weight in partials) or 1
+    score = sum(float(result.get("sentiment_score_llm", 0.0)) * weight for result, weight in partials) / total_weight
+    score = round(max(-1.0, min(1.0, score)), 3)
+
+    heaviest = partials[0][0]
+    summaries = []
+    for result, _ in partials:
+        summary = str(result.get("summary", "")).strip()
+        if summary and summary != "N/A" and summary not in summaries:
+            summaries.append(summary)
+
+    merged = {
+        "summary": " ".join(summaries[:2]) or heaviest.get("summary", "N/A"),
+        "overall_sentiment": sentiment_label_for_score(score),
+        "sentiment_score_llm": score,
+        "sentiment_reason": heaviest.get("sentiment_reason", "N/A"),
+        "potential_impact": heaviest.get("potential_impact", "N/A"),
+    }
+    for key, limit in MERGED_LIST_LIMITS.items():
+        merged[key] = _merge_lists([result.get(key) or [] for result, _ in partials], limit)
+    return merged
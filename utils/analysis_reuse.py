@@ -0,0 +1,126 @@
+# utils/analysis_reuse.py
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from .article import Article, compute_content_hash
+
+REUSE_ENABLED = False # Opt-in: a reused analysis is labelled stale instead of re-asked
+REUSE_MAX_ARTICLE_CHANGE = 0.2 # Jaccard distance between the old and new content-hash sets
+REUSE_MAX_VADER_MEAN_SHIFT = 0.1
+REUSE_MAX_VADER_DISTRIBUTION_SHIFT = 0.2 # Total variation distance between VADER histograms
+REUSE_MAX_AGE_SECONDS = 6 * 3600
+REUSE_CACHE_MAX_ENTRIES = 1024
+
+_VADER_BIN_EDGES = (-0.5, -0.05, 0.05, 0.5) # Strong neg / neg / neutral / pos / strong pos
+
+
+def _vader_histogram(scores):
+    counts = [0] * (len(_VADER_BIN_EDGES) + 1)
+    for score in scores:
+        counts[sum(1 for edge in _VADER_BIN_EDGES if score >= edge)] += 1
+    total = len(scores) or 1
+    return [c / total for c in counts]
+
+
+def fingerprint(articles):
+    """(frozenset of content hashes, list of VADER scores) for Article objects or plain strings."""
+    hashes = []; scores = []
+    for item in articles:
+        if isinstance(item, Article):
+            hashes.append(item.content_hash); scores.append(item.vader_score)
+        else:
+            hashes.append(compute_content_hash(item))
+    return frozenset(hashes), scores
+
+
+def describe_change(previous, current):
+    """Returns (article_change, vader_mean_shift, vader_distribution_shift) between two fingerprints."""
+    (prev_hashes, prev_scores), (hashes, scores) = previous, current
+    union = prev_hashes | hashes
+    article_change = 1 - len(prev_hashes & hashes) / len(union) if union else 0.0
+    if not prev_scores or not scores:
+        return article_change, 0.0, 0.0
+    mean_shift = abs(sum(scores) / len(scores) - sum(prev_scores) / len(prev_scores))
+    distribution_shift = 0.5 * sum(abs(a - b) for a, b in zip(_vader_histogram(prev_scores), _vader_histogram(scores)))
+    return article_change, mean_shift, distribution_shift
+
+
+class AnalysisReuseCache:
+    """Last successful LLM analysis per target, with the fingerprint of the articles it was based on."""
+
+    def __init__(self, max_entries=REUSE_CACHE_MAX_ENTRIES):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._max_entries = max_entries
+
+    def get_entry(self, key):
+        """The stored entry for `key` as a dict (fingerprint, result, created, delta_generation, last_full_at), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return dict(entry) if entry is not None else None
+
+    def lookup(self, key, current_fingerprint):
+        """Returns (previous_result, change_tuple) when the change is below every threshold, else (None, change_tuple)."""
+        entry = self.get_entry(key)
+        if entry is None:
+            return None, None
+        change = describe_change(entry['fingerprint'], current_fingerprint)
+        if time.time() - entry['created'] > REUSE_MAX_AGE_SECONDS:
+            return None, change
+        article_change, mean_shift, distribution_shift = change
+        if (article_change <= REUSE_MAX_ARTICLE_CHANGE and mean_shift <= REUSE_MAX_VADER_MEAN_SHIFT
+                and distribution_shift <= REUSE_MAX_VADER_DISTRIBUTION_SHIFT):
+            return entry['result'], change
+        return None, change
+
+    def store(self, key, current_fingerprint, result, delta_generation=0, last_full_at=None):
+        """delta_generation counts incremental updates since the last full analysis (0 = full)."""
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                'fingerprint': current_fingerprint, 'result': result, 'created': now,
+                'delta_generation': delta_generation, 'last_full_at': last_full_at or now,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+reuse_cache = AnalysisReuseCache()
+
+
+def window_key(date_range_str):
+    """
+    The analysis window's length in days for "YYYY-MM-DD to YYYY-MM-DD" (the raw string otherwise).
+    Part of the reuse key, so a 3-day analysis never answers a 14-day request while a sliding
+    window of the same length still finds its predecessor.
+    """
+    try:
+        start, end = (datetime.strptime(part.strip(), '%Y-%m-%d') for part in date_range_str.split(" to "))
+        return f"{(end - start).days + 1}d"
+    except (AttributeError, ValueError):
+        return date_range_str or ""
+
+
+def configure_reuse(enabled, max_article_change=REUSE_MAX_ARTICLE_CHANGE, max_age_seconds=REUSE_MAX_AGE_SECONDS):
+    global REUSE_ENABLED, REUSE_MAX_ARTICLE_CHANGE, REUSE_MAX_AGE_SECONDS
+    REUSE_ENABLED, REUSE_MAX_ARTICLE_CHANGE, REUSE_MAX_AGE_SECONDS = enabled, max_article_change, max_age_seconds
+
+
+def label_fresh(result):
+    labelled = dict(result)
+    labelled['analysis_freshness'] = 'fresh'
+    labelled['analysis_generated_at'] = datetime.now().isoformat(timespec='seconds')
+    return labelled
+
+
+def label_stale(result, change):
+    labelled = dict(result)
+    labelled['analysis_freshness'] = 'stale_but_valid'
+    labelled['analysis_article_change'] = round(change[0], 3)
+    return labelled
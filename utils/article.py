@@ -0,0 +1,66 @@
+# utils/article.py
+import hashlib
+import sys
+
+
+def compute_content_hash(content):
+    """Short, stable hash of the article text; used as the article's identity in caches."""
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class Article:
+    """
+    One processed NewsAPI article as it moves through fetch -> VADER -> ranking -> caches -> prompt.
+    __slots__ avoids a per-instance dict, and the highly repetitive source names and dates are
+    interned so thousands of cached articles share one copy of each.
+    """
+    __slots__ = ('content', 'date', 'uri', 'source', 'vader_score', 'content_hash')
+
+    def __init__(self, content, date, uri, source, vader_score, content_hash=None):
+        self.content = content
+        self.date = sys.intern(date)
+        self.uri = uri
+        self.source = sys.intern(source)
+        self.vader_score = vader_score
+        self.content_hash = content_hash or compute_content_hash(content)
+
+    def to_dict(self):
+        return {
+            'content': self.content, 'date': self.date, 'uri': self.uri, 'source': self.source,
+            'vader_score': self.vader_score, 'content_hash': self.content_hash,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['content'], data.get('date', ''), data.get('uri', ''), data.get('source', 'N/A'),
+            data.get('vader_score', 0.0), data.get('content_hash')
+        )
+
+    def __repr__(self):
+        return f"Article({self.content_hash}, {self.date}, {self.source!r}, {self.content[:40]!r})"
+
+
+class CorpusArticle(Article):
+    """
+    An Article whose text lives in the memory-mapped TextCorpus (see text_corpus.py): `content`
+    is decoded from the shared pages on every access and never kept on the instance, so code that
+    reads it repeatedly should work on text_corpus.materialize_articles() copies instead.
+    """
+    __slots__ = ('corpus',)
+
+    def __init__(self, corpus, content_hash, date, uri, source, vader_score):
+        self.corpus = corpus
+        self.date = sys.intern(date)
+        self.uri = uri
+        self.source = sys.intern(source)
+        self.vader_score = vader_score
+        self.content_hash = content_hash
+
+    @property
+    def content(self):
+        return self.corpus.text(self.content_hash) or ""
+
+    def content_view(self):
+        """Zero-copy memoryview of the UTF-8 text in the corpus mapping."""
+        return self.corpus.view(self.content_hash)
@@ -0,0 +1,111 @@
+# utils/article_scores.py
+import math
+import threading
+import time
+from collections import OrderedDict
+from .analysis_merge import sentiment_label_for_score
+
+ARTICLE_SCORING_ENABLED = False # Opt-in: per-article Gemini scores aggregated locally instead of one analysis per target
+ARTICLE_SCORE_BATCH_SIZE = 20 # Articles per Gemini call
+ARTICLE_SCORE_MAX_CHARS = 600 # Per article in the scoring prompt
+ARTICLE_SCORE_MAX_WORKERS = 4
+ARTICLE_SCORE_CACHE_MAX_ENTRIES = 20000
+ARTICLE_SCORE_MAX_AGE_SECONDS = 7 * 24 * 3600
+ARTICLE_SCORE_WAIT_SECONDS = 120 # How long a caller waits for another thread's in-flight batch
+
+AGGREGATE_TOP_RATIONALES = 3
+
+
+class ArticleScoreCache:
+    """
+    Per-article score entries ({'score', 'label', 'rationale', 'created'}) keyed by content hash,
+    with single-flight claims: a hash being scored by one thread is waited for, not re-sent,
+    so an article shared by a sector and several stocks costs one scoring slot.
+    """
+
+    def __init__(self, max_entries=ARTICLE_SCORE_CACHE_MAX_ENTRIES):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._max_entries = max_entries
+        self.stats = {'hits': 0, 'misses': 0, 'waited': 0, 'scored': 0}
+
+    def claim(self, content_hashes):
+        """
+        Splits hashes into (cached {hash: entry}, claimed [hash], in_flight {hash: event}).
+        The caller must score the claimed hashes and then call fulfil() (also on failure).
+        """
+        cached = {}; claimed = []; in_flight = {}
+        now = time.time()
+        with self._lock:
+            for content_hash in dict.fromkeys(content_hashes):
+                entry = self._entries.get(content_hash)
+                if entry is not None and now - entry['created'] <= ARTICLE_SCORE_MAX_AGE_SECONDS:
+                    self._entries.move_to_end(content_hash)
+                    cached[content_hash] = entry; self.stats['hits'] += 1
+                elif content_hash in self._pending:
+                    in_flight[content_hash] = self._pending[content_hash]; self.stats['waited'] += 1
+                else:
+                    self._pending[content_hash] = threading.Event()
+                    claimed.append(content_hash); self.stats['misses'] += 1
+        return cached, claimed, in_flight
+
+    def fulfil(self, content_hashes, scores):
+        """Stores the scores for claimed hashes (missing ones stay unscored) and releases their waiters."""
+        now = time.time()
+        with self._lock:
+            for content_hash in content_hashes:
+                score = scores.get(content_hash)
+                if score is not None:
+                    self._entries[content_hash] = dict(score, created=now)
+                    self._entries.move_to_end(content_hash)
+                    self.stats['scored'] += 1
+                event = self._pending.pop(content_hash, None)
+                if event is not None:
+                    event.set()
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, content_hash):
+        with self._lock:
+            return self._entries.get(content_hash)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), in_flight=len(self._pending))
+
+
+article_score_cache = ArticleScoreCache()
+
+
+def configure_article_scoring(enabled, batch_size=ARTICLE_SCORE_BATCH_SIZE, max_workers=ARTICLE_SCORE_MAX_WORKERS):
+    global ARTICLE_SCORING_ENABLED, ARTICLE_SCORE_BATCH_SIZE, ARTICLE_SCORE_MAX_WORKERS
+    ARTICLE_SCORING_ENABLED, ARTICLE_SCORE_BATCH_SIZE, ARTICLE_SCORE_MAX_WORKERS = enabled, max(1, batch_size), max(1, max_workers)
+
+
+def aggregate_article_scores(target_name, scored_articles):
+    """
+    Builds a target analysis (the usual result schema) from per-article scores, locally.
+    scored_articles: [(content_hash, entry)] in ranking order. The score is the mean, the label is
+    re-derived from it, and the text fields quote the strongest article rationales.
+    """
+    scores = [entry['score'] for _, entry in scored_articles]
+    mean = sum(scores) / len(scores)
+    spread = math.sqrt(sum((s - mean) ** 2 for s in scores) / len(scores))
+    positive = sorted((item for item in scored_articles if item[1]['score'] >= 0.2), key=lambda item: -item[1]['score'])
+    negative = sorted((item for item in scored_articles if item[1]['score'] <= -0.2), key=lambda item: item[1]['score'])
+    strongest = max(scored_articles, key=lambda item: abs(item[1]['score']))
+    mean = round(max(-1.0, min(1.0, mean)), 3)
+    return {
+        "summary": (f"{len(scores)} article(s) scored individually for {target_name}: {len(positive)} positive, "
+                    f"{len(negative)} negative, {len(scores) - len(positive) - len(negative)} neutral."),
+        "overall_sentiment": sentiment_label_for_score(mean),
+        "sentiment_score_llm": mean,
+        "sentiment_reason": strongest[1].get('rationale') or "N/A",
+        "key_themes": [],
+        "potential_impact": "N/A",
+        "key_companies_mentioned_context": [],
+        "risks_identified": [entry.get('rationale') for _, entry in negative[:AGGREGATE_TOP_RATIONALES] if entry.get('rationale')],
+        "opportunities_identified": [entry.get('rationale') for _, entry in positive[:AGGREGATE_TOP_RATIONALES] if entry.get('rationale')],
+        "article_score_dispersion": round(spread, 3),
+    }
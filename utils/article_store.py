@@ -0,0 +1,260 @@
+# utils/article_store.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from . import text_corpus
+from .article import Article, CorpusArticle
+
+logger = logging.getLogger(__name__)
+
+ARTICLE_STORE_PATH = "data/articles.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    content_hash TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    day TEXT NOT NULL,
+    published_at TEXT,
+    uri TEXT,
+    source TEXT,
+    vader_score REAL,
+    first_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_articles_day ON articles(day);
+CREATE INDEX IF NOT EXISTS ix_articles_unscored ON articles(content_hash) WHERE vader_score IS NULL;
+CREATE TABLE IF NOT EXISTS target_articles (
+    target_type TEXT NOT NULL,
+    target_name TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    day TEXT NOT NULL,
+    PRIMARY KEY (target_type, target_name, content_hash)
+);
+CREATE INDEX IF NOT EXISTS ix_target_articles_day ON target_articles(target_type, target_name, day);
+CREATE TABLE IF NOT EXISTS analyses (
+    analysis_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    target_type TEXT NOT NULL,
+    target_name TEXT NOT NULL,
+    sector_name TEXT,
+    day TEXT NOT NULL,
+    run_id TEXT,
+    created REAL NOT NULL,
+    num_articles INTEGER NOT NULL DEFAULT 0,
+    avg_vader_score REAL,
+    llm_label TEXT,
+    llm_score REAL,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_analyses_target_day ON analyses(target_type, target_name, day);
+"""
+
+
+class ArticleStore:
+    """
+    SQLite-backed store of processed articles and the targets (sectors/stocks) they belong to.
+    Articles are keyed by content hash, so one article linked to a sector and several stocks is
+    stored once. WAL mode lets the web app, CLI jobs and worker processes share one file.
+    vader_score may be NULL for articles whose scoring has not finished yet (see unscored()).
+    With a text corpus configured, article text goes to the corpus and the content column stays
+    empty; reads then hand out CorpusArticle objects backed by the shared mapping.
+    """
+
+    def __init__(self, path=ARTICLE_STORE_PATH):
+        self.path = path
+        if path != ":memory:":
+            directory = os.path.dirname(path)
+            if directory: os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._in_transaction = False
+
+    @contextmanager
+    def transaction(self):
+        """Groups writes atomically; nested use joins the outer transaction."""
+        with self._lock:
+            if self._in_transaction:
+                yield self._conn
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._in_transaction = True
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            finally:
+                self._in_transaction = False
+
+    def executescript(self, script):
+        """For modules keeping their own tables in the store's file (CREATE ... IF NOT EXISTS)."""
+        with self._lock:
+            self._conn.executescript(script)
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def iter_query(self, sql, params=(), chunk_size=1000):
+        """
+        Yields result rows in chunks of `chunk_size` lists, without materializing the whole result.
+        File-backed stores read through their own connection (a WAL snapshot), so writers are not
+        held up while the caller works through the chunks; an in-memory store holds the lock throughout.
+        """
+        if self.path == ":memory:":
+            with self._lock:
+                yield from self._iter_cursor(self._conn.execute(sql, params), chunk_size)
+            return
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        try:
+            yield from self._iter_cursor(conn.execute(sql, params), chunk_size)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _iter_cursor(cursor, chunk_size):
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+    def add_articles(self, target_type, target_name, articles, published_at=None):
+        """
+        Inserts Article objects (skipping known content hashes) and links them to the target.
+        `published_at` optionally maps content_hash -> full ISO timestamp. Returns the number of new articles.
+        """
+        now = time.time(); published_at = published_at or {}
+        articles = list(articles)
+        corpus = text_corpus.get_corpus()
+        if corpus is not None:
+            corpus.append_many((art.content_hash, art.content) for art in articles if not isinstance(art, CorpusArticle))
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO articles (content_hash, content, day, published_at, uri, source, vader_score, first_seen) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(art.content_hash, "" if corpus is not None else art.content, art.date, published_at.get(art.content_hash), art.uri, art.source, art.vader_score, now)
+                 for art in articles]
+            )
+            inserted = conn.total_changes - before
+            conn.executemany(
+                "INSERT OR IGNORE INTO target_articles (target_type, target_name, content_hash, day) VALUES (?, ?, ?, ?)",
+                [(target_type, target_name, art.content_hash, art.date) for art in articles]
+            )
+        return inserted
+
+    def set_vader_scores(self, scores):
+        """scores: iterable of (content_hash, vader_score)."""
+        with self.transaction() as conn:
+            conn.executemany("UPDATE articles SET vader_score = ? WHERE content_hash = ?", [(score, h) for h, score in scores])
+
+    def unscored(self, limit=1000):
+        """(content_hash, content) pairs still waiting for a VADER score."""
+        rows = self.execute("SELECT content_hash, content FROM articles WHERE vader_score IS NULL LIMIT ?", (limit,))
+        return self._with_text(rows)
+
+    def iter_unscored(self, chunk_size=1000):
+        """Yields every unscored (content_hash, content) pair in rowid-bounded chunks; the lock is held per chunk only."""
+        last_rowid = 0
+        while True:
+            rows = self.execute(
+                "SELECT rowid, content_hash, content FROM articles WHERE vader_score IS NULL AND rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, chunk_size)
+            )
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield self._with_text([(content_hash, content) for _, content_hash, content in rows])
+
+    def _with_text(self, rows):
+        corpus = text_corpus.get_corpus()
+        if corpus is None:
+            return rows
+        return [(content_hash, content or corpus.text(content_hash) or "") for content_hash, content in rows]
+
+    def add_analysis(self, target_type, target_name, day, analysis, avg_vader_score=None, num_articles=0,
+                     sector_name=None, run_id=None, error=None):
+        """Records one target's analysis for `day` (analysis may be None when only an error is known)."""
+        analysis = analysis or {}
+        llm_score = analysis.get('sentiment_score_llm')
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO analyses (target_type, target_name, sector_name, day, run_id, created, num_articles, avg_vader_score, "
+                "llm_label, llm_score, error, result) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (target_type, target_name, sector_name, day, run_id, time.time(), num_articles, avg_vader_score,
+                 analysis.get('overall_sentiment'), float(llm_score) if isinstance(llm_score, (int, float)) else None,
+                 error, json.dumps(analysis) if analysis else None)
+            )
+
+    def articles_for_target(self, target_type, target_name, from_day=None, to_day=None):
+        rows = self.execute(
+            "SELECT a.content, a.day, a.uri, a.source, a.vader_score, a.content_hash FROM target_articles t "
+            "JOIN articles a ON a.content_hash = t.content_hash "
+            "WHERE t.target_type = ? AND t.target_name = ? AND t.day >= ? AND t.day <= ? ORDER BY t.day DESC",
+            (target_type, target_name, from_day or "", to_day or "9999-12-31")
+        )
+        return self._to_articles(rows)
+
+    def articles_by_hash(self, content_hashes):
+        """Article objects for the given content hashes, in that order (unknown hashes are skipped)."""
+        content_hashes = list(content_hashes)
+        rows = []
+        for start in range(0, len(content_hashes), 500): # Stays under SQLite's bound-parameter limit
+            chunk = content_hashes[start:start + 500]
+            rows += self.execute(
+                "SELECT content, day, uri, source, vader_score, content_hash FROM articles "
+                f"WHERE content_hash IN ({', '.join('?' * len(chunk))})", chunk
+            )
+        order = {content_hash: index for index, content_hash in enumerate(content_hashes)}
+        return self._to_articles(sorted(rows, key=lambda row: order[row[5]]))
+
+    def _to_articles(self, rows):
+        # rows: (content, day, uri, source, vader_score, content_hash); empty content means the text is in the corpus
+        corpus = text_corpus.get_corpus()
+        return [CorpusArticle(corpus, content_hash, day, uri or '', source or 'N/A', vader if vader is not None else 0.0)
+                if corpus is not None and not content else
+                Article(content, day, uri or '', source or 'N/A', vader if vader is not None else 0.0, content_hash)
+                for content, day, uri, source, vader, content_hash in rows]
+
+    def stats(self):
+        (articles, unscored), = self.execute("SELECT COUNT(*), COUNT(*) - COUNT(vader_score) FROM articles")
+        (targets,), = self.execute("SELECT COUNT(DISTINCT target_type || ':' || target_name) FROM target_articles")
+        (analyses,), = self.execute("SELECT COUNT(*) FROM analyses")
+        stats = {'articles': articles, 'unscored_articles': unscored, 'targets': targets, 'analyses': analyses}
+        corpus = text_corpus.get_corpus()
+        if corpus is not None:
+            stats['text_corpus'] = corpus.stats()
+        return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def configure_store(path):
+    global _store, ARTICLE_STORE_PATH
+    with _store_lock:
+        ARTICLE_STORE_PATH = path
+        _store = None
+    return get_store()
+
+
+def get_store():
+    """The process-wide store, opened lazily at ARTICLE_STORE_PATH."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArticleStore(ARTICLE_STORE_PATH)
+        return _store
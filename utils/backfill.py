@@ -0,0 +1,319 @@
+# utils/backfill.py
+import json
+import logging
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from . import newsapi_helpers, newsapi_quota
+from .article import Article
+from .log_utils import make_log_func
+from .rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from .sentiment_analyzer import get_vader_sentiment_score
+
+logger = logging.getLogger(__name__)
+
+NEWSAPI_WINDOW_DAYS = 29 # Same lookback limit the routes apply
+BACKFILL_PAGE_SIZE = 100 # Developer tier: page 1 at size 100 is the deepest a single query can go
+VADER_BATCH_SIZE = 200
+VADER_WORKERS = 2
+BACKFILL_MAX_ATTEMPTS = 3 # A unit whose fetch fails this many times is marked 'failed' and skipped
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+_CHECKPOINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS backfill_units (
+    unit_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    targets TEXT NOT NULL,
+    query TEXT NOT NULL,
+    from_ts TEXT NOT NULL,
+    to_ts TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    est_calls INTEGER NOT NULL DEFAULT 1,
+    total_results INTEGER,
+    articles_added INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS ix_backfill_pending ON backfill_units(run_name, status, to_ts);
+"""
+
+
+def _format_ts(dt):
+    return dt.strftime(TIMESTAMP_FORMAT)
+
+
+def _parse_ts(value):
+    return datetime.strptime(value, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+
+
+def _window_start(now=None):
+    now = now or datetime.now(timezone.utc)
+    return (now - timedelta(days=NEWSAPI_WINDOW_DAYS)).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+
+
+def plan_backfill_queries(sectors_config, country_keywords_list, sector_names=None):
+    """
+    One query per sector plus the sectors' stocks packed into shared queries (plan_packed_stock_queries).
+    Returns [(kind, targets, query)] where targets is {"sector": name} or {"stocks": {stock: sector}}.
+    """
+    queries = []
+    stock_keywords_map = {}; stock_sector = {}
+    for sector_name, sector_config in sectors_config.items():
+        if sector_names and sector_name not in sector_names:
+            continue
+        query = newsapi_helpers.build_newsapi_query(sector_config.get("newsapi_keywords", [sector_name]), country_keywords_list)
+        if query:
+            queries.append(("sector", {"sector": sector_name}, query))
+        for stock_name, keywords in sector_config.get("stocks", {}).items():
+            stock_keywords_map.setdefault(stock_name, keywords)
+            stock_sector.setdefault(stock_name, sector_name)
+    for pack_stocks, query in newsapi_helpers.plan_packed_stock_queries(stock_keywords_map, country_keywords_list):
+        queries.append(("pack", {"stocks": {stock_name: stock_sector[stock_name] for stock_name in pack_stocks}}, query))
+    return queries
+
+
+def _unit_sectors(targets):
+    """Sectors a unit fetches for: its sector, or the sectors of the stocks in its pack."""
+    return {targets["sector"]} if "sector" in targets else set(targets["stocks"].values())
+
+
+def _score_batch(items):
+    # Runs in a worker process
+    return [(content_hash, get_vader_sentiment_score(content)) for content_hash, content in items]
+
+
+class BackfillRun:
+    """
+    Resumable ingestion of the NewsAPI window into the article store.
+
+    Each query is walked backwards in time: a call fetches the newest BACKFILL_PAGE_SIZE articles
+    in [from, to] (sorted by publishedAt), and if more remain, a continuation unit [from, oldest
+    publishedAt seen] is queued. That is ceil(results / page size) calls per query, the minimum the
+    developer tier's 100-result depth allows. Articles, target links and the unit's checkpoint
+    (done + continuation) are written in one transaction, so an interrupted run resumes exactly
+    at the first unfinished unit. VADER scores are computed in a process pool and written back
+    as batches finish; articles left unscored by an interruption are picked up on the next run.
+    With `sector_names`, only units covering one of those sectors are processed; the rest of the
+    run's plan stays pending for a later, unrestricted resume.
+    """
+
+    def __init__(self, store, newsapi_client, sectors_config, run_name="default", priority=PRIORITY_BACKGROUND, append_log_func=None,
+                 sector_names=None):
+        self.store = store
+        self.client = newsapi_client
+        self.sectors_config = sectors_config
+        self.run_name = run_name
+        self.priority = priority
+        self.sector_names = set(sector_names) if sector_names else None
+        self._log = make_log_func(logger, f"[Backfill:{run_name}]", append_log_func)
+        self.store.executescript(_CHECKPOINT_SCHEMA)
+        columns = {row[1] for row in self.store.execute("PRAGMA table_info(backfill_units)")}
+        for column, definition in (("attempts", "INTEGER NOT NULL DEFAULT 0"), ("last_error", "TEXT")):
+            if column not in columns: # Checkpoints written before failures were tracked
+                self.store.execute(f"ALTER TABLE backfill_units ADD COLUMN {column} {definition}")
+        self._alias_patterns = {}
+        self._submitted = set() # Content hashes already handed to the VADER pool this run
+
+    def initialize(self, queries, now=None):
+        """Queues one unit per query for the whole window; a no-op if this run already has units."""
+        (existing,), = self.store.execute("SELECT COUNT(*) FROM backfill_units WHERE run_name = ?", (self.run_name,))
+        if existing:
+            return 0
+        now = now or datetime.now(timezone.utc)
+        from_ts, to_ts = _format_ts(_window_start(now)), _format_ts(now)
+        with self.store.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO backfill_units (run_name, kind, targets, query, from_ts, to_ts, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(self.run_name, kind, json.dumps(targets), query, from_ts, to_ts, time.time()) for kind, targets, query in queries]
+            )
+        return len(queries)
+
+    def planned_sectors(self):
+        """Every sector this run's units cover, whatever their status."""
+        sectors = set()
+        for (targets_json,) in self.store.execute("SELECT DISTINCT targets FROM backfill_units WHERE run_name = ?", (self.run_name,)):
+            sectors |= _unit_sectors(json.loads(targets_json))
+        return sectors
+
+    def _expire_old_units(self, now=None):
+        # The NewsAPI window slides; what fell out of it can no longer be fetched
+        earliest = _format_ts(_window_start(now))
+        with self.store.transaction() as conn:
+            expired = conn.execute(
+                "UPDATE backfill_units SET status = 'expired', updated = ? WHERE run_name = ? AND status = 'pending' AND to_ts <= ?",
+                (time.time(), self.run_name, earliest)
+            ).rowcount
+            conn.execute(
+                "UPDATE backfill_units SET from_ts = ? WHERE run_name = ? AND status = 'pending' AND from_ts < ?",
+                (earliest, self.run_name, earliest)
+            )
+        if expired:
+            self._log("%d backfill unit(s) fell out of the NewsAPI window and were skipped.", 'warning', expired)
+
+    def status(self):
+        rows = self.store.execute(
+            "SELECT status, COUNT(*), COALESCE(SUM(est_calls), 0), COALESCE(SUM(articles_added), 0) FROM backfill_units WHERE run_name = ? GROUP BY status",
+            (self.run_name,)
+        )
+        summary = {'pending_units': 0, 'done_units': 0, 'expired_units': 0, 'failed_units': 0, 'estimated_calls_left': 0, 'articles_added': 0}
+        for status, units, est_calls, added in rows:
+            summary[f'{status}_units'] = units
+            summary['articles_added'] += added
+            if status == 'pending':
+                summary['estimated_calls_left'] = est_calls
+        ledger = newsapi_quota.get_ledger()
+        calls_per_day = ledger.daily_limit * ((1 - newsapi_quota.BACKGROUND_RESERVE_FRACTION) if self.priority > PRIORITY_INTERACTIVE else 1)
+        summary['estimated_days_left'] = math.ceil(summary['estimated_calls_left'] / max(calls_per_day, 1))
+        summary.update(self.store.stats())
+        return summary
+
+    def _next_unit(self):
+        # Units closest to their window start first: each query is driven to its oldest articles before they age out.
+        # Units that failed before go behind the ones that have not, so one bad unit cannot hold up the rest.
+        # A sector filter is applied here rather than in SQL, since pack units list their sectors per stock;
+        # a run has at most a few hundred pending units.
+        rows = self.store.execute(
+            "SELECT unit_id, kind, targets, query, from_ts, to_ts FROM backfill_units "
+            "WHERE run_name = ? AND status = 'pending' ORDER BY attempts ASC, to_ts ASC, unit_id ASC"
+            + (" LIMIT 1" if self.sector_names is None else ""),
+            (self.run_name,)
+        )
+        if self.sector_names is not None:
+            rows = [unit for unit in rows if _unit_sectors(json.loads(unit[2])) & self.sector_names]
+        return rows[0] if rows else None
+
+    def _stock_patterns(self, stocks):
+        missing = {s: self.sectors_config.get(sector, {}).get("stocks", {}).get(s, [s]) for s, sector in stocks.items() if s not in self._alias_patterns}
+        if missing:
+            self._alias_patterns.update(newsapi_helpers.build_alias_patterns(missing))
+        return {s: self._alias_patterns[s] for s in stocks}
+
+    def _links(self, kind, targets, articles):
+        """[(target_type, target_name, [articles])] for one unit's articles."""
+        if kind == "sector":
+            return [("sector", targets["sector"], articles)]
+        buckets = newsapi_helpers.tag_articles_by_alias(articles, self._stock_patterns(targets["stocks"]))
+        return [("stock", stock_name, tagged) for stock_name, tagged in buckets.items() if tagged]
+
+    def _record_failure(self, unit, error):
+        """Counts a failed fetch against the unit; after BACKFILL_MAX_ATTEMPTS it is marked 'failed'."""
+        unit_id = unit[0]
+        with self.store.transaction() as conn:
+            conn.execute(
+                "UPDATE backfill_units SET attempts = attempts + 1, last_error = ?, updated = ?, "
+                "status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE status END WHERE unit_id = ?",
+                (str(error)[:500], time.time(), BACKFILL_MAX_ATTEMPTS, unit_id)
+            )
+            (attempts, status), = conn.execute("SELECT attempts, status FROM backfill_units WHERE unit_id = ?", (unit_id,)).fetchall()
+        if status == 'failed':
+            self._log("Unit %d failed %d time(s) and is skipped: %s", 'error', unit_id, attempts, str(error)[:200])
+        else:
+            self._log("Unit %d failed (attempt %d of %d), will retry: %s", 'warning', unit_id, attempts, BACKFILL_MAX_ATTEMPTS, str(error)[:200])
+
+    def _fetch_unit(self, unit):
+        unit_id, kind, targets_json, query, from_ts, to_ts = unit
+        api_key = newsapi_quota.client_api_key(self.client)
+        ledger = newsapi_quota.get_ledger()
+        if not ledger.reserve(api_key, self.priority):
+            return None
+        newsapi_helpers.acquire_call_slot(self.priority)
+        response = self.client.get_everything(
+            q=query, from_param=from_ts, to=to_ts, language='en', sort_by='publishedAt', page_size=BACKFILL_PAGE_SIZE, page=1
+        )
+        if response.get('status') != 'ok':
+            raise RuntimeError(f"NewsAPI error for backfill unit {unit_id}: {response.get('message')} ({response.get('code')})")
+
+        raw_articles = response.get('articles') or []
+        articles = []; published_at = {}; oldest = None
+        for raw in raw_articles:
+            stamp = raw.get('publishedAt') or ''
+            if stamp and (oldest is None or stamp < oldest): oldest = stamp
+            content = newsapi_helpers.extract_article_content(raw)
+            if not content:
+                continue
+            art = Article(content, (stamp or from_ts).split('T')[0], raw.get('url') or '', (raw.get('source') or {}).get('name') or 'N/A', None)
+            articles.append(art); published_at[art.content_hash] = stamp
+
+        total_results = response.get('totalResults', 0) or 0
+        targets = json.loads(targets_json)
+        to_score = {}
+        with self.store.transaction() as conn:
+            added = 0
+            for target_type, target_name, linked in self._links(kind, targets, articles):
+                added += self.store.add_articles(target_type, target_name, linked, published_at)
+                # Pack articles that matched no stock alias are not stored, so only linked ones get scored
+                to_score.update((art.content_hash, art.content) for art in linked if art.content_hash not in self._submitted)
+            conn.execute(
+                "UPDATE backfill_units SET status = 'done', total_results = ?, articles_added = ?, est_calls = 0, updated = ? WHERE unit_id = ?",
+                (total_results, added, time.time(), unit_id)
+            )
+            if len(raw_articles) >= BACKFILL_PAGE_SIZE and total_results > len(raw_articles) and oldest:
+                continuation_to = _format_ts(_parse_ts(oldest[:19] + 'Z'))
+                if continuation_to >= to_ts: # 100 articles share one timestamp; step past it
+                    continuation_to = _format_ts(_parse_ts(to_ts) - timedelta(seconds=1))
+                if continuation_to > from_ts:
+                    conn.execute(
+                        "INSERT INTO backfill_units (run_name, kind, targets, query, from_ts, to_ts, est_calls, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (self.run_name, kind, targets_json, query, from_ts, continuation_to,
+                         max(1, math.ceil((total_results - len(raw_articles)) / BACKFILL_PAGE_SIZE)), time.time())
+                    )
+        self._log("Unit %d (%s, %s..%s): %d article(s), %d new, %d total results.", 'info',
+                  unit_id, kind, from_ts, to_ts, len(articles), added, total_results)
+        return list(to_score.items())
+
+    def run(self, max_calls=None, vader_workers=VADER_WORKERS, wait_for_quota=False):
+        """
+        Processes pending units until done, `max_calls` is reached, or the day's quota is spent
+        (with `wait_for_quota`, sleeps until the UTC day rolls over and continues). Returns status().
+        """
+        calls = 0
+        pending_scores = []
+        with ProcessPoolExecutor(max_workers=vader_workers) as pool:
+            def _drain(block=False):
+                for future in list(pending_scores):
+                    if block or future.done():
+                        self.store.set_vader_scores(future.result())
+                        pending_scores.remove(future)
+
+            def _submit(items):
+                items = [(h, content) for h, content in items if h not in self._submitted]
+                self._submitted.update(h for h, _ in items)
+                for start in range(0, len(items), VADER_BATCH_SIZE):
+                    pending_scores.append(pool.submit(_score_batch, items[start:start + VADER_BATCH_SIZE]))
+
+            for leftovers in self.store.iter_unscored(VADER_BATCH_SIZE * vader_workers): # Leftovers from an interrupted run
+                _submit(leftovers)
+                if len(pending_scores) > 2 * vader_workers:
+                    _drain(block=True) # Keeps at most a few batches of text in memory
+            try:
+                while max_calls is None or calls < max_calls:
+                    self._expire_old_units()
+                    unit = self._next_unit()
+                    if unit is None:
+                        self._log("No pending units left.", 'info')
+                        break
+                    try:
+                        new_articles = self._fetch_unit(unit)
+                    except Exception as e: # NewsAPIException, non-ok responses, network errors
+                        self._record_failure(unit, e)
+                        calls += 1
+                        continue
+                    if new_articles is None:
+                        if not wait_for_quota:
+                            self._log("NewsAPI budget for this priority is used up for today; re-run to resume.", 'warning')
+                            break
+                        now = datetime.now(timezone.utc)
+                        tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=5, microsecond=0)
+                        self._log("NewsAPI budget used up; sleeping until %s.", 'info', _format_ts(tomorrow))
+                        _drain(block=True)
+                        time.sleep(max(1.0, (tomorrow - now).total_seconds()))
+                        continue
+                    calls += 1
+                    _submit(new_articles)
+                    _drain()
+            finally:
+                _drain(block=True)
+        return self.status()
@@ -0,0 +1,249 @@
+# utils/batch_analysis.py
+import logging
+from . import newsapi_helpers, gemini_utils, sentiment_analyzer, article_scores
+from .log_utils import make_log_func
+from .task_graph import TaskGraph
+from .rate_limiter import PRIORITY_INTERACTIVE
+from .deadline import is_expired
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_WORKERS = 4
+
+
+def _merge_unique(*article_lists):
+    seen_hashes = set(); merged = []
+    for articles in article_lists:
+        for art in articles:
+            if art.content_hash not in seen_hashes:
+                seen_hashes.add(art.content_hash); merged.append(art)
+    return merged
+
+
+def plan_batch_analysis(
+    na_client, gemini_api_key, sector_targets, stock_targets,
+    from_date_obj, to_date_obj, llm_context_date_range_str,
+    max_articles_sector, max_articles_stock, custom_prompt="", append_log_func=None,
+    priority=PRIORITY_INTERACTIVE, on_field=None, deadline=None
+):
+    """
+    Builds the task graph for a batch of targets:
+
+        fetch:sector:<S>  ─┐                        ┌─ score:sector:<S>    ── llm:sector:<S>
+        fetch:pack:<i>    ─┴─ tag:stock:<S>:<T> ────┴─ score:stock:<S>:<T> ── llm:stock:<S>:<T>
+
+    - One candidate fetch per requested sector, and the requested stocks (across all sectors)
+      packed into as few NewsAPI queries as possible.
+    - Tagging gives each (sector, stock) target the articles from its stock's pack plus any alias
+      matches from that sector's fetch, if the sector is also in the batch.
+    - Scoring is the BM25 cut plus the VADER average; the LLM step runs per target.
+    - In per-article scoring mode (article_scores), one llm:article_scores task first scores the
+      union of every target's cut in shared batches, so the per-target steps aggregate from cache.
+    `stock_targets` is a list of (sector_name, stock_name); names must already be validated.
+    `on_field(target_type, target_name, key, value)`, if given, receives LLM fields as they stream in.
+    Once `deadline` expires, the remaining fetch and LLM tasks return immediately without calling out.
+    Returns the TaskGraph; run it and pass the results to collect_batch_results.
+    """
+    graph = TaskGraph()
+    country_keywords = gemini_utils.NEWSAPI_INDIA_MARKET_KEYWORDS
+    pool_factor = newsapi_helpers.BM25_CANDIDATE_POOL_FACTOR if newsapi_helpers.BM25_RERANK_ENABLED else 1
+    sectors_config = gemini_utils.NIFTY_SECTORS_QUERY_CONFIG
+
+    llm_tasks = [] # (task_id, func, score_id); added last so they can depend on the shared scoring task
+
+    def _llm_task(target_name, target_type):
+        def _run(scored, *_):
+            articles, _, _, _ = scored
+            if not articles:
+                return None, None
+            field_callback = None
+            if on_field is not None:
+                field_callback = lambda key, value: on_field(target_type, target_name, key, value)
+            return gemini_utils.analyze_news_with_gemini(
+                gemini_api_key, articles, target_name, llm_context_date_range_str,
+                custom_prompt, append_log_func, target_type=target_type, on_field=field_callback,
+                deadline=deadline
+            )
+        return _run
+
+    def _score(articles, keywords, max_articles, fetch_error, fetch_meta):
+        ranked = newsapi_helpers.rank_and_cut(articles, keywords, max_articles)
+        avg_vader = sentiment_analyzer.get_average_vader_score([art.vader_score for art in ranked])
+        return ranked, avg_vader, fetch_error, fetch_meta
+
+    for sector_name in sector_targets:
+        sector_keywords = sectors_config.get(sector_name, {}).get("newsapi_keywords", [sector_name])
+        query_string = newsapi_helpers.build_newsapi_query(sector_keywords, country_keywords)
+        fetch_id = graph.add(
+            f"fetch:sector:{sector_name}",
+            lambda q=query_string, s=sector_name: newsapi_helpers.fetch_news_candidates_newsapi(
+                na_client, f"sector '{s}'", q, from_date_obj, to_date_obj,
+                max_articles_sector * pool_factor, append_log_func, priority=priority, deadline=deadline
+            )
+        )
+        score_id = graph.add(
+            f"score:sector:{sector_name}",
+            lambda fetched, k=sector_keywords: _score(fetched[0], k, max_articles_sector, fetched[1], fetched[2]),
+            [fetch_id]
+        )
+        llm_tasks.append((f"llm:sector:{sector_name}", _llm_task(sector_name, "sector"), score_id))
+
+    # Targets are (sector, stock): a stock listed under two sectors keeps each sector's keywords and sector fetch.
+    # The packed fetch is per stock, over the union of its keyword lists, so it is still made once.
+    target_keywords = {}; stock_keywords_map = {}
+    for sector_name, stock_name in stock_targets:
+        keywords = sectors_config[sector_name]["stocks"].get(stock_name, [stock_name])
+        target_keywords[(sector_name, stock_name)] = keywords
+        merged = stock_keywords_map.setdefault(stock_name, [])
+        merged.extend(k for k in keywords if k not in merged)
+    if not stock_keywords_map:
+        return _add_llm_tasks(graph, llm_tasks, gemini_api_key, append_log_func, deadline, custom_prompt)
+
+    alias_patterns = newsapi_helpers.build_alias_patterns(stock_keywords_map)
+    packs = newsapi_helpers.plan_packed_stock_queries(stock_keywords_map, country_keywords)
+    pack_of_stock = {}
+    for pack_index, (pack_stocks, query_string) in enumerate(packs):
+        graph.add(
+            f"fetch:pack:{pack_index}",
+            lambda p=pack_stocks, q=query_string: newsapi_helpers.fetch_packed_stock_candidates(
+                na_client, p, q, alias_patterns, max_articles_stock * pool_factor,
+                from_date_obj, to_date_obj, append_log_func, priority, deadline
+            )
+        )
+        for stock_name in pack_stocks:
+            pack_of_stock[stock_name] = pack_index
+
+    for (sector_name, stock_name), keywords in target_keywords.items():
+        pack_index = pack_of_stock[stock_name]
+        target_key = stock_target_key(sector_name, stock_name)
+        deps = [f"fetch:pack:{pack_index}"]
+        sector_fetch_id = f"fetch:sector:{sector_name}"
+        if sector_fetch_id in graph:
+            deps.append(sector_fetch_id)
+        pattern = newsapi_helpers.build_alias_patterns({stock_name: keywords})
+
+        def _tag(*fetched, s=stock_name, k=keywords, n=len(packs[pack_index][0]), pattern=pattern):
+            # Shared fetches: pages_used is the pack's page count, reported for each stock in the pack.
+            pack_articles, pack_error, pack_meta = fetched[0]
+            candidates = _merge_unique(*(f[0] for f in fetched))
+            tagged = newsapi_helpers.tag_articles_by_alias(candidates, pattern)[s]
+            meta = dict(pack_meta, packed_with=n)
+            if newsapi_helpers.needs_single_stock_fallback(n, tagged, pack_articles, pack_error, pack_meta):
+                tagged, pack_error, fallback_meta = newsapi_helpers.fetch_single_stock_fallback(
+                    na_client, s, k, country_keywords, max_articles_stock * pool_factor,
+                    from_date_obj, to_date_obj, append_log_func, priority, deadline
+                )
+                meta['fallback_pages_used'] = fallback_meta['pages_used']
+            return tagged, pack_error, meta
+
+        tag_id = graph.add(f"tag:stock:{target_key}", _tag, deps)
+        score_id = graph.add(
+            f"score:stock:{target_key}",
+            lambda tagged, k=keywords: _score(tagged[0], k, max_articles_stock, tagged[1], tagged[2]),
+            [tag_id]
+        )
+        llm_tasks.append((f"llm:stock:{target_key}", _llm_task(stock_name, "stock"), score_id))
+    return _add_llm_tasks(graph, llm_tasks, gemini_api_key, append_log_func, deadline, custom_prompt)
+
+
+def stock_target_key(sector_name, stock_name):
+    """Task-id suffix of a stock target; the same stock under two sectors is two targets."""
+    return f"{sector_name}:{stock_name}"
+
+
+def _add_llm_tasks(graph, llm_tasks, gemini_api_key, append_log_func, deadline, custom_prompt=""):
+    # Custom instructions need the single-prompt analysis (see analyze_news_with_gemini), so nothing to pre-score
+    if not (article_scores.ARTICLE_SCORING_ENABLED and gemini_api_key) or custom_prompt:
+        for task_id, func, score_id in llm_tasks:
+            graph.add(task_id, func, [score_id])
+        return graph
+
+    def _score_all(*scored_lists):
+        # Best effort: whatever is not cached here is scored by the target's own LLM step
+        articles = _merge_unique(*(scored[0] for scored in scored_lists if scored is not None))
+        if articles:
+            try:
+                gemini_utils.score_articles_with_gemini(gemini_api_key, articles, append_log_func, deadline)
+            except Exception as e:
+                logger.warning("Shared article scoring failed: %s", str(e)[:150])
+
+    score_ids = [score_id for _, _, score_id in llm_tasks]
+    graph.add("llm:article_scores", _score_all, score_ids, allow_failed_deps=True)
+    for task_id, func, score_id in llm_tasks:
+        graph.add(task_id, func, [score_id, "llm:article_scores"])
+    return graph
+
+
+def collect_batch_results(results, errors, sector_targets, stock_targets, deadline=None):
+    """Shapes graph results into the same per-target dicts the sector and stock routes return."""
+    sectors_config = gemini_utils.NIFTY_SECTORS_QUERY_CONFIG
+    deadline_expired = is_expired(deadline)
+
+    def _target_result(kind, name):
+        scored = results.get(f"score:{kind}:{name}")
+        task_error = errors.get(f"llm:{kind}:{name}")
+        if scored is None:
+            upstream = next((e for k, e in errors.items() if k.endswith(f":{kind}:{name}")), task_error)
+            return [], 0.0, f"Batch task failed for {kind} {name}: {str(upstream)[:100]}", {'pages_used': 0}, None
+        articles, avg_vader, fetch_error, fetch_meta = scored
+        analysis, error_message = results.get(f"llm:{kind}:{name}", (None, None))
+        if task_error is not None:
+            error_message = f"Error during Gemini analysis for {name}: {str(task_error)[:100]}"
+        error_message = error_message or fetch_error
+        if not articles and not error_message:
+            error_message = f"No processable news for {kind} {name}."
+        return articles, avg_vader, error_message, fetch_meta, analysis
+
+    def _timed_out(articles, fetch_meta, analysis):
+        return deadline_expired and analysis is None and bool(articles or fetch_meta.get('timed_out'))
+
+    batch_results = []
+    for sector_name in sector_targets:
+        articles, avg_vader, error_message, fetch_meta, analysis = _target_result("sector", sector_name)
+        batch_results.append({
+            'target_type': 'sector',
+            'sector_name': sector_name,
+            'num_articles_for_llm_sector': len(articles),
+            'newsapi_pages_used_sector': fetch_meta['pages_used'],
+            'gemini_analysis_sector': analysis,
+            'error_message_sector': error_message,
+            'avg_vader_score_sector': avg_vader,
+            'vader_sentiment_label_sector': sentiment_analyzer.get_sentiment_label_from_score(avg_vader),
+            'constituent_stocks': list(sectors_config.get(sector_name, {}).get("stocks", {}).keys()),
+            'timed_out': _timed_out(articles, fetch_meta, analysis)
+        })
+    for sector_name, stock_name in stock_targets:
+        articles, avg_vader, error_message, fetch_meta, analysis = _target_result("stock", stock_target_key(sector_name, stock_name))
+        batch_results.append({
+            'target_type': 'stock',
+            'sector_name': sector_name,
+            'stock_name': stock_name,
+            'num_articles_for_llm_stock': len(articles),
+            'newsapi_pages_used_stock': fetch_meta['pages_used'],
+            'gemini_analysis_stock': analysis,
+            'error_message_stock': error_message,
+            'avg_vader_score_stock': avg_vader,
+            'vader_sentiment_label_stock': sentiment_analyzer.get_sentiment_label_from_score(avg_vader),
+            'timed_out': _timed_out(articles, fetch_meta, analysis)
+        })
+    return batch_results
+
+
+def run_batch_analysis(
+    na_client, gemini_api_key, sector_targets, stock_targets,
+    from_date_obj, to_date_obj, llm_context_date_range_str,
+    max_articles_sector, max_articles_stock, custom_prompt="", append_log_func=None,
+    priority=PRIORITY_INTERACTIVE, max_workers=BATCH_MAX_WORKERS, on_field=None, deadline=None
+):
+    """Plans, executes and collects a batch (see plan_batch_analysis)."""
+    _log = make_log_func(logger, "[Batch]", append_log_func)
+    graph = plan_batch_analysis(
+        na_client, gemini_api_key, sector_targets, stock_targets,
+        from_date_obj, to_date_obj, llm_context_date_range_str,
+        max_articles_sector, max_articles_stock, custom_prompt, append_log_func, priority, on_field, deadline
+    )
+    _log("Planned %d task(s); running with up to %d worker(s).", 'info', len(graph), max_workers)
+    results, errors = graph.run(max_workers=max_workers)
+    if errors:
+        _log("%d batch task(s) failed or were skipped.", 'warning', len(errors))
+    return collect_batch_results(results, errors, sector_targets, stock_targets, deadline)
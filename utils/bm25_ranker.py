@@ -0,0 +1,77 @@
+# utils/bm25_ranker.py
+import math
+import re
+from collections import Counter
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9&]+")
+# Kept small on purpose: company aliases like "Bank of Baroda" or "Tech Mahindra IT" are mostly content words.
+_STOPWORDS = frozenset({"a", "an", "and", "as", "at", "by", "for", "from", "in", "is", "of", "on", "or", "the", "to", "with"})
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [tok for tok in _TOKEN_PATTERN.findall(text.lower()) if tok not in _STOPWORDS]
+
+
+def build_inverted_index(documents):
+    """
+    Builds a small in-memory index over one fetch batch.
+    Returns (postings, doc_lengths) where postings maps term -> list of (doc_index, term_frequency).
+    """
+    postings = {}
+    doc_lengths = []
+    for doc_index, text in enumerate(documents):
+        tokens = tokenize(text)
+        doc_lengths.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            postings.setdefault(term, []).append((doc_index, tf))
+    return postings, doc_lengths
+
+
+def bm25_scores(documents, query_keywords, k1=BM25_K1, b=BM25_B):
+    """Scores every document in the batch against the union of tokens in `query_keywords`."""
+    num_docs = len(documents)
+    scores = [0.0] * num_docs
+    if not num_docs:
+        return scores
+    postings, doc_lengths = build_inverted_index(documents)
+    avg_doc_length = (sum(doc_lengths) / num_docs) or 1.0
+
+    query_terms = set()
+    for keyword in query_keywords:
+        query_terms.update(tokenize(keyword))
+
+    for term in query_terms:
+        term_postings = postings.get(term)
+        if not term_postings:
+            continue
+        doc_freq = len(term_postings)
+        idf = math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+        for doc_index, tf in term_postings:
+            norm = k1 * (1 - b + b * doc_lengths[doc_index] / avg_doc_length)
+            scores[doc_index] += idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def rerank_articles(articles_data, query_keywords, max_articles_to_return, drop_unmatched=True):
+    """
+    Re-orders Article objects by BM25 score against the target's own keywords and applies
+    the max_articles_to_return cut. Articles are not modified, so one Article can be ranked
+    for several targets.
+    Articles sharing no term with the keywords are dropped, unless none match at all, in
+    which case the incoming (NewsAPI relevancy) order is kept.
+    """
+    if not articles_data:
+        return []
+    scores = bm25_scores([art.content for art in articles_data], query_keywords)
+    # sorted() is stable, so ties keep NewsAPI's relevancy order
+    ranked = sorted(range(len(articles_data)), key=lambda i: scores[i], reverse=True)
+    if scores[ranked[0]] <= 0:
+        ranked = list(range(len(articles_data)))
+    elif drop_unmatched:
+        ranked = [i for i in ranked if scores[i] > 0]
+    return [articles_data[i] for i in ranked[:max_articles_to_return]]
@@ -0,0 +1,129 @@
+# utils/columnar_export.py
+import base64
+import io
+import json
+import logging
+import os
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = 50000
+EXPORT_MAX_CHUNK_ROWS = 500000
+
+# Each dataset: a keyset-paginated query and its typed columns. The query takes the cursor (the
+# previous chunk's last key) and the day range, and must ORDER BY exactly the key columns.
+DATASETS = {
+    'analyses': {
+        'key': ['analysis_id'],
+        'columns': [('analysis_id', 'int'), ('target_type', 'str'), ('target_name', 'str'), ('sector_name', 'str'),
+                    ('day', 'day'), ('run_id', 'str'), ('created', 'float'), ('num_articles', 'int'),
+                    ('avg_vader_score', 'float'), ('llm_label', 'str'), ('llm_score', 'float'), ('error', 'str')],
+        'sql': "SELECT analysis_id, target_type, target_name, sector_name, day, run_id, created, num_articles, avg_vader_score, "
+               "llm_label, llm_score, error FROM analyses WHERE analysis_id > ? AND day >= ? AND day <= ? "
+               "ORDER BY analysis_id LIMIT ?",
+        'start': [0],
+    },
+    'daily': {
+        'key': ['target_type', 'target_name', 'day'],
+        'columns': [('target_type', 'str'), ('target_name', 'str'), ('day', 'day'), ('num_articles', 'int'),
+                    ('num_scored', 'int'), ('mean_vader', 'float'), ('min_vader', 'float'), ('max_vader', 'float'),
+                    ('mean_llm_score', 'float')],
+        'sql': "SELECT t.target_type, t.target_name, t.day, COUNT(*), COUNT(a.vader_score), AVG(a.vader_score), "
+               "MIN(a.vader_score), MAX(a.vader_score), "
+               "(SELECT AVG(llm_score) FROM analyses n WHERE n.target_type = t.target_type AND n.target_name = t.target_name AND n.day = t.day) "
+               "FROM target_articles t JOIN articles a ON a.content_hash = t.content_hash "
+               "WHERE (t.target_type, t.target_name, t.day) > (?, ?, ?) AND t.day >= ? AND t.day <= ? "
+               "GROUP BY t.target_type, t.target_name, t.day ORDER BY t.target_type, t.target_name, t.day LIMIT ?",
+        'start': ["", "", ""],
+    },
+    'articles': {
+        'key': ['link_id'],
+        'columns': [('link_id', 'int'), ('target_type', 'str'), ('target_name', 'str'), ('content_hash', 'str'),
+                    ('day', 'day'), ('source', 'str'), ('vader_score', 'float')],
+        'sql': "SELECT t.rowid, t.target_type, t.target_name, t.content_hash, t.day, a.source, a.vader_score "
+               "FROM target_articles t JOIN articles a ON a.content_hash = t.content_hash "
+               "WHERE t.rowid > ? AND t.day >= ? AND t.day <= ? ORDER BY t.rowid LIMIT ?",
+        'start': [0],
+    },
+}
+
+
+def encode_cursor(key_values):
+    return base64.urlsafe_b64encode(json.dumps(key_values).encode('utf-8')).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Raises ValueError for a cursor that was not produced by encode_cursor."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid export cursor: {e}")
+    if not isinstance(values, list) or not all(_is_key_value(v) for v in values):
+        raise ValueError("Invalid export cursor.")
+    return values
+
+
+def _is_key_value(value):
+    # Cursor keys are SQLite integers (64-bit), floats or strings; bools, nulls and containers are not
+    if isinstance(value, bool):
+        return False
+    if isinstance(value, int):
+        return -2**63 <= value < 2**63
+    return isinstance(value, (float, str))
+
+
+def _key_matches(value, kind):
+    return isinstance(value, int) if kind == 'int' else isinstance(value, (int, float)) if kind == 'float' else isinstance(value, str)
+
+
+def _column_array(values, kind):
+    if kind == 'int':
+        return np.array([v if v is not None else 0 for v in values], dtype=np.int64)
+    if kind == 'float':
+        return np.array([v if v is not None else np.nan for v in values], dtype=np.float64)
+    if kind == 'day':
+        return np.array([v or 'NaT' for v in values], dtype='datetime64[D]')
+    return np.array([v or "" for v in values], dtype=np.str_) # Fixed-width unicode; loads without allow_pickle
+
+
+def export_chunk(store, dataset, from_day=None, to_day=None, cursor=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    One chunk of `dataset` as a compressed .npz (one array per column). Returns
+    (npz_bytes, next_cursor, row_count); next_cursor is None after the last chunk.
+    Memory per call is bounded by chunk_rows, however large the day range is.
+    """
+    spec = DATASETS.get(dataset)
+    if spec is None:
+        raise ValueError(f"Unknown dataset '{dataset}'; expected one of {', '.join(DATASETS)}.")
+    chunk_rows = max(1, min(int(chunk_rows), EXPORT_MAX_CHUNK_ROWS))
+    after = decode_cursor(cursor) if cursor else spec['start']
+    kinds = dict(spec['columns'])
+    if len(after) != len(spec['key']) or not all(_key_matches(value, kinds[key]) for value, key in zip(after, spec['key'])):
+        raise ValueError("Export cursor does not belong to this dataset.")
+    rows = store.execute(spec['sql'], (*after, from_day or "0000-00-00", to_day or "9999-99-99", chunk_rows))
+
+    columns = list(zip(*rows)) if rows else [() for _ in spec['columns']]
+    arrays = {name: _column_array(values, kind) for (name, kind), values in zip(spec['columns'], columns)}
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    next_cursor = None
+    if len(rows) == chunk_rows:
+        names = [name for name, _ in spec['columns']]
+        next_cursor = encode_cursor([rows[-1][names.index(key)] for key in spec['key']])
+    return buffer.getvalue(), next_cursor, len(rows)
+
+
+def export_to_directory(store, dataset, directory, from_day=None, to_day=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Writes <dataset>-00000.npz, -00001.npz, ... into `directory`; returns (paths, total_rows)."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []; total_rows = 0; cursor = None
+    while True:
+        data, cursor, row_count = export_chunk(store, dataset, from_day, to_day, cursor, chunk_rows)
+        if row_count or not paths: # An empty range still yields one (empty) part, so readers always find the columns
+            path = os.path.join(directory, f"{dataset}-{len(paths):05d}.npz")
+            with open(path, 'wb') as f:
+                f.write(data)
+            paths.append(path); total_rows += row_count
+        if cursor is None:
+            return paths, total_rows
@@ -0,0 +1,110 @@
+# utils/deadline.py
+import logging
+import math
+import select
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+REQUEST_TIMEOUT_HEADER = "X-Request-Timeout" # Seconds the client is willing to wait
+MAX_REQUEST_TIMEOUT_SECONDS = 600
+DISCONNECT_PROBE_INTERVAL_SECONDS = 0.5
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class RequestDeadline:
+    """
+    Budget for one HTTP request: an optional absolute deadline plus cooperative cancellation.
+    Work checks expired() between steps (pages, sectors, LLM calls) and stops early; nothing is
+    interrupted mid-call. `disconnect_probe()` returning True cancels the request (client gone).
+    """
+
+    def __init__(self, timeout_seconds=None, disconnect_probe=None):
+        self.expires_at = time.monotonic() + timeout_seconds if timeout_seconds else None
+        self._cancelled = threading.Event()
+        self._reason = None
+        self._disconnect_probe = disconnect_probe
+        self._last_probe = 0.0
+
+    def cancel(self, reason="request cancelled"):
+        if not self._cancelled.is_set():
+            self._reason = reason
+            self._cancelled.set()
+
+    def remaining(self):
+        """Seconds left, or None for no deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        if self._cancelled.is_set():
+            return True
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            self.cancel("deadline exceeded")
+            return True
+        now = time.monotonic()
+        if self._disconnect_probe is not None and now - self._last_probe >= DISCONNECT_PROBE_INTERVAL_SECONDS:
+            self._last_probe = now
+            if self._disconnect_probe():
+                self.cancel("client disconnected")
+                return True
+        return False
+
+    @property
+    def reason(self):
+        return self._reason
+
+    def check(self):
+        if self.expired():
+            raise DeadlineExceeded(self._reason)
+
+
+def is_expired(deadline):
+    return deadline is not None and deadline.expired()
+
+
+def socket_disconnect_probe(environ):
+    """
+    Probe for the werkzeug development server, which exposes the client socket. A readable
+    socket that yields no bytes on peek means the client closed the connection.
+    Returns None for servers that do not expose the socket (deadline-only then).
+    """
+    sock = environ.get('werkzeug.socket')
+    if sock is None:
+        return None
+
+    def _probe():
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+        except (OSError, ValueError):
+            return True
+    return _probe
+
+
+def deadline_from_request(headers, form_data, environ=None):
+    """
+    Timeout from the X-Request-Timeout header or a 'timeout_seconds' body field (capped).
+    Anything that is not a finite positive number (nan, inf, 0, negatives) means no deadline.
+    """
+    raw_timeout = headers.get(REQUEST_TIMEOUT_HEADER) or (form_data or {}).get('timeout_seconds')
+    timeout_seconds = None
+    if raw_timeout not in (None, ""):
+        try:
+            timeout_seconds = float(raw_timeout)
+        except (TypeError, ValueError):
+            pass
+        # nan slips past both min() and a <= 0 check, and a nan deadline reports 0s remaining forever
+        if timeout_seconds is None or not math.isfinite(timeout_seconds) or timeout_seconds <= 0:
+            logger.warning("Ignoring invalid request timeout %r", raw_timeout)
+            timeout_seconds = None
+        else:
+            timeout_seconds = min(timeout_seconds, MAX_REQUEST_TIMEOUT_SECONDS)
+    probe = socket_disconnect_probe(environ) if environ is not None else None
+    return RequestDeadline(timeout_seconds, probe)
@@ -0,0 +1,228 @@
+# utils/fake_upstreams.py
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logger = logging.getLogger(__name__)
+
+FAKE_ARTICLES_PER_QUERY = 60
+_GEMINI_PATH = re.compile(r"^/v1beta/models/([^/:]+):(generateContent|streamGenerateContent)$")
+_QUOTED_TERM = re.compile(r'"([^"]+)"')
+_NUMBERED_ARTICLE = re.compile(r"^\s*\[(\d+)\] (.*)$", re.MULTILINE)
+_SENTIMENT_WORDS = [("surges on strong demand", "Positive", 0.6), ("slips after weak guidance", "Negative", -0.5),
+                    ("holds steady ahead of results", "Neutral", 0.0), ("rallies as margins improve", "Positive", 0.4)]
+
+
+class UpstreamBehaviour:
+    """Latency (seconds, +/- jitter fraction) and error rate of one stand-in; editable while the servers run."""
+
+    def __init__(self, latency_seconds=0.05, jitter=0.5, error_rate=0.0):
+        self.latency_seconds = latency_seconds
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    def delay(self, rng):
+        if self.latency_seconds > 0:
+            time.sleep(max(0.0, self.latency_seconds * (1 + rng.uniform(-self.jitter, self.jitter))))
+
+    def should_fail(self, rng):
+        return self.error_rate > 0 and rng.random() < self.error_rate
+
+
+def _fake_articles(query, from_param, to_param, page, page_size, total):
+    """Deterministic articles per (query, page) whose titles contain the query's terms, so ranking and alias tagging keep them."""
+    terms = _QUOTED_TERM.findall(query) or [query or "market"]
+    seed = int(hashlib.blake2b(f"{query}|{page}".encode('utf-8'), digest_size=8).hexdigest(), 16)
+    rng = random.Random(seed)
+    try:
+        to_day = datetime.strptime((to_param or "")[:10], '%Y-%m-%d')
+    except ValueError:
+        to_day = datetime.utcnow()
+    try:
+        span_days = max(0, (to_day - datetime.strptime((from_param or "")[:10], '%Y-%m-%d')).days)
+    except ValueError:
+        span_days = 6
+    articles = []
+    first_index = (page - 1) * page_size
+    for index in range(first_index, min(total, first_index + page_size)):
+        phrase, _, _ = _SENTIMENT_WORDS[index % len(_SENTIMENT_WORDS)]
+        term = terms[index % len(terms)]; market_term = terms[-1]
+        published = to_day - timedelta(days=rng.randint(0, span_days), seconds=rng.randint(0, 86399))
+        articles.append({
+            'source': {'id': None, 'name': f"Stand-in Wire {index % 5}"},
+            'title': f"{term} {phrase} ({market_term}) #{index}",
+            'description': f"Coverage of {term} in {market_term}: analysts weigh the outlook after the session.",
+            'url': f"https://standin.local/{seed:x}/{index}",
+            'publishedAt': published.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        })
+    return articles
+
+
+def _fake_analysis(prompt_text):
+    """A schema-shaped analysis that varies with the prompt."""
+    digest = int(hashlib.blake2b(prompt_text.encode('utf-8'), digest_size=4).hexdigest(), 16)
+    _, label, score = _SENTIMENT_WORDS[digest % len(_SENTIMENT_WORDS)]
+    return {
+        "summary": "Stand-in summary of the supplied articles.",
+        "overall_sentiment": label,
+        "sentiment_score_llm": score,
+        "sentiment_reason": "Generated by the load-test stand-in.",
+        "key_themes": ["demand", "margins"],
+        "potential_impact": "Illustrative only.",
+        "key_companies_mentioned_context": [],
+        "risks_identified": ["guidance"],
+        "opportunities_identified": ["margin expansion"],
+    }
+
+
+def _fake_article_scores(prompt_text):
+    """Per-article scores for a batched scoring prompt ("[n] text" lines)."""
+    articles = []
+    for number, text in _NUMBERED_ARTICLE.findall(prompt_text):
+        digest = int(hashlib.blake2b(text.encode('utf-8'), digest_size=4).hexdigest(), 16)
+        _, label, score = _SENTIMENT_WORDS[digest % len(_SENTIMENT_WORDS)]
+        articles.append({"id": int(number), "score": score, "rationale": f"Stand-in: reads as {label.lower()}."})
+    return {"articles": articles}
+
+
+def _prompt_text(body):
+    parts = []
+    for content in body.get('contents') or []:
+        parts.extend(part.get('text', '') for part in content.get('parts') or [])
+    return "".join(parts)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    upstreams = None # Set per server class
+
+    def log_message(self, format, *args): # Keep load-test output clean
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/v2/everything':
+            return self._send_json(404, {'status': 'error', 'code': 'notFound', 'message': url.path})
+        self.upstreams.serve_newsapi(self, {k: v[-1] for k, v in parse_qs(url.query).items()})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        match = _GEMINI_PATH.match(url.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        if not match:
+            return self._send_json(404, {'error': {'code': 404, 'message': url.path, 'status': 'NOT_FOUND'}})
+        self.upstreams.serve_gemini(self, match.group(2) == 'streamGenerateContent', body)
+
+
+class FakeUpstreams:
+    """
+    Local stand-ins for NewsAPI (/v2/everything) and Gemini (REST generateContent and
+    streamGenerateContent), each on its own threaded HTTP server with configurable latency and
+    error rate. Point the app at them with NEWSAPI_BASE_URL=newsapi_url and
+    GEMINI_API_ENDPOINT=gemini_endpoint. Failures are NewsAPI 'rateLimited' and Gemini 429
+    RESOURCE_EXHAUSTED responses, i.e. what the app's retry/limit paths handle.
+    """
+
+    def __init__(self, newsapi=None, gemini=None, articles_per_query=FAKE_ARTICLES_PER_QUERY, seed=0, host="127.0.0.1"):
+        self.newsapi = newsapi or UpstreamBehaviour()
+        self.gemini = gemini or UpstreamBehaviour(latency_seconds=0.5)
+        self.articles_per_query = articles_per_query
+        self.host = host
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.stats = {'newsapi_calls': 0, 'newsapi_errors': 0, 'gemini_calls': 0, 'gemini_errors': 0}
+        self._servers = []
+
+    def _draw(self, behaviour):
+        with self._rng_lock:
+            fail = behaviour.should_fail(self._rng)
+            rng = random.Random(self._rng.random())
+        return fail, rng
+
+    def _count(self, stat):
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def serve_newsapi(self, handler, params):
+        self._count('newsapi_calls')
+        fail, rng = self._draw(self.newsapi)
+        self.newsapi.delay(rng)
+        if fail:
+            self._count('newsapi_errors')
+            return handler._send_json(429, {'status': 'error', 'code': 'rateLimited', 'message': 'Stand-in rate limit.'})
+        page, page_size = int(params.get('page', 1)), int(params.get('pageSize', 20))
+        articles = _fake_articles(params.get('q', ''), params.get('from'), params.get('to'), page, page_size, self.articles_per_query)
+        handler._send_json(200, {'status': 'ok', 'totalResults': self.articles_per_query, 'articles': articles})
+
+    def serve_gemini(self, handler, stream, body):
+        self._count('gemini_calls')
+        fail, rng = self._draw(self.gemini)
+        self.gemini.delay(rng)
+        if fail:
+            self._count('gemini_errors')
+            return handler._send_json(429, {'error': {'code': 429, 'message': 'Resource has been exhausted (stand-in).', 'status': 'RESOURCE_EXHAUSTED'}})
+        prompt_text = _prompt_text(body)
+        schema = (body.get('generationConfig') or {}).get('responseSchema') or {}
+        if 'articles' in (schema.get('properties') or {}) or _NUMBERED_ARTICLE.search(prompt_text):
+            text = json.dumps(_fake_article_scores(prompt_text))
+        else:
+            text = json.dumps(_fake_analysis(prompt_text))
+        usage = {'promptTokenCount': len(prompt_text) // 4, 'candidatesTokenCount': len(text) // 4, 'totalTokenCount': (len(prompt_text) + len(text)) // 4}
+        if not stream:
+            return handler._send_json(200, {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'finishReason': 'STOP', 'index': 0}],
+                                            'usageMetadata': usage})
+        # REST streaming is one JSON array whose elements arrive as separate chunks
+        cut = len(text) // 2
+        chunks = [{'candidates': [{'content': {'parts': [{'text': part}], 'role': 'model'}, 'index': 0}]} for part in (text[:cut], text[cut:])]
+        chunks[-1]['candidates'][0]['finishReason'] = 'STOP'; chunks[-1]['usageMetadata'] = usage
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Transfer-Encoding', 'chunked')
+        handler.end_headers()
+        for index, chunk in enumerate(chunks):
+            data = ("[" if index == 0 else ",") + json.dumps(chunk)
+            if index == len(chunks) - 1: data += "]"
+            payload = data.encode('utf-8')
+            handler.wfile.write(f"{len(payload):x}\r\n".encode('ascii') + payload + b"\r\n")
+            handler.wfile.flush()
+        handler.wfile.write(b"0\r\n\r\n")
+
+    def _start_server(self, port):
+        handler_class = type("_BoundHandler", (_Handler,), {'upstreams': self})
+        server = ThreadingHTTPServer((self.host, port), handler_class)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name=f"fake-upstream-{server.server_address[1]}", daemon=True).start()
+        self._servers.append(server)
+        return f"http://{self.host}:{server.server_address[1]}"
+
+    def start(self, newsapi_port=0, gemini_port=0):
+        self.newsapi_url = self._start_server(newsapi_port)
+        self.gemini_endpoint = self._start_server(gemini_port)
+        logger.info("Stand-in NewsAPI at %s, Gemini at %s", self.newsapi_url, self.gemini_endpoint)
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            server.shutdown(); server.server_close()
+        self._servers = []
+
+    def snapshot(self):
+        with self._stats_lock:
+            return dict(self.stats)
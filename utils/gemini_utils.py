@@ -2,6 +2,14 @@
 import google.generativeai as genai
 import json
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .log_utils import make_log_func
+from .article import Article, compute_content_hash
+from . import llm_hedging, llm_concurrency, analysis_reuse, analysis_merge, prompt_cache, article_scores
+from .json_stream import TopLevelFieldParser
+from .deadline import DeadlineExceeded, is_expired
+from .request_profiling import stage, propagate
 
 logger = logging.getLogger(__name__)
 
@@ -574,141 +582,597 @@ NIFTY_SECTORS_QUERY_CONFIG = {
 
 NEWSAPI_INDIA_MARKET_KEYWORDS = ["India", "Indian market", "NSE", "BSE", "Indian economy"]
 
-# The analyze_news_with_gemini function remains largely the same as your last version.
 # The `analysis_target_name` will be the stock's name when called for a stock.
 # The prompt's reference to '{analysis_target_name}' will then correctly refer to the stock.
 
+GEMINI_MODEL_NAME = 'gemini-1.5-flash-latest'
+MAX_TOTAL_CHARS_FOR_LLM = 25000
+ARTICLE_SEPARATOR = "\n\n--- ARTICLE SEPARATOR ---\n\n"
+DEFAULT_RESPONSE_STRUCTURE = { "summary": "N/A", "overall_sentiment": "Neutral", "sentiment_score_llm": 0.0, "sentiment_reason": "N/A", "key_themes": [], "potential_impact": "N/A", "key_companies_mentioned_context": [], "risks_identified": [], "opportunities_identified": []}
+
+# Incremental (delta) mode: when a target's article set grows, send the prior result plus only the new articles
+INCREMENTAL_ENABLED = False # Opt-in: a delta update can drift from what a full re-analysis would say
+INCREMENTAL_FULL_REBUILD_EVERY = 4 # Force a full analysis after this many delta updates in a row
+INCREMENTAL_FULL_REBUILD_SECONDS = 24 * 3600 # ... or once the last full analysis is this old
+INCREMENTAL_MAX_REMOVED_FRACTION = 0.3 # Too many articles dropped out of the window -> the prior summary is stale, rebuild
+
+# Structured output: Gemini is constrained to RESPONSE_SCHEMA, so the reply is bare JSON (no fences to strip)
+STRUCTURED_OUTPUT_ENABLED = True
+_STRING_LIST = {"type": "array", "items": {"type": "string"}}
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "overall_sentiment": {"type": "string", "format": "enum",
+                              "enum": ["Strongly Positive", "Positive", "Neutral", "Negative", "Strongly Negative"]},
+        "sentiment_score_llm": {"type": "number"},
+        "sentiment_reason": {"type": "string"},
+        "key_themes": _STRING_LIST,
+        "potential_impact": {"type": "string"},
+        "key_companies_mentioned_context": _STRING_LIST,
+        "risks_identified": _STRING_LIST,
+        "opportunities_identified": _STRING_LIST,
+    },
+    "required": list(DEFAULT_RESPONSE_STRUCTURE),
+}
+
+# Map-reduce mode: article sets larger than one prompt are analyzed in parallel chunks and merged
+MAP_REDUCE_ENABLED = False # Opt-in: costs one Gemini call per chunk instead of truncating to one prompt
+MAP_REDUCE_THRESHOLD_CHARS = MAX_TOTAL_CHARS_FOR_LLM # Above this, chunk instead of truncating
+MAP_REDUCE_MAX_CHUNKS = 8 # Cost guard: articles beyond this many chunks are still dropped
+MAP_REDUCE_MAX_WORKERS = 4
+
+GEMINI_API_ENDPOINT = None # e.g. "http://127.0.0.1:8092" for the load-test stand-in; None = Google's endpoint
+
+
+def configure_incremental(enabled, full_rebuild_every=INCREMENTAL_FULL_REBUILD_EVERY, full_rebuild_seconds=INCREMENTAL_FULL_REBUILD_SECONDS):
+    global INCREMENTAL_ENABLED, INCREMENTAL_FULL_REBUILD_EVERY, INCREMENTAL_FULL_REBUILD_SECONDS
+    INCREMENTAL_ENABLED, INCREMENTAL_FULL_REBUILD_EVERY, INCREMENTAL_FULL_REBUILD_SECONDS = enabled, full_rebuild_every, full_rebuild_seconds
+
+
+def configure_structured_output(enabled):
+    global STRUCTURED_OUTPUT_ENABLED
+    STRUCTURED_OUTPUT_ENABLED = enabled
+
+
+def configure_map_reduce(enabled, threshold_chars=MAP_REDUCE_THRESHOLD_CHARS, max_chunks=MAP_REDUCE_MAX_CHUNKS, max_workers=MAP_REDUCE_MAX_WORKERS):
+    global MAP_REDUCE_ENABLED, MAP_REDUCE_THRESHOLD_CHARS, MAP_REDUCE_MAX_CHUNKS, MAP_REDUCE_MAX_WORKERS
+    MAP_REDUCE_ENABLED, MAP_REDUCE_THRESHOLD_CHARS, MAP_REDUCE_MAX_CHUNKS, MAP_REDUCE_MAX_WORKERS = enabled, threshold_chars, max_chunks, max_workers
+
+
+def configure_sectors_config(sectors_config):
+    """Swaps in another universe (same shape as NIFTY_SECTORS_QUERY_CONFIG), e.g. a Nifty 500 file for sharded runs."""
+    global NIFTY_SECTORS_QUERY_CONFIG
+    NIFTY_SECTORS_QUERY_CONFIG = sectors_config
+
+
+def configure_gemini_endpoint(endpoint):
+    global GEMINI_API_ENDPOINT
+    GEMINI_API_ENDPOINT = endpoint or None
+
+
+def _configure_genai(api_key):
+    if GEMINI_API_ENDPOINT:
+        # Only the REST transport can talk plain http to a local server
+        genai.configure(api_key=api_key, transport='rest', client_options={'api_endpoint': GEMINI_API_ENDPOINT})
+    else:
+        genai.configure(api_key=api_key)
+
+
+def _article_text(item):
+    return item.content if isinstance(item, Article) else item # Accepts Article objects or plain strings
+
+
+def _truncate_texts(texts, max_chars=MAX_TOTAL_CHARS_FOR_LLM):
+    truncated_texts = []; current_chars = 0
+    for text in texts:
+        if current_chars + len(text) > max_chars and truncated_texts: break
+        text_to_add = text[:max_chars - current_chars]
+        truncated_texts.append(text_to_add); current_chars += len(text_to_add)
+        if current_chars >= max_chars: break
+    return truncated_texts, current_chars
+
+
+# Static instruction prefix shared by every analysis prompt (full, incremental and map-reduce chunks).
+# It must not mention the target, dates or articles so the provider can cache it once; see prompt_cache.
+ANALYSIS_INSTRUCTIONS = """You analyze Indian market news for one target at a time: either a sector or a single stock. Each request names the target ("the target" below), the period, and the news articles, concatenated and separated by '--- ARTICLE SEPARATOR ---'.
+
+Your task is to provide a structured analysis in JSON format. The JSON object must include the following keys:
+- "summary": A concise 2-3 sentence summary of the key news and developments for the target. If no relevant news is found specific to the target, state that clearly.
+- "overall_sentiment": Classify the overall sentiment FOR the target. Choose one: "Strongly Positive", "Positive", "Neutral", "Negative", "Strongly Negative". This should align with your "sentiment_score_llm".
+- "sentiment_score_llm": A float value representing the sentiment FOR the target. Adhere to these ranges:
+    - Strongly Positive: 0.6 to 1.0
+    - Positive: 0.2 to 0.59
+    - Neutral: -0.19 to 0.19
+    - Negative: -0.59 to -0.2
+    - Strongly Negative: -1.0 to -0.6
+  GUIDANCE FOR NEUTRAL SCORES (apply this considering the target):
+  1. If the news contains a mix of positive and negative developments for the target, and they roughly balance out, assign a score near 0.0 (e.g., -0.05 to 0.05).
+  2. If the news is predominantly factual without clear positive or negative sentiment cues *directly impacting the target*, assign a score in the Neutral range.
+  3. If the news primarily concerns broader market/sector trends that only *indirectly* relate to the target, its specific sentiment is likely Neutral. However, if the *overall tone* of these indirect news items is slightly positive (e.g. general market optimism), you can use a score like 0.1 to 0.19 for the target. If the tone is slightly negative, use -0.1 to -0.19.
+  4. If there is truly no relevant information specific to the target or the information is entirely non-consequential, a score of 0.0 is appropriate.
+  Your score should reflect the *net sentiment impact on the target* based on the provided articles.
+- "sentiment_reason": A brief 1-sentence explanation for the assigned sentiment and score for the target. If sentiment is Neutral due to indirect news or mixed signals, explain that.
+- "key_themes": A list of 2-3 dominant themes emerging from the news concerning the target. If no relevant news, this can be an empty list or state "N/A due to lack of relevant news".
+- "potential_impact": A 1-sentence assessment of the potential impact on the target. If no relevant news, state "N/A".
+- "key_companies_mentioned_context": If analyzing a SECTOR, list key companies. If analyzing a specific STOCK, this list can be broader entities or related companies mentioned. Provide brief context. Empty list if not applicable.
+- "risks_identified": A list of 1-2 potential risks for the target. Each risk a short string. Empty list if none or no relevant news.
+- "opportunities_identified": A list of 1-2 potential opportunities for the target. Each opportunity a short string. Empty list if none or no relevant news.
+
+Ensure the output is ONLY the JSON object, without any preceding or succeeding text, and no markdown formatting for the JSON block itself.
+
+Some requests include your PREVIOUS ANALYSIS of the target together with only the NEW articles published since. For those, update the previous analysis so it reflects both the earlier news and the new articles: keep themes, risks and opportunities that are still valid, revise the sentiment only as far as the new articles justify, and do not drop earlier developments just because they are not repeated in the new articles.
+"""
+
+
+def _focus_instructions(analysis_target_name, custom_instructions):
+    return custom_instructions if custom_instructions else f"Focus on financial and market implications specifically for '{analysis_target_name}'. Be concise and objective."
+
+
+def _build_analysis_prompt(analysis_target_name, target_type, date_range_str, combined_text, custom_instructions):
+    """Variable suffix for a full (or map-reduce chunk) analysis; ANALYSIS_INSTRUCTIONS is the prefix."""
+    return f"""
+    The target is '{analysis_target_name}' (which is a {target_type}) in the Indian market. Analyze the following news articles from the period '{date_range_str}'.
+
+    --- NEWS CONTENT START ---
+    {combined_text}
+    --- NEWS CONTENT END ---
+
+    {_focus_instructions(analysis_target_name, custom_instructions)}
+    """
+
+
+def _build_incremental_prompt(analysis_target_name, target_type, date_range_str, prior_result, combined_new_text, custom_instructions):
+    """Variable suffix for a delta update; ANALYSIS_INSTRUCTIONS is the prefix."""
+    prior_json = json.dumps({key: prior_result.get(key, default) for key, default in DEFAULT_RESPONSE_STRUCTURE.items()})
+    return f"""
+    The target is '{analysis_target_name}' (which is a {target_type}) in the Indian market. Your previous structured analysis was:
+
+    --- PREVIOUS ANALYSIS START ---
+    {prior_json}
+    --- PREVIOUS ANALYSIS END ---
+
+    The following NEW articles have appeared since, for the period '{date_range_str}'.
+
+    --- NEW NEWS CONTENT START ---
+    {combined_new_text}
+    --- NEW NEWS CONTENT END ---
+
+    {_focus_instructions(analysis_target_name, custom_instructions)}
+    """
+
+
+def _response_text(response, analysis_target_name, _log):
+    if hasattr(response, 'text') and response.text: return response.text.strip()
+    if response.parts: return "".join(part.text for part in response.parts).strip()
+    _log(f"Gemini response for '{analysis_target_name}' is empty or in an unexpected format.", "error")
+    raise ValueError("Gemini response is empty or in an unexpected format.")
+
+
+def _parse_response_text(cleaned_response_text, analysis_target_name, _log):
+    """Parses and validates the JSON object in a Gemini reply; raises json.JSONDecodeError."""
+    if STRUCTURED_OUTPUT_ENABLED:
+        return _validate_result(json.loads(cleaned_response_text), analysis_target_name, _log)
+
+    # Free-form replies: strip a markdown fence and any text around the outermost object
+    if cleaned_response_text.startswith("```json"): cleaned_response_text = cleaned_response_text[len("```json"):].strip()
+    if cleaned_response_text.endswith("```"): cleaned_response_text = cleaned_response_text[:-len("```")].strip()
+    
+    json_start_index = cleaned_response_text.find('{'); json_end_index = cleaned_response_text.rfind('}')
+    if json_start_index != -1 and json_end_index != -1 and json_end_index > json_start_index:
+        cleaned_response_text = cleaned_response_text[json_start_index : json_end_index+1]
+    else: 
+        _log(f"Could not find valid JSON structure in response for '{analysis_target_name}': '{cleaned_response_text[:200]}...'", 'error')
+        raise json.JSONDecodeError(f"Could not find valid JSON structure in response for {analysis_target_name}.", cleaned_response_text, 0)
+
+    result = json.loads(cleaned_response_text)
+    return _validate_result(result, analysis_target_name, _log)
+
+
+def _validate_result(result, analysis_target_name, _log):
+    for key, default_value in DEFAULT_RESPONSE_STRUCTURE.items():
+        if key not in result:
+            _log(f"Gemini response for '{analysis_target_name}' missing key '{key}'. Using default: {default_value}", 'warning')
+            result[key] = default_value
+        elif isinstance(default_value, list) and not isinstance(result.get(key), list):
+            _log(f"Gemini response key '{key}' for '{analysis_target_name}' is not a list as expected. Defaulting to empty list.", 'warning')
+            result[key] = []
+        elif key == "sentiment_score_llm" and not isinstance(result.get(key), (float, int)):
+            _log(f"Gemini response key 'sentiment_score_llm' for '{analysis_target_name}' is not a number. Defaulting to 0.0.", 'warning')
+            result[key] = 0.0
+    return result
+
+
+def _plan_incremental_update(previous_entry, current_hashes, _log):
+    """Returns the set of new content hashes to send in delta mode, or None for a full analysis."""
+    if not INCREMENTAL_ENABLED or previous_entry is None:
+        return None
+    previous_hashes = previous_entry['fingerprint'][0]
+    new_hashes = current_hashes - previous_hashes
+    removed_hashes = previous_hashes - current_hashes
+    if not new_hashes or new_hashes == current_hashes:
+        return None
+    if len(removed_hashes) > INCREMENTAL_MAX_REMOVED_FRACTION * len(previous_hashes):
+        return None
+    if previous_entry['delta_generation'] >= INCREMENTAL_FULL_REBUILD_EVERY:
+        _log("Scheduled full rebuild after %d incremental updates.", 'info', previous_entry['delta_generation'])
+        return None
+    if time.time() - previous_entry['last_full_at'] > INCREMENTAL_FULL_REBUILD_SECONDS:
+        _log("Scheduled full rebuild: last full analysis is older than %d hours.", 'info', INCREMENTAL_FULL_REBUILD_SECONDS // 3600)
+        return None
+    return new_hashes
+
+
+def _generation_config():
+    if STRUCTURED_OUTPUT_ENABLED:
+        return genai.types.GenerationConfig(temperature=0.3, response_mime_type="application/json", response_schema=RESPONSE_SCHEMA)
+    return genai.types.GenerationConfig(temperature=0.3)
+
+
+def _stream_response_text(model, prompt, generation_config, on_field, request_options=None):
+    """Streams the reply, passing each top-level field to on_field(key, value) as soon as it is complete."""
+    parser = TopLevelFieldParser(); fragments = []
+    with stage("llm.http"):
+        response = model.generate_content(prompt, generation_config=generation_config, stream=True, request_options=request_options)
+        for chunk in response:
+            fragment = "".join(part.text for part in chunk.parts) if chunk.parts else ""
+            fragments.append(fragment)
+            for key, value in parser.feed(fragment):
+                on_field(key, value)
+    return response, "".join(fragments).strip()
+
+
+def _timed_generate(model, prompt_text, generation_config, request_options):
+    with stage("llm.http"):
+        return model.generate_content(prompt_text, generation_config=generation_config, request_options=request_options)
+
+
+def _timed_parse(text, analysis_target_name, _log):
+    with stage("llm.json_parse"):
+        return _parse_response_text(text, analysis_target_name, _log)
+
+
+def _request_options(deadline):
+    remaining = deadline.remaining() if deadline is not None else None
+    if is_expired(deadline):
+        raise DeadlineExceeded(deadline.reason)
+    return {'timeout': remaining} if remaining is not None else None
+
+
+def _generate_analysis(api_key, prompt, analysis_target_name, _log, on_field=None, deadline=None):
+    """Sends `prompt` (the variable suffix) behind the cached ANALYSIS_INSTRUCTIONS prefix and parses the reply."""
+    generation_config = _generation_config()
+    _request_options(deadline) # Fails fast once the deadline is gone; each attempt below recomputes its own timeout
+    model, prompt_text, prefix_handle = prompt_cache.prefix_cache.model_for(GEMINI_MODEL_NAME, ANALYSIS_INSTRUCTIONS, prompt)
+    if on_field is not None:
+        # Streamed calls are not hedged: a duplicate attempt would emit every field twice
+        started = time.monotonic()
+        response, text = llm_concurrency.call_with_adaptive_limit(
+            lambda: _stream_response_text(model, prompt_text, generation_config, on_field, _request_options(deadline)), api_key, GEMINI_MODEL_NAME, _log,
+            deadline
+        )
+        llm_hedging.latency_tracker.record(GEMINI_MODEL_NAME, time.monotonic() - started)
+        prompt_cache.prefix_cache.record_usage(response, prefix_handle)
+        if not text:
+            _log(f"Gemini response for '{analysis_target_name}' is empty or in an unexpected format.", "error")
+            raise ValueError("Gemini response is empty or in an unexpected format.")
+        return _timed_parse(text, analysis_target_name, _log)
+    response = llm_concurrency.call_with_adaptive_limit(
+        lambda: llm_hedging.call_with_hedging(
+            lambda: _timed_generate(model, prompt_text, generation_config, _request_options(deadline)), GEMINI_MODEL_NAME, _log,
+            llm_concurrency.gemini_limiters.get(api_key, GEMINI_MODEL_NAME)
+        ), api_key, GEMINI_MODEL_NAME, _log, deadline
+    )
+    prompt_cache.prefix_cache.record_usage(response, prefix_handle)
+    return _timed_parse(_response_text(response, analysis_target_name, _log), analysis_target_name, _log)
+
+
+def _analyze_map_reduce(api_key, texts, analysis_target_name, target_type, date_range_str, custom_instructions, _log, deadline=None):
+    """Analyzes `texts` in parallel chunks and merges the partial results; raises if every chunk fails."""
+    chunks, dropped = analysis_merge.chunk_texts(texts, MAX_TOTAL_CHARS_FOR_LLM, MAP_REDUCE_MAX_CHUNKS)
+    _log("Map-reduce analysis for '%s': %d articles in %d chunk(s).", 'info', analysis_target_name, len(texts) - dropped, len(chunks))
+    if dropped:
+        _log(f"Map-reduce input for '{analysis_target_name}' capped at {MAP_REDUCE_MAX_CHUNKS} chunks; {dropped} articles not analyzed.", 'warning')
+
+    def _map(chunk):
+        with stage("llm.prompt_build"):
+            prompt = _build_analysis_prompt(analysis_target_name, target_type, date_range_str, ARTICLE_SEPARATOR.join(chunk), custom_instructions)
+        return _generate_analysis(api_key, prompt, analysis_target_name, _log, deadline=deadline)
+
+    partials = []; last_error = None
+    with ThreadPoolExecutor(max_workers=min(MAP_REDUCE_MAX_WORKERS, len(chunks)), thread_name_prefix="llm-map") as executor:
+        futures = [(executor.submit(propagate(_map), chunk), len(chunk)) for chunk in chunks]
+        for index, (future, article_count) in enumerate(futures):
+            try:
+                with stage("llm.map_wait"):
+                    partial = future.result()
+                partials.append((partial, article_count))
+            except Exception as e:
+                last_error = e
+                _log(f"Map-reduce chunk {index + 1}/{len(chunks)} for '{analysis_target_name}' failed: {str(e)[:100]}", 'warning')
+    if not partials:
+        raise last_error
+    result = analysis_merge.merge_partial_results(partials)
+    result['map_reduce_chunks'] = len(partials)
+    return result
+
+
+# Static prefix for batched per-article scoring (article_scores mode); like ANALYSIS_INSTRUCTIONS it names no target,
+# so one score per article serves every sector and stock the article was fetched for.
+ARTICLE_SCORING_INSTRUCTIONS = """You score Indian market news articles individually. Each request lists numbered articles, one per line, as "[n] text".
+
+For EVERY article return an object with:
+- "id": the article's number n.
+- "score": a float for the market sentiment the article conveys about the companies or sector it covers. Use these ranges: Strongly Positive 0.6 to 1.0, Positive 0.2 to 0.59, Neutral -0.19 to 0.19, Negative -0.59 to -0.2, Strongly Negative -1.0 to -0.6. Purely factual, mixed or market-irrelevant articles are Neutral.
+- "rationale": one short sentence (at most 20 words) explaining the score.
+
+Ensure the output is ONLY a JSON object of the form {"articles": [...]} with one entry per article, and no markdown formatting.
+"""
+ARTICLE_SCORES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "articles": {"type": "array", "items": {
+            "type": "object",
+            "properties": {"id": {"type": "integer"}, "score": {"type": "number"}, "rationale": {"type": "string"}},
+            "required": ["id", "score", "rationale"],
+        }},
+    },
+    "required": ["articles"],
+}
+
+
+def _build_article_scoring_prompt(texts):
+    lines = "\n".join(f"[{index}] {' '.join(text.split())[:article_scores.ARTICLE_SCORE_MAX_CHARS]}" for index, text in enumerate(texts, 1))
+    return f"""
+    Score each of the following {len(texts)} articles.
+
+    --- ARTICLES START ---
+    {lines}
+    --- ARTICLES END ---
+    """
+
+
+def _parse_article_scores(text, batch_hashes, _log):
+    """{content_hash: entry} for the article ids in a scoring reply; unknown ids and malformed items are skipped."""
+    if not STRUCTURED_OUTPUT_ENABLED:
+        json_start_index = text.find('{'); json_end_index = text.rfind('}')
+        if json_start_index == -1 or json_end_index <= json_start_index:
+            raise json.JSONDecodeError("Could not find valid JSON structure in article scoring reply.", text, 0)
+        text = text[json_start_index:json_end_index + 1]
+    items = json.loads(text).get('articles')
+    if not isinstance(items, list):
+        raise ValueError("Article scoring reply has no 'articles' list.")
+    scores = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        index, score = item.get('id'), item.get('score')
+        if not isinstance(index, int) or not 1 <= index <= len(batch_hashes) or not isinstance(score, (int, float)):
+            continue
+        score = round(max(-1.0, min(1.0, float(score))), 3)
+        scores[batch_hashes[index - 1]] = {'score': score, 'label': analysis_merge.sentiment_label_for_score(score),
+                                           'rationale': str(item.get('rationale') or "")[:300]}
+    if len(scores) < len(batch_hashes):
+        _log("Article scoring reply covered %d of %d articles.", 'warning', len(scores), len(batch_hashes))
+    return scores
+
+
+def _score_article_batch(api_key, batch, _log, deadline=None):
+    """Scores one batch [(content_hash, text)] in a single call; returns {content_hash: entry}."""
+    with stage("llm.prompt_build"):
+        prompt = _build_article_scoring_prompt([text for _, text in batch])
+    if STRUCTURED_OUTPUT_ENABLED:
+        generation_config = genai.types.GenerationConfig(temperature=0.2, response_mime_type="application/json", response_schema=ARTICLE_SCORES_SCHEMA)
+    else:
+        generation_config = genai.types.GenerationConfig(temperature=0.2)
+    _request_options(deadline) # Fail fast; each attempt recomputes its own timeout
+    model, prompt_text, prefix_handle = prompt_cache.prefix_cache.model_for(GEMINI_MODEL_NAME, ARTICLE_SCORING_INSTRUCTIONS, prompt)
+    response = llm_concurrency.call_with_adaptive_limit(
+        lambda: llm_hedging.call_with_hedging(
+            lambda: _timed_generate(model, prompt_text, generation_config, _request_options(deadline)), GEMINI_MODEL_NAME, _log,
+            llm_concurrency.gemini_limiters.get(api_key, GEMINI_MODEL_NAME)
+        ), api_key, GEMINI_MODEL_NAME, _log, deadline
+    )
+    prompt_cache.prefix_cache.record_usage(response, prefix_handle)
+    with stage("llm.json_parse"):
+        return _parse_article_scores(_response_text(response, "article scoring", _log), [content_hash for content_hash, _ in batch], _log)
+
+
+def score_articles_with_gemini(_api_key, articles, append_log_func=None, deadline=None):
+    """
+    Per-article scores for Article objects or plain strings: {content_hash: {'score', 'label', 'rationale'}}.
+    Only articles missing from article_scores.article_score_cache are sent, ARTICLE_SCORE_BATCH_SIZE per
+    call; articles another thread is already scoring are waited for rather than sent again.
+    Returns (scores, error_message); articles that could not be scored are missing from `scores`.
+    """
+    _log = make_log_func(logger, "[Gemini][article scores]", append_log_func)
+    texts = {}
+    for item in articles:
+        texts.setdefault(item.content_hash if isinstance(item, Article) else compute_content_hash(item), _article_text(item))
+    cache = article_scores.article_score_cache
+    scores, claimed, in_flight = cache.claim(list(texts))
+    error_message = None
+    if claimed:
+        batch_size = article_scores.ARTICLE_SCORE_BATCH_SIZE
+        batches = [claimed[i:i + batch_size] for i in range(0, len(claimed), batch_size)]
+        _log("Scoring %d new article(s) in %d call(s); %d cached, %d being scored elsewhere.", 'info',
+             len(claimed), len(batches), len(scores), len(in_flight))
+        fresh = {}
+        try:
+            if is_expired(deadline):
+                raise DeadlineExceeded(deadline.reason)
+            _configure_genai(_api_key)
+            with ThreadPoolExecutor(max_workers=min(article_scores.ARTICLE_SCORE_MAX_WORKERS, len(batches)), thread_name_prefix="llm-article-scores") as executor:
+                futures = [executor.submit(propagate(_score_article_batch), _api_key, [(h, texts[h]) for h in batch], _log, deadline)
+                           for batch in batches]
+                for future in futures:
+                    try:
+                        with stage("llm.map_wait"):
+                            fresh.update(future.result())
+                    except Exception as e:
+                        error_message = f"Article scoring failed for some articles: {str(e)[:100]}"
+                        _log(error_message, 'warning')
+        except Exception as e:
+            error_message = f"Article scoring failed: {str(e)[:100]}"
+            _log(error_message, 'error')
+        finally:
+            cache.fulfil(claimed, fresh) # Also releases waiters for hashes that failed
+        scores.update(fresh)
+    for content_hash, event in in_flight.items():
+        remaining = deadline.remaining() if deadline is not None else None
+        event.wait(min(article_scores.ARTICLE_SCORE_WAIT_SECONDS, remaining) if remaining is not None else article_scores.ARTICLE_SCORE_WAIT_SECONDS)
+        entry = cache.get(content_hash)
+        if entry is not None:
+            scores[content_hash] = entry
+    return scores, error_message
+
+
+def _analyze_by_article_scores(_api_key, articles_texts_list, analysis_target_name, append_log_func, _log, on_field=None, deadline=None):
+    """article_scores mode of analyze_news_with_gemini: score articles individually (cached) and aggregate locally."""
+    if is_expired(deadline):
+        _log("Skipping article scoring for '%s': %s.", 'warning', analysis_target_name, deadline.reason)
+        return None, f"Timed out before Gemini analysis for {analysis_target_name}."
+    scores, error_message = score_articles_with_gemini(_api_key, articles_texts_list, append_log_func, deadline)
+    scored = []
+    for item in articles_texts_list:
+        content_hash = item.content_hash if isinstance(item, Article) else compute_content_hash(item)
+        if content_hash in scores:
+            scored.append((content_hash, scores[content_hash]))
+    if not scored:
+        return None, error_message or f"No articles could be scored for {analysis_target_name}."
+    if len(scored) < len(articles_texts_list):
+        _log("Aggregating %d of %d articles for '%s'; the rest could not be scored.", 'warning', len(scored), len(articles_texts_list), analysis_target_name)
+    result = analysis_reuse.label_fresh(article_scores.aggregate_article_scores(analysis_target_name, scored))
+    result['analysis_mode'] = 'article_scores'
+    result['article_scores'] = [{'content_hash': content_hash, 'score': entry['score'], 'label': entry['label'], 'rationale': entry['rationale']}
+                                for content_hash, entry in scored]
+    if on_field is not None:
+        for key in DEFAULT_RESPONSE_STRUCTURE:
+            on_field(key, result[key])
+    return result, None
+
+
 def analyze_news_with_gemini(
     _api_key, articles_texts_list, analysis_target_name, date_range_str,
-    custom_instructions="", append_log_func=None, target_type="sector" # New parameter
+    custom_instructions="", append_log_func=None, target_type="sector", # New parameter
+    on_field=None, deadline=None, reuse=True
 ):
+    """
+    Returns (analysis_dict, error_message). With `on_field`, single-prompt analyses are streamed and
+    on_field(key, value) is called for each top-level field as soon as Gemini has finished it.
+    With a `deadline` (utils.deadline.RequestDeadline), no Gemini call is started once it has
+    expired, and calls in flight get the remaining time as their request timeout.
+    With article_scores.ARTICLE_SCORING_ENABLED, the articles are scored individually (batched,
+    cached per content hash) and the result is aggregated from those scores instead, unless
+    `custom_instructions` are given (those need the single-prompt analysis).
+    `reuse=False` always runs a fresh analysis, even when analysis_reuse would return the previous one
+    (the fresh result is still recorded for later callers).
+    """
     log_msg_prefix = f"[Gemini][{analysis_target_name}]"
     
-    def _log(message, level='info'):
-        full_message = f"{log_msg_prefix} {message}"
-        if level == 'error': logger.error(full_message)
-        elif level == 'warning': logger.warning(full_message)
-        else: logger.info(full_message)
-        if append_log_func: append_log_func(message, level.upper())
+    _log = make_log_func(logger, log_msg_prefix, append_log_func)
 
-    _log(f"Starting analysis for {target_type} '{analysis_target_name}' with {len(articles_texts_list)} articles for dates {date_range_str}.")
+    _log("Starting analysis for %s '%s' with %d articles for dates %s.", 'info', target_type, analysis_target_name, len(articles_texts_list), date_range_str)
 
     if not _api_key or _api_key == "YOUR_GEMINI_API_KEY_HERE":
         err_msg = "Gemini API Key not provided or is a placeholder."
         _log(err_msg, 'error')
         return None, err_msg
 
+    if article_scores.ARTICLE_SCORING_ENABLED and custom_instructions:
+        # Per-article scores are shared across targets and take no instructions; honour them with a target prompt
+        _log("Custom instructions given; using a single-prompt analysis instead of per-article scoring.", 'info')
+    elif article_scores.ARTICLE_SCORING_ENABLED:
+        return _analyze_by_article_scores(_api_key, articles_texts_list, analysis_target_name, append_log_func, _log, on_field, deadline)
+
+    # Skip the LLM when the article set (content hashes + VADER distribution) barely moved since the last run
+    reuse_key = (target_type, analysis_target_name, custom_instructions or "", analysis_reuse.window_key(date_range_str))
+    track_history = analysis_reuse.REUSE_ENABLED or INCREMENTAL_ENABLED
+    current_fingerprint = analysis_reuse.fingerprint(articles_texts_list) if track_history else None
+    previous_entry = analysis_reuse.reuse_cache.get_entry(reuse_key) if track_history else None
+    if reuse and analysis_reuse.REUSE_ENABLED and previous_entry is not None:
+        previous_result, change = analysis_reuse.reuse_cache.lookup(reuse_key, current_fingerprint)
+        if previous_result is not None:
+            _log("Article set for '%s' changed by %.0f%% (VADER mean shift %.3f); reusing previous analysis as stale-but-valid.",
+                 'info', analysis_target_name, change[0] * 100, change[1])
+            return analysis_reuse.label_stale(previous_result, change), None
+
+    if is_expired(deadline):
+        _log("Skipping Gemini analysis for '%s': %s.", 'warning', analysis_target_name, deadline.reason)
+        return None, f"Timed out before Gemini analysis for {analysis_target_name}."
+
     try:
-        genai.configure(api_key=_api_key)
+        _configure_genai(_api_key)
     except Exception as e:
         err_msg = f"Failed to configure Gemini API: {str(e)[:150]}"
         _log(err_msg, 'error')
         return None, err_msg
 
-    MAX_TOTAL_CHARS_FOR_LLM = 25000 
-    truncated_articles_texts_list = []; current_chars = 0; num_original_articles = len(articles_texts_list)
-    for text in articles_texts_list:
-        if current_chars + len(text) > MAX_TOTAL_CHARS_FOR_LLM and truncated_articles_texts_list: break
-        text_to_add = text[:MAX_TOTAL_CHARS_FOR_LLM - current_chars]
-        truncated_articles_texts_list.append(text_to_add); current_chars += len(text_to_add)
-        if current_chars >= MAX_TOTAL_CHARS_FOR_LLM: break
-    
-    if len(truncated_articles_texts_list) < num_original_articles:
-        warn_msg = f"Truncated input for '{analysis_target_name}': {num_original_articles} to {len(truncated_articles_texts_list)} articles ({current_chars} chars)."
-        _log(warn_msg, 'warning')
-    
-    combined_text = "\n\n--- ARTICLE SEPARATOR ---\n\n".join(truncated_articles_texts_list)
-    
-    default_response_structure = { "summary": "N/A", "overall_sentiment": "Neutral", "sentiment_score_llm": 0.0, "sentiment_reason": "N/A", "key_themes": [], "potential_impact": "N/A", "key_companies_mentioned_context": [], "risks_identified": [], "opportunities_identified": []}
-
-    if not combined_text.strip():
-        _log(f"No news content for LLM analysis for '{analysis_target_name}' after potential truncation.")
-        final_response = default_response_structure.copy()
-        final_response["summary"] = f"No news content was available for LLM analysis for {analysis_target_name}."
-        final_response["sentiment_reason"] = "No articles available or all were empty/irrelevant for the LLM."
-        return final_response, None
+    new_hashes = _plan_incremental_update(previous_entry, current_fingerprint[0], _log) if current_fingerprint is not None else None
+    if new_hashes is not None:
+        texts_to_send = [_article_text(item) for item in articles_texts_list
+                         if (item.content_hash if isinstance(item, Article) else analysis_reuse.compute_content_hash(item)) in new_hashes]
+        _log("Incremental analysis for '%s': sending %d new of %d articles with the prior result.", 'info',
+             analysis_target_name, len(texts_to_send), len(articles_texts_list))
+    else:
+        texts_to_send = [_article_text(item) for item in articles_texts_list]
 
-    # Determine if we are analyzing a sector or a stock to tailor the prompt slightly
-    # The `analysis_target_name` will be the stock name if target_type is "stock"
-    # The prompt should inherently work, but we could add a specific instruction if needed.
-    # For now, relying on `analysis_target_name` to correctly scope the analysis.
+    total_chars = sum(len(text) for text in texts_to_send)
+    if new_hashes is not None and MAP_REDUCE_ENABLED and total_chars > MAP_REDUCE_THRESHOLD_CHARS:
+        _log("New articles for '%s' exceed one prompt; running a full analysis instead.", 'info', analysis_target_name)
+        new_hashes = None
+        texts_to_send = [_article_text(item) for item in articles_texts_list]
+        total_chars = sum(len(text) for text in texts_to_send)
+    use_map_reduce = new_hashes is None and MAP_REDUCE_ENABLED and total_chars > MAP_REDUCE_THRESHOLD_CHARS
 
-    prompt = f"""
-    Analyze the following news articles concerning '{analysis_target_name}' (which is a {target_type}) in the Indian market, from the period '{date_range_str}'.
-    Articles are concatenated and separated by '--- ARTICLE SEPARATOR ---'.
+    combined_text = ""
+    if not use_map_reduce:
+        num_original_articles = len(texts_to_send)
+        truncated_articles_texts_list, current_chars = _truncate_texts(texts_to_send)
+        
+        if len(truncated_articles_texts_list) < num_original_articles:
+            warn_msg = f"Truncated input for '{analysis_target_name}': {num_original_articles} to {len(truncated_articles_texts_list)} articles ({current_chars} chars)."
+            _log(warn_msg, 'warning')
+        
+        combined_text = ARTICLE_SEPARATOR.join(truncated_articles_texts_list)
 
-    --- NEWS CONTENT START ---
-    {combined_text}
-    --- NEWS CONTENT END ---
+        if not combined_text.strip():
+            _log(f"No news content for LLM analysis for '{analysis_target_name}' after potential truncation.")
+            final_response = DEFAULT_RESPONSE_STRUCTURE.copy()
+            final_response["summary"] = f"No news content was available for LLM analysis for {analysis_target_name}."
+            final_response["sentiment_reason"] = "No articles available or all were empty/irrelevant for the LLM."
+            return final_response, None
 
-    {custom_instructions if custom_instructions else f"Focus on financial and market implications specifically for '{analysis_target_name}'. Be concise and objective."}
-
-    Your task is to provide a structured analysis in JSON format. The JSON object must include the following keys:
-    - "summary": A concise 2-3 sentence summary of the key news and developments for '{analysis_target_name}'. If no relevant news is found specific to '{analysis_target_name}', state that clearly.
-    - "overall_sentiment": Classify the overall sentiment FOR '{analysis_target_name}'. Choose one: "Strongly Positive", "Positive", "Neutral", "Negative", "Strongly Negative". This should align with your "sentiment_score_llm".
-    - "sentiment_score_llm": A float value representing the sentiment FOR '{analysis_target_name}'. Adhere to these ranges:
-        - Strongly Positive: 0.6 to 1.0
-        - Positive: 0.2 to 0.59
-        - Neutral: -0.19 to 0.19
-        - Negative: -0.59 to -0.2
-        - Strongly Negative: -1.0 to -0.6
-      GUIDANCE FOR NEUTRAL SCORES (apply this considering '{analysis_target_name}'):
-      1. If the news contains a mix of positive and negative developments for '{analysis_target_name}', and they roughly balance out, assign a score near 0.0 (e.g., -0.05 to 0.05).
-      2. If the news is predominantly factual without clear positive or negative sentiment cues *directly impacting '{analysis_target_name}'*, assign a score in the Neutral range.
-      3. If the news primarily concerns broader market/sector trends that only *indirectly* relate to '{analysis_target_name}', its specific sentiment is likely Neutral. However, if the *overall tone* of these indirect news items is slightly positive (e.g. general market optimism), you can use a score like 0.1 to 0.19 for '{analysis_target_name}'. If the tone is slightly negative, use -0.1 to -0.19.
-      4. If there is truly no relevant information specific to '{analysis_target_name}' or the information is entirely non-consequential, a score of 0.0 is appropriate.
-      Your score should reflect the *net sentiment impact on '{analysis_target_name}'* based on the provided articles.
-    - "sentiment_reason": A brief 1-sentence explanation for the assigned sentiment and score for '{analysis_target_name}'. If sentiment is Neutral due to indirect news or mixed signals, explain that.
-    - "key_themes": A list of 2-3 dominant themes emerging from the news concerning '{analysis_target_name}'. If no relevant news, this can be an empty list or state "N/A due to lack of relevant news".
-    - "potential_impact": A 1-sentence assessment of the potential impact on '{analysis_target_name}'. If no relevant news, state "N/A".
-    - "key_companies_mentioned_context": If analyzing a SECTOR, list key companies. If analyzing a specific STOCK ('{analysis_target_name}'), this list can be broader entities or related companies mentioned. Provide brief context. Empty list if not applicable.
-    - "risks_identified": A list of 1-2 potential risks for '{analysis_target_name}'. Each risk a short string. Empty list if none or no relevant news.
-    - "opportunities_identified": A list of 1-2 potential opportunities for '{analysis_target_name}'. Each opportunity a short string. Empty list if none or no relevant news.
-
-    Ensure the output is ONLY the JSON object, without any preceding or succeeding text, and no markdown formatting for the JSON block itself.
-    """
     try:
-        model_name = 'gemini-1.5-flash-latest'
-        _log(f"Using Gemini model: {model_name} for '{analysis_target_name}'", 'info')
-        model = genai.GenerativeModel(model_name)
-        generation_config = genai.types.GenerationConfig(temperature=0.3)
-        response = model.generate_content(prompt, generation_config=generation_config)
-        
-        cleaned_response_text = ""
-        if hasattr(response, 'text') and response.text: cleaned_response_text = response.text.strip()
-        elif response.parts: cleaned_response_text = "".join(part.text for part in response.parts).strip()
-        else: 
-            _log(f"Gemini response for '{analysis_target_name}' is empty or in an unexpected format.", "error")
-            raise ValueError("Gemini response is empty or in an unexpected format.")
+        model_name = GEMINI_MODEL_NAME
+        _log("Using Gemini model: %s for '%s'", 'info', model_name, analysis_target_name)
+        if use_map_reduce:
+            result = _analyze_map_reduce(_api_key, texts_to_send, analysis_target_name, target_type, date_range_str, custom_instructions, _log, deadline)
+        elif new_hashes is not None:
+            with stage("llm.prompt_build"):
+                prompt = _build_incremental_prompt(analysis_target_name, target_type, date_range_str, previous_entry['result'], combined_text, custom_instructions)
+            result = _generate_analysis(_api_key, prompt, analysis_target_name, _log, on_field, deadline)
+        else:
+            with stage("llm.prompt_build"):
+                prompt = _build_analysis_prompt(analysis_target_name, target_type, date_range_str, combined_text, custom_instructions)
+            result = _generate_analysis(_api_key, prompt, analysis_target_name, _log, on_field, deadline)
 
-        if cleaned_response_text.startswith("```json"): cleaned_response_text = cleaned_response_text[len("```json"):].strip()
-        if cleaned_response_text.endswith("```"): cleaned_response_text = cleaned_response_text[:-len("```")].strip()
-        
-        json_start_index = cleaned_response_text.find('{'); json_end_index = cleaned_response_text.rfind('}')
-        if json_start_index != -1 and json_end_index != -1 and json_end_index > json_start_index:
-            cleaned_response_text = cleaned_response_text[json_start_index : json_end_index+1]
-        else: 
-            _log(f"Could not find valid JSON structure in response for '{analysis_target_name}': '{cleaned_response_text[:200]}...'", 'error')
-            raise json.JSONDecodeError(f"Could not find valid JSON structure in response for {analysis_target_name}.", cleaned_response_text, 0)
-
-        result = json.loads(cleaned_response_text)
-        
-        for key, default_value in default_response_structure.items():
-            if key not in result:
-                _log(f"Gemini response for '{analysis_target_name}' missing key '{key}'. Using default: {default_value}", 'warning')
-                result[key] = default_value
-            elif isinstance(default_value, list) and not isinstance(result.get(key), list):
-                _log(f"Gemini response key '{key}' for '{analysis_target_name}' is not a list as expected. Defaulting to empty list.", 'warning')
-                result[key] = []
-            elif key == "sentiment_score_llm" and not isinstance(result.get(key), (float, int)):
-                _log(f"Gemini response key 'sentiment_score_llm' for '{analysis_target_name}' is not a number. Defaulting to 0.0.", 'warning')
-                result[key] = 0.0
-
-        _log(f"Analysis successfully completed for '{analysis_target_name}'.")
+        _log("Analysis successfully completed for '%s'.", 'info', analysis_target_name)
+        result = analysis_reuse.label_fresh(result)
+        result['analysis_mode'] = 'incremental' if new_hashes is not None else ('map_reduce' if use_map_reduce else 'full')
+        if current_fingerprint is not None:
+            if new_hashes is not None:
+                analysis_reuse.reuse_cache.store(reuse_key, current_fingerprint, result,
+                                                 previous_entry['delta_generation'] + 1, previous_entry['last_full_at'])
+            else:
+                analysis_reuse.reuse_cache.store(reuse_key, current_fingerprint, result)
         return result, None
 
+    except DeadlineExceeded as e:
+        _log("Gemini analysis for '%s' stopped: %s.", 'warning', analysis_target_name, e)
+        return None, f"Timed out before Gemini analysis for {analysis_target_name}."
     except json.JSONDecodeError as e:
-        err_msg = f"Gemini JSON Decode Error for '{analysis_target_name}': {str(e)[:150]}. Response: '{cleaned_response_text[:200]}...'"
+        err_msg = f"Gemini JSON Decode Error for '{analysis_target_name}': {str(e)[:150]}. Response: '{(e.doc or '')[:200]}...'"
         _log(err_msg, 'error')
         return None, f"Gemini returned an invalid JSON for {analysis_target_name}. Please check server logs."
     except Exception as e:
@@ -717,4 +1181,4 @@ def analyze_news_with_gemini(
         logger.exception(f"{log_msg_prefix} Full Gemini Exception for {analysis_target_name}") 
         return None, f"Error during Gemini analysis for {analysis_target_name}: {str(e)[:100]}"
 
-NEWSAPI_INDIA_MARKET_KEYWORDS = ["India", "Indian market", "NSE", "BSE", "Indian economy"]
\ No newline at end of file
+NEWSAPI_INDIA_MARKET_KEYWORDS = ["India", "Indian market", "NSE", "BSE", "Indian economy"]
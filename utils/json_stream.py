@@ -0,0 +1,64 @@
+# utils/json_stream.py
+import json
+
+
+class TopLevelFieldParser:
+    """
+    Incremental parser for a streamed JSON object. feed() takes text fragments as they
+    arrive and returns the (key, value) pairs of top-level fields that became complete,
+    so e.g. "summary" can be forwarded before the rest of the object has been generated.
+    Anything before the first '{' (such as a ```json fence) is ignored.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._key = None
+        self._key_start = None
+        self._value_start = None
+        self.done = False
+
+    def feed(self, fragment):
+        completed = []
+        if self.done or not fragment:
+            return completed
+        self._text += fragment
+        text = self._text
+        while self._pos < len(text) and not self.done:
+            char = text[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._key_start is not None:
+                        self._key = json.loads(text[self._key_start:self._pos + 1])
+                        self._key_start = None
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None and self._value_start is None:
+                    self._key_start = self._pos
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]' or (char == ',' and self._depth == 1):
+                if self._depth == 1 and self._key is not None and self._value_start is not None:
+                    completed.extend(self._finish_field(text[self._value_start:self._pos]))
+                if char != ',':
+                    self._depth -= 1
+                    self.done = self._depth == 0
+            elif char == ':' and self._depth == 1 and self._key is not None and self._value_start is None:
+                self._value_start = self._pos + 1
+            self._pos += 1
+        return completed
+
+    def _finish_field(self, raw_value):
+        key, self._key, self._value_start = self._key, None, None
+        try:
+            return [(key, json.loads(raw_value))]
+        except ValueError:
+            return [] # Malformed value; the full-response parse reports it
@@ -0,0 +1,96 @@
+# utils/llm_concurrency.py
+import hashlib
+import logging
+import threading
+import time
+from google.api_core import exceptions as google_exceptions
+from .deadline import DeadlineExceeded, is_expired
+from .rate_limiter import AIMDConcurrencyLimiter
+from .request_profiling import stage
+
+logger = logging.getLogger(__name__)
+
+GEMINI_INITIAL_CONCURRENCY = 2
+GEMINI_MIN_CONCURRENCY = 1
+GEMINI_MAX_CONCURRENCY = 16
+THROTTLE_RETRIES = 2 # A throttled call is retried (after backoff) before it surfaces as an analysis error
+THROTTLE_BACKOFF_SECONDS = 2.0
+
+
+def _key_id(api_key):
+    return hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:12]
+
+
+class LimiterRegistry:
+    """One AIMDConcurrencyLimiter per (API key, model); Gemini quotas are tracked per key and model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limiters = {}
+
+    def get(self, api_key, model_name):
+        key = (_key_id(api_key), model_name)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if limiter is None:
+                limiter = AIMDConcurrencyLimiter(GEMINI_INITIAL_CONCURRENCY, GEMINI_MIN_CONCURRENCY, GEMINI_MAX_CONCURRENCY)
+                self._limiters[key] = limiter
+            return limiter
+
+    def metrics(self):
+        with self._lock:
+            items = list(self._limiters.items())
+        return [{'api_key_id': key_id, 'model': model_name, 'concurrency_limit': limiter.limit,
+                 'in_flight': limiter.in_flight, 'throttled_calls': limiter.throttled_calls}
+                for (key_id, model_name), limiter in items]
+
+
+gemini_limiters = LimiterRegistry()
+
+
+def configure_concurrency(initial, minimum=GEMINI_MIN_CONCURRENCY, maximum=GEMINI_MAX_CONCURRENCY):
+    global gemini_limiters, GEMINI_INITIAL_CONCURRENCY, GEMINI_MIN_CONCURRENCY, GEMINI_MAX_CONCURRENCY
+    GEMINI_INITIAL_CONCURRENCY, GEMINI_MIN_CONCURRENCY, GEMINI_MAX_CONCURRENCY = initial, minimum, maximum
+    gemini_limiters = LimiterRegistry()
+
+
+def is_throttle_error(error):
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return True
+    return '429' in str(error) or 'resource exhausted' in str(error).lower()
+
+
+def call_with_adaptive_limit(call, api_key, model_name, log_func=None, deadline=None):
+    """
+    Runs `call()` inside the (key, model) limiter; throttled attempts shrink the limit and are retried.
+    With a `deadline`, the slot wait is bounded by the time left, and a retry whose backoff would outlast
+    it is not made (the throttle error surfaces). `call` is invoked afresh per attempt, so it should
+    derive its request timeout from the deadline each time.
+    """
+    limiter = gemini_limiters.get(api_key, model_name)
+    for attempt in range(THROTTLE_RETRIES + 1):
+        if is_expired(deadline):
+            raise DeadlineExceeded(deadline.reason)
+        with stage("llm.slot_wait"):
+            token = limiter.acquire(timeout=deadline.remaining() if deadline is not None else None)
+        if token is None:
+            deadline.cancel("deadline exceeded")
+            raise DeadlineExceeded(deadline.reason)
+        try:
+            result = call()
+        except Exception as e:
+            throttled = is_throttle_error(e)
+            limiter.release(token, throttled=throttled)
+            if not throttled or attempt == THROTTLE_RETRIES:
+                raise
+            backoff = THROTTLE_BACKOFF_SECONDS * (2 ** attempt)
+            remaining = deadline.remaining() if deadline is not None else None
+            if remaining is not None and remaining <= backoff:
+                if log_func: log_func("Gemini throttled the request; not retrying, only %.1fs left before the deadline.", 'warning', remaining)
+                raise
+            if log_func: log_func("Gemini throttled the request; concurrency limit for %s is now %d. Retrying.", 'warning', model_name, limiter.limit)
+            with stage("llm.throttle_backoff"):
+                time.sleep(backoff)
+            continue
+        limiter.release(token)
+        return result
@@ -0,0 +1,177 @@
+# utils/llm_hedging.py
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from . import llm_concurrency
+from .llm_concurrency import is_throttle_error
+from .request_profiling import stage, propagate
+
+logger = logging.getLogger(__name__)
+
+HEDGING_ENABLED = False
+HEDGE_LATENCY_PERCENTILE = 0.95 # Fire the duplicate once a call outlives this percentile of recent latency
+HEDGE_MAX_EXTRA_FRACTION = 0.1 # At most this share of recent calls may get a duplicate
+HEDGE_MIN_SAMPLES = 20 # No hedging until the model has this many latency samples
+LATENCY_WINDOW = 200
+
+_hedge_executor = None
+_hedge_executor_size = 0
+_hedge_executor_lock = threading.Lock()
+
+
+def _executor():
+    # Room for every primary the AIMD limit can admit plus one hedge each, so neither ever queues here
+    global _hedge_executor, _hedge_executor_size
+    size = 2 * llm_concurrency.GEMINI_MAX_CONCURRENCY
+    with _hedge_executor_lock:
+        if _hedge_executor is None or _hedge_executor_size < size:
+            if _hedge_executor is not None:
+                _hedge_executor.shutdown(wait=False) # Calls already submitted still finish
+            _hedge_executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="llm-hedge")
+            _hedge_executor_size = size
+        return _hedge_executor
+
+
+class LatencyTracker:
+    """Recent call latencies per model; the hedge threshold follows them automatically."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._window = window
+
+    def record(self, model_name, seconds):
+        with self._lock:
+            self._samples.setdefault(model_name, deque(maxlen=self._window)).append(seconds)
+
+    def percentile(self, model_name, q):
+        with self._lock:
+            samples = sorted(self._samples.get(model_name, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class HedgeBudget:
+    """Caps hedges to HEDGE_MAX_EXTRA_FRACTION of the last LATENCY_WINDOW requests sent per model."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sent = {} # model -> deque of is_hedge flags, one per request sent
+
+    def record_call(self, model_name):
+        with self._lock:
+            self._sent.setdefault(model_name, deque(maxlen=LATENCY_WINDOW)).append(False)
+
+    def try_spend(self, model_name):
+        with self._lock:
+            sent = self._sent.setdefault(model_name, deque(maxlen=LATENCY_WINDOW))
+            hedges = sum(sent)
+            if hedges + 1 > HEDGE_MAX_EXTRA_FRACTION * max(len(sent) - hedges, 1):
+                return False
+            sent.append(True)
+            return True
+
+
+latency_tracker = LatencyTracker()
+hedge_budget = HedgeBudget()
+hedge_stats = {'calls': 0, 'hedges_fired': 0, 'hedges_won': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(stat):
+    with _stats_lock:
+        hedge_stats[stat] += 1
+
+
+def configure_hedging(enabled, percentile=HEDGE_LATENCY_PERCENTILE, max_extra_fraction=HEDGE_MAX_EXTRA_FRACTION):
+    global HEDGING_ENABLED, HEDGE_LATENCY_PERCENTILE, HEDGE_MAX_EXTRA_FRACTION
+    HEDGING_ENABLED, HEDGE_LATENCY_PERCENTILE, HEDGE_MAX_EXTRA_FRACTION = enabled, percentile, max_extra_fraction
+
+
+def _timed(call, model_name):
+    started = time.monotonic()
+    result = call()
+    latency_tracker.record(model_name, time.monotonic() - started)
+    return result
+
+
+def _slot_releaser(limiter, token):
+    # One-shot: whichever of the winner pick or the hedge's own completion comes first frees the slot
+    lock = threading.Lock()
+    released = []
+
+    def _release(throttled=False):
+        if limiter is None:
+            return
+        with lock:
+            if released:
+                return
+            released.append(True)
+        limiter.release(token, throttled=throttled)
+    return _release
+
+
+def _run_hedge(call, model_name, release_slot):
+    # The duplicate holds its own AIMD slot, so a throttled hedge shrinks the limit like any other call
+    try:
+        result = _timed(call, model_name)
+    except Exception as e:
+        release_slot(throttled=is_throttle_error(e))
+        raise
+    release_slot()
+    return result
+
+
+def call_with_hedging(call, model_name, log_func=None, limiter=None):
+    """
+    Runs `call()` (a blocking LLM request). With hedging enabled and enough latency history,
+    a duplicate is fired if the first attempt outlives the model's HEDGE_LATENCY_PERCENTILE
+    latency (timed from when it actually started), and whichever succeeds first wins. With a
+    `limiter` (the caller's AIMD limiter, whose slot the first attempt holds), the duplicate
+    needs a free slot of its own and is skipped when there is none. The loser cannot be
+    cancelled mid-request; its result is discarded and it stops counting against the limit as
+    soon as the winner is chosen (the first attempt's slot goes back when the caller returns).
+    """
+    _count('calls')
+    if not HEDGING_ENABLED:
+        return _timed(call, model_name)
+
+    hedge_budget.record_call(model_name)
+    threshold = latency_tracker.percentile(model_name, HEDGE_LATENCY_PERCENTILE)
+    if threshold is None:
+        return _timed(call, model_name)
+    started = threading.Event()
+
+    def _primary():
+        started.set()
+        return _timed(call, model_name)
+
+    primary = _executor().submit(propagate(_primary))
+    with stage("llm.hedge_wait"):
+        started.wait()
+        done, _ = wait([primary], timeout=threshold)
+        if done or not hedge_budget.try_spend(model_name):
+            return primary.result()
+        token = limiter.acquire(timeout=0) if limiter is not None else None
+        if limiter is not None and token is None:
+            return primary.result() # At the concurrency limit: a duplicate would only add load
+
+    _count('hedges_fired')
+    if log_func: log_func("Gemini call exceeded p%d latency (%.2fs); sending a hedged duplicate.", 'info', int(HEDGE_LATENCY_PERCENTILE * 100), threshold)
+    release_hedge_slot = _slot_releaser(limiter, token)
+    hedge = _executor().submit(propagate(_run_hedge), call, model_name, release_hedge_slot)
+    pending = {primary, hedge}
+    last_error = None
+    while pending:
+        with stage("llm.hedge_wait"):
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is hedge: _count('hedges_won')
+                release_hedge_slot() # A hedge still in flight has lost; its slot is not held until it returns
+                return future.result()
+            last_error = future.exception()
+    raise last_error
@@ -0,0 +1,119 @@
+# utils/log_utils.py
+import atexit
+import logging
+import logging.handlers
+import queue
+import time
+from collections import deque
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(filename)s:%(lineno)d (%(funcName)s)] - %(message)s'
+DEFAULT_UI_LOG_MAX_ENTRIES = 500
+
+_queue_listener = None
+
+
+_LEVELS_BY_NAME = {
+    'DEBUG': logging.DEBUG, 'INFO': logging.INFO, 'WARNING': logging.WARNING,
+    'WARN': logging.WARNING, 'ERROR': logging.ERROR, 'CRITICAL': logging.CRITICAL,
+}
+
+
+def _to_levelno(level):
+    if isinstance(level, int):
+        return level
+    return _LEVELS_BY_NAME.get(str(level).upper(), logging.INFO)
+
+
+def configure_logging(level='INFO'):
+    """
+    Routes all records through a QueueHandler so request threads only enqueue; a
+    background QueueListener does the formatting and stream I/O.
+    Safe to call more than once (e.g. under the Flask reloader).
+    """
+    global _queue_listener
+    root_logger = logging.getLogger()
+    root_logger.setLevel(_to_levelno(level))
+    if _queue_listener is not None:
+        return _queue_listener
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _queue_listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _queue_listener.start()
+    atexit.register(_queue_listener.stop)
+    return _queue_listener
+
+
+class RequestLogCollector:
+    """
+    Per-request UI log: a bounded ring buffer of (created, levelno, message, args) records.
+    Records below `ui_level` are never stored, and messages are only %-formatted when
+    entries() builds the JSON list for the response.
+
+    Calling the collector directly, `collector(message, level, *args)`, also logs once to
+    `logger`; helpers that already logged to their own module logger use capture() instead
+    (see make_log_func), so nothing is written to the server log twice.
+    """
+
+    def __init__(self, logger, ui_level='INFO', max_entries=DEFAULT_UI_LOG_MAX_ENTRIES):
+        self.logger = logger
+        self.ui_levelno = _to_levelno(ui_level)
+        self._records = deque(maxlen=max_entries)
+        self.dropped = 0
+
+    def capture(self, levelno, message, args=()):
+        if levelno < self.ui_levelno:
+            return
+        if len(self._records) == self._records.maxlen:
+            self.dropped += 1
+        self._records.append((time.time(), levelno, message, args))
+
+    def __call__(self, message, level='INFO', *args):
+        levelno = _to_levelno(level)
+        if self.logger.isEnabledFor(levelno):
+            self.logger.log(levelno, "API_LOG_UI: " + str(message), *args, stacklevel=2)
+        self.capture(levelno, message, args)
+
+    def entries(self):
+        entries = []
+        if self.dropped:
+            entries.append({'timestamp': '', 'level': 'WARNING', 'message': f"{self.dropped} older log entries were dropped."})
+        for created, levelno, message, args in self._records:
+            text = str(message)
+            if args:
+                try:
+                    text = text % args
+                except (TypeError, ValueError):
+                    text = f"{text} {args}"
+            entries.append({
+                'timestamp': time.strftime("%H:%M:%S", time.localtime(created)) + f".{int(created * 1000) % 1000:03d}",
+                'message': text,
+                'level': logging.getLevelName(levelno),
+            })
+        return entries
+
+
+def make_log_func(logger, prefix, append_log_func=None):
+    """
+    Returns `_log(message, level='info', *args)` for helper modules: logs once to `logger`
+    with `prefix` (formatting deferred to the logging machinery) and forwards the
+    unprefixed message to the request's UI log.
+    """
+    escaped_prefix = prefix.replace('%', '%%')
+
+    def _log(message, level='info', *args):
+        levelno = _to_levelno(level)
+        if logger.isEnabledFor(levelno):
+            logger.log(levelno, f"{escaped_prefix} {message}", *args, stacklevel=2)
+        if append_log_func is None:
+            return
+        capture = getattr(append_log_func, 'capture', None)
+        if capture is not None:
+            capture(levelno, message, args)
+        else:
+            append_log_func(str(message) % args if args else message, logging.getLevelName(levelno))
+    return _log
@@ -0,0 +1,312 @@
+# utils/news_search.py
+import heapq
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+from . import text_corpus
+from .bm25_ranker import BM25_B, BM25_K1, _STOPWORDS
+
+logger = logging.getLogger(__name__)
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 200
+SEARCH_SNIPPET_CHARS = 240
+SEARCH_MAX_QUERY_CHARS = 500
+ALIAS_GENERIC_MIN_STOCKS = 3 # A keyword word used by this many stocks ("India", "IT", "digital") is not part of an alias
+
+# Keeps "L&T", "M&M", "Dr. Reddy's" and "U.S." together; hyphenated names ("Bajaj-Auto") split like spaces
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[&.'’][a-z0-9]+)*")
+_QUERY_PATTERN = re.compile(r'-?(?i:stock:)?"[^"]*"|[()]|[^\s()"]+')
+_ACRONYM_PATTERN = re.compile(r"[A-Z].*[A-Z]|[0-9&]") # TCS, BoB, TechM, M&M
+ENTITY_PREFIX = "stock:" # Postings key of a stock's entity term; cannot come out of the tokenizer
+
+
+def _normalize(token):
+    token = token.replace('’', "'")
+    if token.endswith("'s"):
+        token = token[:-2]
+    return token.replace("'", "").replace(".", "")
+
+
+def tokenize(text):
+    """Lower-cased search tokens; stopwords are dropped before positions are assigned, in documents and queries alike."""
+    if not text:
+        return []
+    tokens = (_normalize(tok) for tok in _TOKEN_PATTERN.findall(text.lower()))
+    return [tok for tok in tokens if tok and tok not in _STOPWORDS]
+
+
+def build_alias_table(sectors_config):
+    """
+    Maps alias token tuples -> stock name from the stock keyword lists. Each keyword is an alias
+    as written and minus its trailing generic words ("TCS India" -> tcs, "State Bank of India" ->
+    state bank), as is the stock name itself. An alias claimed by two stocks ("HDFC banking" and
+    "HDFC insurance" -> hdfc) is dropped as ambiguous; overlapping ones ("sbi" vs "sbi life") are
+    resolved at indexing time by taking the longest match.
+    """
+    keywords_by_stock = {}
+    for sector_config in sectors_config.values():
+        for stock_name, keywords in sector_config.get("stocks", {}).items():
+            keywords_by_stock.setdefault(stock_name, set()).update(keywords)
+    stocks_per_word = Counter(word for keywords in keywords_by_stock.values()
+                              for word in {tok for keyword in keywords for tok in tokenize(keyword)})
+    generic = {word for word, count in stocks_per_word.items() if count >= ALIAS_GENERIC_MIN_STOCKS}
+
+    claims = {}; own_names = {}
+    for stock_name, keywords in keywords_by_stock.items():
+        name_tokens = tuple(tokenize(stock_name))
+        if name_tokens:
+            own_names[name_tokens] = stock_name
+        for keyword in keywords:
+            full = tuple(tokenize(keyword))
+            if full:
+                claims.setdefault(full, set()).add(stock_name) # The keyword as written is an alias too
+            tokens = list(full)
+            while tokens and tokens[-1] in generic: tokens.pop()
+            if not tokens or (len(tokens) == 1 < len(full) and not _ACRONYM_PATTERN.search(keyword.split()[0])):
+                continue # "Yes banking" -> "yes" is a word, not a name; "SBI banking" -> "sbi" is kept
+            claims.setdefault(tuple(tokens), set()).add(stock_name)
+
+    aliases = {alias: next(iter(stocks)) for alias, stocks in claims.items() if len(stocks) == 1}
+    aliases.update(own_names) # A stock's own name is never ambiguous ("SBI" vs "SBI insurance" for SBI Life)
+    return aliases
+
+
+def _parse_query(query):
+    """
+    Parses into a tree of ('and'|'or', [nodes]), ('not', node), ('phrase', tokens) and ('stock', name).
+    Terms are ANDed by default; OR, AND, NOT, a leading '-', "quoted phrases", parentheses and
+    stock:<name or alias> are understood. Raises ValueError for an unusable query.
+    """
+    parts = _QUERY_PATTERN.findall(query)
+    position = 0
+
+    def peek():
+        return parts[position] if position < len(parts) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return parts[position - 1]
+
+    def parse_or():
+        nodes = [parse_and()]
+        while peek() == "OR":
+            take(); nodes.append(parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', nodes)
+
+    def parse_and():
+        nodes = []
+        while peek() not in (None, ")", "OR"):
+            if peek() == "AND":
+                take(); continue
+            node = parse_unary()
+            if node is not None:
+                nodes.append(node)
+        if not nodes:
+            raise ValueError("Empty search expression.")
+        return nodes[0] if len(nodes) == 1 else ('and', nodes)
+
+    def parse_unary():
+        part = take()
+        if part == "NOT":
+            operand = parse_unary() if peek() not in (None, ")", "OR") else None
+            if operand is None: # Nothing, or only stopwords
+                raise ValueError("NOT must be followed by a term.")
+            return ('not', operand)
+        if part == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Unbalanced parentheses.")
+            take()
+            return node
+        negate = part.startswith("-") and len(part) > 1
+        part = part[1:] if negate else part
+        if part.lower().startswith(ENTITY_PREFIX):
+            node = ('stock', part[len(ENTITY_PREFIX):].strip('"'))
+        else:
+            tokens = tokenize(part.strip('"'))
+            if not tokens:
+                return None # Only stopwords/punctuation
+            node = ('phrase', tokens)
+        return ('not', node) if negate else node
+
+    tree = parse_or()
+    if peek() is not None:
+        raise ValueError(f"Unexpected '{peek()}' in search query.")
+    return tree
+
+
+class NewsSearchIndex:
+    """
+    Positional inverted index over the article store (articles table plus the text corpus), kept
+    current incrementally by rowid: each search first indexes only articles added since the last one.
+    Stock mentions under any configured alias also post an entity term, so "TCS" finds articles
+    that only say "Tata Consultancy Services". Text is not retained; snippets re-read the few
+    articles returned.
+    """
+
+    def __init__(self, store, sectors_config):
+        self.store = store
+        self._lock = threading.RLock()
+        self._postings = {} # term -> {doc_id: (positions...)}
+        self._docs = {} # doc_id (articles rowid) -> (content_hash, day, source, uri, length)
+        self._total_length = 0
+        self._last_rowid = 0
+        self.set_aliases(sectors_config)
+
+    def set_aliases(self, sectors_config):
+        """(Re)builds the alias table; articles already indexed keep the entity terms they were given."""
+        aliases = build_alias_table(sectors_config)
+        by_first = {}
+        for alias, stock_name in aliases.items():
+            by_first.setdefault(alias[0], []).append((alias, stock_name))
+        for candidates in by_first.values():
+            candidates.sort(key=lambda item: -len(item[0])) # Longest alias first at each position
+        with self._lock:
+            self._aliases, self._aliases_by_first = aliases, by_first
+            self._stock_names = {stock_name.lower(): stock_name for stock_name in aliases.values()}
+
+    def refresh(self):
+        """Indexes articles added to the store since the last refresh; returns how many."""
+        with self._lock:
+            corpus = text_corpus.get_corpus()
+            added = 0
+            for rows in self.store.iter_query(
+                "SELECT rowid, content_hash, content, day, source, uri FROM articles WHERE rowid > ? ORDER BY rowid", (self._last_rowid,)
+            ):
+                for rowid, content_hash, content, day, source, uri in rows:
+                    if not content and corpus is not None:
+                        content = corpus.text(content_hash) or ""
+                    self._add_document(rowid, content_hash, content, day, source, uri)
+                    self._last_rowid = rowid; added += 1
+            if added:
+                logger.debug("Search index: %d article(s) added, %d indexed.", added, len(self._docs))
+            return added
+
+    def _add_document(self, doc_id, content_hash, text, day, source, uri):
+        tokens = tokenize(text)
+        positions = {}
+        for position, token in enumerate(tokens):
+            positions.setdefault(token, []).append(position)
+        for position, token in enumerate(tokens):
+            for alias, stock_name in self._aliases_by_first.get(token, ()):
+                if tuple(tokens[position:position + len(alias)]) == alias:
+                    positions.setdefault(ENTITY_PREFIX + stock_name, []).append(position)
+                    break
+        for term, term_positions in positions.items():
+            self._postings.setdefault(term, {})[doc_id] = tuple(term_positions)
+        self._docs[doc_id] = (content_hash, day or "", source or "N/A", uri or "", len(tokens))
+        self._total_length += len(tokens)
+
+    def _phrase_docs(self, tokens):
+        if len(tokens) == 1:
+            alias_stock = self._aliases.get(tuple(tokens))
+            docs = set(self._postings.get(tokens[0], ()))
+            if alias_stock:
+                docs |= set(self._postings.get(ENTITY_PREFIX + alias_stock, ()))
+            return docs
+        lists = [self._postings.get(token) for token in tokens]
+        docs = set()
+        if all(lists):
+            for doc_id in set.intersection(*(set(postings) for postings in lists)):
+                later = [set(postings[doc_id]) for postings in lists[1:]]
+                if any(all(start + offset + 1 in positions for offset, positions in enumerate(later)) for start in lists[0][doc_id]):
+                    docs.add(doc_id)
+        alias_stock = self._aliases.get(tuple(tokens))
+        if alias_stock: # A quoted alias ("Tech Mahindra") also matches the stock's other aliases ("TechM")
+            docs |= set(self._postings.get(ENTITY_PREFIX + alias_stock, ()))
+        return docs
+
+    def _stock_docs(self, name):
+        tokens = tuple(tokenize(name))
+        stock_name = self._stock_names.get(name.lower()) or self._aliases.get(tokens)
+        if stock_name is None:
+            raise ValueError(f"Unknown stock '{name}' in search query.")
+        return set(self._postings.get(ENTITY_PREFIX + stock_name, ()))
+
+    def _evaluate(self, node, terms):
+        kind, value = node
+        if kind == 'phrase':
+            terms.extend(value)
+            return self._phrase_docs(value)
+        if kind == 'stock':
+            return self._stock_docs(value)
+        if kind == 'not':
+            return set(self._docs) - self._evaluate(value, [])
+        results = [self._evaluate(child, terms) for child in value]
+        return set.intersection(*results) if kind == 'and' else set.union(*results)
+
+    def _score(self, doc_ids, terms):
+        num_docs = len(self._docs)
+        avg_length = (self._total_length / num_docs) if num_docs else 1.0
+        scores = dict.fromkeys(doc_ids, 0.0)
+        for term in set(terms):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id in (doc_ids if len(doc_ids) < len(postings) else postings):
+                positions = postings.get(doc_id)
+                if positions and doc_id in scores:
+                    tf = len(positions)
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._docs[doc_id][4] / (avg_length or 1.0))
+                    scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, from_day=None, to_day=None, limit=SEARCH_DEFAULT_LIMIT, offset=0, snippets=True):
+        """
+        Runs `query` (see _parse_query) over the stored articles, optionally limited to days
+        from_day..to_day (inclusive). Hits are ordered by BM25 over the query's positive terms, then
+        newest first. Returns {'query', 'total', 'results', 'indexed_articles', 'took_ms'}.
+        Raises ValueError for a malformed query.
+        """
+        started = time.perf_counter()
+        if not query or not query.strip():
+            raise ValueError("Search query is empty.")
+        if len(query) > SEARCH_MAX_QUERY_CHARS:
+            raise ValueError(f"Search query is longer than {SEARCH_MAX_QUERY_CHARS} characters.")
+        tree = _parse_query(query)
+        self.refresh()
+        with self._lock:
+            terms = []
+            doc_ids = self._evaluate(tree, terms)
+            if from_day or to_day:
+                low, high = from_day or "", to_day or "9999-12-31"
+                doc_ids = {doc_id for doc_id in doc_ids if low <= self._docs[doc_id][1] <= high}
+            scores = self._score(doc_ids, terms)
+            # Only the requested page is ranked: best score first, newest first among equal scores
+            page = heapq.nlargest(offset + limit, doc_ids, key=lambda doc_id: (round(scores[doc_id], 9), self._docs[doc_id][1], doc_id))[offset:]
+            hits = [{'content_hash': self._docs[doc_id][0], 'day': self._docs[doc_id][1], 'source': self._docs[doc_id][2],
+                     'uri': self._docs[doc_id][3], 'score': round(scores[doc_id], 4),
+                     'stocks': sorted(term[len(ENTITY_PREFIX):] for term in self._entity_terms(doc_id))} for doc_id in page]
+            indexed = len(self._docs)
+        if snippets and hits:
+            texts = {art.content_hash: art.content for art in self.store.articles_by_hash(hit['content_hash'] for hit in hits)}
+            for hit in hits:
+                hit['snippet'] = make_snippet(texts.get(hit['content_hash'], ""), terms)
+        return {'query': query, 'total': len(doc_ids), 'results': hits, 'indexed_articles': indexed,
+                'took_ms': round((time.perf_counter() - started) * 1000, 2)}
+
+    def _entity_terms(self, doc_id):
+        return [ENTITY_PREFIX + stock_name for stock_name in set(self._aliases.values())
+                if doc_id in self._postings.get(ENTITY_PREFIX + stock_name, ())]
+
+    def stats(self):
+        with self._lock:
+            return {'indexed_articles': len(self._docs), 'terms': len(self._postings), 'aliases': len(self._aliases),
+                    'last_rowid': self._last_rowid}
+
+
+def make_snippet(text, terms, max_chars=SEARCH_SNIPPET_CHARS):
+    """A window of `text` around the first occurrence of any query term."""
+    if not text:
+        return ""
+    lowered = text.lower()
+    first = min((index for index in (lowered.find(term) for term in set(terms)) if index >= 0), default=0)
+    start = max(0, first - max_chars // 3)
+    snippet = text[start:start + max_chars].strip()
+    return ("..." if start else "") + snippet + ("..." if start + max_chars < len(text) else "")
@@ -1,21 +1,80 @@
 # utils/newsapi_helpers.py
 import logging
-from newsapi import NewsApiClient
-import time
+import math
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from newsapi import NewsApiClient, const as newsapi_const
 from datetime import timedelta
 from .sentiment_analyzer import get_vader_sentiment_score # Assuming sentiment_analyzer.py is in the same utils directory
+from .rate_limiter import IntervalRateLimiter, PRIORITY_INTERACTIVE
+from . import newsapi_quota, text_corpus
+from .deadline import is_expired
+from .log_utils import make_log_func
+from .article import Article
+from .bm25_ranker import rerank_articles
+from .request_profiling import stage, propagate
 
 logger = logging.getLogger(__name__)
 
+NEWSAPI_MIN_CALL_INTERVAL_SECONDS = 1.2 # Same pacing as the old per-call time.sleep(1.2)
+NEWSAPI_MAX_PAGES_PER_TARGET = 5
+NEWSAPI_MAX_RESULTS_DEPTH = 100 # Developer tier refuses page * page_size beyond 100 results
+NEWSAPI_PAGE_FETCH_WORKERS = 3
+BM25_RERANK_ENABLED = True
+BM25_CANDIDATE_POOL_FACTOR = 3 # Collect this many times max_articles before the local BM25 cut
+
+NEWSAPI_CANDIDATE_CACHE_MAX_ENTRIES = 256
+PACKED_STOCK_FALLBACK_ENABLED = True # Re-query alone a stock that a truncated packed query returned nothing for
+
+_newsapi_rate_limiter = IntervalRateLimiter(NEWSAPI_MIN_CALL_INTERVAL_SECONDS)
+# (query, from, to) -> (candidate articles, total_results); what cache-only answers are served from
+_candidate_cache = OrderedDict()
+_candidate_cache_lock = threading.Lock()
+_DEADLINE_REACHED = object() # _get_page result when the request's deadline expired before the call
+
+
+def _cache_get(cache_key):
+    with _candidate_cache_lock:
+        entry = _candidate_cache.get(cache_key)
+        if entry is not None: _candidate_cache.move_to_end(cache_key)
+        return entry
+
+
+def _cache_put(cache_key, articles_data, total_results):
+    # Candidates are transient: only those already stored share the corpus text, nothing is appended for the cache
+    articles_data = text_corpus.to_corpus_articles(articles_data, append=False)
+    with _candidate_cache_lock:
+        _candidate_cache[cache_key] = (articles_data, total_results)
+        _candidate_cache.move_to_end(cache_key)
+        while len(_candidate_cache) > NEWSAPI_CANDIDATE_CACHE_MAX_ENTRIES:
+            _candidate_cache.popitem(last=False)
+
+
+def configure_newsapi(base_url=None, min_call_interval_seconds=NEWSAPI_MIN_CALL_INTERVAL_SECONDS):
+    """
+    Points the NewsAPI client at another server (e.g. the load-test stand-in; None keeps newsapi.org)
+    and sets the pacing between calls.
+    """
+    global NEWSAPI_MIN_CALL_INTERVAL_SECONDS
+    if base_url:
+        base_url = base_url.rstrip('/')
+        # NewsApiClient reads these module constants on every call
+        newsapi_const.EVERYTHING_URL = f"{base_url}/v2/everything"
+        newsapi_const.TOP_HEADLINES_URL = f"{base_url}/v2/top-headlines"
+        newsapi_const.SOURCES_URL = f"{base_url}/v2/sources"
+    NEWSAPI_MIN_CALL_INTERVAL_SECONDS = min_call_interval_seconds
+    _newsapi_rate_limiter.min_interval_seconds = min_call_interval_seconds
+
+
+def acquire_call_slot(priority=PRIORITY_INTERACTIVE):
+    """Waits for the process-wide NewsAPI call pacing; callers that hit the client directly go through this."""
+    _newsapi_rate_limiter.acquire(priority)
+
+
 def get_newsapi_org_client(api_key, append_log_func=None):
-    log_msg_prefix = "[NewsAPIHelper]"
-    
-    def _log(message, level='info'):
-        full_message = f"{log_msg_prefix} {message}"
-        if level.lower() == 'error': logger.error(full_message)
-        elif level.lower() == 'warning': logger.warning(full_message)
-        else: logger.info(full_message)
-        if append_log_func: append_log_func(message, level.upper())
+    _log = make_log_func(logger, "[NewsAPIHelper]", append_log_func)
 
     if not api_key or api_key == "YOUR_NEWSAPI_ORG_API_KEY_HERE":
         msg = "NewsAPI.org key is missing or a placeholder. Client not initialized."
@@ -31,50 +90,239 @@ def get_newsapi_org_client(api_key, append_log_func=None):
         return None, str(e)
 
 
+def extract_article_content(article):
+    """Title + description of a raw NewsAPI article as one string, or None if there is no usable text."""
+    title = article.get('title', "") or ""
+    description = article.get('description', "") or ""
+    
+    content_for_llm = title
+    if description:
+        if title and not title.endswith(('.', '!', '?')):
+            content_for_llm += ". " + description
+        else:
+            content_for_llm += " " + description
+    
+    content_for_llm_stripped = content_for_llm.strip()
+    if content_for_llm_stripped and content_for_llm_stripped != ".":
+        return content_for_llm_stripped
+    return None
+
+
 def _process_newsapi_response(
     response_articles,
     max_articles_to_return,
     from_date_str_for_fallback, 
-    log_func # Pass the _log function for contextual logging
+    log_func, # Pass the _log function for contextual logging
+    unique_urls=None # Shared across pages so a follow-up page cannot re-add an earlier URL
 ):
-    """Helper function to process articles from NewsAPI response."""
+    """Helper function to process articles from NewsAPI response into Article objects."""
     articles_data = []
-    unique_urls = set()
+    if unique_urls is None: unique_urls = set()
     for article in response_articles:
         if len(articles_data) >= max_articles_to_return:
-            if log_func: log_func(f"Reached max_articles_to_return limit ({max_articles_to_return}).", "INFO")
+            if log_func: log_func("Reached max_articles_to_return limit (%d).", "DEBUG", max_articles_to_return)
             break
         
         url = article.get('url')
         if url in unique_urls:
-            if log_func: log_func(f"Skipping duplicate URL: {url}", "DEBUG")
+            if log_func: log_func("Skipping duplicate URL: %s", "DEBUG", url)
             continue
         if url: unique_urls.add(url)
 
-        title = article.get('title', "") or ""
-        description = article.get('description', "") or ""
-        
-        content_for_llm = title
-        if description:
-            if title and not title.endswith(('.', '!', '?')):
-                content_for_llm += ". " + description
-            else:
-                content_for_llm += " " + description
-        
-        content_for_llm_stripped = content_for_llm.strip()
-        
-        if content_for_llm_stripped and content_for_llm_stripped != ".":
-            vader_score = get_vader_sentiment_score(content_for_llm_stripped)
-            articles_data.append({
-                'content': content_for_llm_stripped,
-                'date': article.get('publishedAt', from_date_str_for_fallback).split('T')[0],
-                'uri': url or '',
-                'source': article.get('source', {}).get('name', 'N/A'),
-                'vader_score': vader_score
-            })
+        content_for_llm_stripped = extract_article_content(article)
+        if content_for_llm_stripped:
+            with stage("vader"):
+                vader_score = get_vader_sentiment_score(content_for_llm_stripped)
+            articles_data.append(Article(
+                content_for_llm_stripped,
+                (article.get('publishedAt') or from_date_str_for_fallback).split('T')[0],
+                url or '',
+                (article.get('source') or {}).get('name') or 'N/A',
+                vader_score
+            ))
     return articles_data
 
 
+def build_newsapi_query(target_keywords_list, country_keywords_list):
+    """Builds '("a" OR "b") AND ("India" OR ...)'. Returns None if no usable keywords."""
+    target_terms = [f'"{k.strip()}"' for k in target_keywords_list if k.strip()]
+    country_terms = [f'"{k.strip()}"' for k in country_keywords_list if k.strip()]
+    target_query_part = f"({' OR '.join(target_terms)})" if target_terms else ""
+    country_query_part = f"({' OR '.join(country_terms)})" if country_terms else ""
+    if target_query_part and country_query_part:
+        return f"{target_query_part} AND {country_query_part}"
+    return target_query_part or country_query_part or None
+
+
+def _page_size_for(pool_size):
+    """
+    Smallest page size >= pool_size that divides NEWSAPI_MAX_RESULTS_DEPTH, so follow-up pages can
+    reach the whole depth when duplicates or empty articles leave the pool short. A pool that does
+    not tile the depth (60 of 100) is fetched as one full-depth page and cut, not as a 60 page
+    that could never be followed.
+    """
+    depth = NEWSAPI_MAX_RESULTS_DEPTH
+    return next(size for size in range(min(max(1, pool_size), depth), depth + 1) if depth % size == 0)
+
+
+def _fetch_newsapi_articles_paginated(
+    newsapi_client,
+    query_string,
+    target_label,
+    from_date_str,
+    to_date_str,
+    max_articles_to_return,
+    log_func,
+    rank_keywords=None,
+    stop_when=None,
+    page_size_override=None,
+    priority=PRIORITY_INTERACTIVE,
+    deadline=None
+):
+    """
+    Fetches page 1, then follow-up pages concurrently (every call still goes through the
+    shared rate limiter) until enough unique, processable articles are collected or the
+    results run out.
+    With `rank_keywords`, a candidate pool of BM25_CANDIDATE_POOL_FACTOR x max_articles_to_return
+    is collected and re-ranked locally against those keywords before the cut.
+    `stop_when(articles_data)` lets packed multi-target queries end pagination early on
+    their own criterion instead of the total count.
+    Every call is admitted against the key's daily quota at `priority`; when refused, the
+    answer comes from the candidate cache (fetch_meta['cache_only'] is set) or, failing
+    that, an error instead of a call.
+    With a `deadline` (utils.deadline.RequestDeadline), no page is requested once it has
+    expired; pages collected so far are kept and fetch_meta['timed_out'] is set.
+    Returns (articles_data, error_message_user, fetch_meta) where fetch_meta holds
+    'pages_used' and 'total_results'.
+    """
+    rerank = BM25_RERANK_ENABLED and bool(rank_keywords)
+    max_articles_to_fetch = max_articles_to_return * BM25_CANDIDATE_POOL_FACTOR if rerank else max_articles_to_return
+    page_size_for_api = page_size_override or _page_size_for(max_articles_to_fetch)
+    max_pages = max(1, min(NEWSAPI_MAX_PAGES_PER_TARGET, NEWSAPI_MAX_RESULTS_DEPTH // page_size_for_api))
+    fetch_meta = {'pages_used': 0, 'total_results': 0}
+    ledger = newsapi_quota.get_ledger()
+    api_key = newsapi_quota.client_api_key(newsapi_client)
+    cache_key = (query_string, from_date_str, to_date_str)
+
+    def _rank(articles_data):
+        if not rerank:
+            return articles_data
+        with stage("bm25_rerank"):
+            ranked = rerank_articles(articles_data, rank_keywords, max_articles_to_return)
+        log_func("BM25 re-ranking kept %d article(s) for %s.", "info", len(ranked), target_label)
+        return ranked
+
+    def _get_page(page_number):
+        if is_expired(deadline):
+            return _DEADLINE_REACHED
+        if not ledger.reserve(api_key, priority):
+            return None
+        with stage("newsapi.rate_limit_wait"):
+            _newsapi_rate_limiter.acquire(priority)
+        if is_expired(deadline): # The rate-limiter wait may have used up the rest of the budget
+            ledger.record_calls(api_key, -1) # Hand the unused reservation back
+            return _DEADLINE_REACHED
+        with stage("newsapi.http"):
+            return newsapi_client.get_everything(
+                q=query_string,
+                from_param=from_date_str,
+                to=to_date_str,
+                language='en',
+                sort_by='relevancy',
+                page_size=page_size_for_api,
+                page=page_number
+            )
+
+    def _api_error_message(response):
+        api_err_code = response.get('code', 'N/A') or 'N/A'
+        api_err_msg = response.get('message', 'Unknown NewsAPI error') or 'Unknown NewsAPI error'
+        error_message_user = f"NewsAPI.org Error for {target_label}: {api_err_msg} (Code: {api_err_code})"
+        log_func(error_message_user, 'error')
+        if api_err_code == 'rateLimited':
+            log_func("Rate limited by NewsAPI. Consider pausing or reducing request frequency.", 'warning')
+        elif 'too far in the past' in api_err_msg.lower() or 'maximumAllowedDate' in api_err_code: # Corrected key
+            log_func("Query date range might be too old for NewsAPI free/developer tier.", 'warning')
+            error_message_user = f"NewsAPI: Date range too old ({from_date_str} to {to_date_str}). Max is usually ~30 days back for free tier."
+        return error_message_user
+
+    log_func("Fetching news for %s with query: '%s', From: %s, To: %s, PageSize: %d, MaxPages: %d", "debug",
+             target_label, query_string, from_date_str, to_date_str, page_size_for_api, max_pages)
+
+    first_response = _get_page(1)
+    if first_response is _DEADLINE_REACHED:
+        fetch_meta['timed_out'] = True
+        log_func("Request %s before fetching news for %s.", 'warning', deadline.reason, target_label)
+        return [], f"Timed out before fetching news for {target_label}.", fetch_meta
+    if first_response is None:
+        cached = _cache_get(cache_key)
+        fetch_meta['cache_only'] = True
+        if cached is None:
+            log_func("NewsAPI daily budget is reserved or exhausted and nothing is cached for %s.", 'warning', target_label)
+            return [], f"NewsAPI daily request budget is nearly used up; no cached news available for {target_label}.", fetch_meta
+        log_func("NewsAPI daily budget is reserved or exhausted; answering %s from cache.", 'warning', target_label)
+        fetch_meta['total_results'] = cached[1]
+        return _rank(text_corpus.materialize_articles(cached[0][:max_articles_to_fetch])), None, fetch_meta
+    fetch_meta['pages_used'] = 1
+    if first_response['status'] != 'ok':
+        return [], _api_error_message(first_response), fetch_meta
+
+    total_results = first_response.get('totalResults', 0) or 0
+    fetch_meta['total_results'] = total_results
+    first_page_articles = first_response['articles']
+    log_func("API returned %s total results, received %d articles on page 1 for %s.", "info", total_results, len(first_page_articles), target_label)
+
+    unique_urls = set()
+    articles_data = _process_newsapi_response(first_page_articles, max_articles_to_fetch, from_date_str, log_func, unique_urls)
+
+    available_pages = min(max_pages, math.ceil(total_results / page_size_for_api))
+    next_page = 2
+    exhausted = len(first_page_articles) < page_size_for_api
+
+    def _enough():
+        return len(articles_data) >= max_articles_to_fetch or (stop_when is not None and stop_when(articles_data))
+
+    with ThreadPoolExecutor(max_workers=NEWSAPI_PAGE_FETCH_WORKERS) as executor:
+        while not _enough() and not exhausted and next_page <= available_pages:
+            # Only as many pages as the shortfall needs (packed queries stop on their own criterion, so get a full wave)
+            wave_size = NEWSAPI_PAGE_FETCH_WORKERS if stop_when is not None else \
+                min(NEWSAPI_PAGE_FETCH_WORKERS, math.ceil((max_articles_to_fetch - len(articles_data)) / page_size_for_api))
+            wave_pages = list(range(next_page, min(next_page + wave_size, available_pages + 1)))
+            next_page = wave_pages[-1] + 1
+            wave_futures = [(page_number, executor.submit(propagate(_get_page), page_number)) for page_number in wave_pages]
+            for idx, (page_number, future) in enumerate(wave_futures):
+                # Pages are consumed in order so relevancy ranking is preserved across pages.
+                with stage("newsapi.page_wait"):
+                    response = future.result()
+                if response is _DEADLINE_REACHED:
+                    log_func("Stopping pagination for %s: %s.", 'warning', target_label, deadline.reason)
+                    fetch_meta['timed_out'] = True
+                    exhausted = True
+                elif response is None:
+                    log_func("Stopping pagination for %s: NewsAPI daily budget reserved or exhausted.", 'warning', target_label)
+                    exhausted = True
+                elif response['status'] != 'ok':
+                    # Keep what earlier pages produced; only the follow-up page failed.
+                    fetch_meta['pages_used'] += 1
+                    _api_error_message(response)
+                    exhausted = True
+                else:
+                    fetch_meta['pages_used'] += 1
+                    page_articles = response['articles']
+                    articles_data.extend(_process_newsapi_response(
+                        page_articles, max_articles_to_fetch - len(articles_data), from_date_str, log_func, unique_urls
+                    ))
+                    exhausted = len(page_articles) < page_size_for_api
+                if exhausted or _enough():
+                    for _, pending_future in wave_futures[idx + 1:]:
+                        # Calls that already went out still count towards pages used.
+                        if not pending_future.cancel() and pending_future.result() not in (None, _DEADLINE_REACHED): fetch_meta['pages_used'] += 1
+                    break
+
+    log_func("Collected %d unique articles for %s using %d page(s).", "info", len(articles_data), target_label, fetch_meta['pages_used'])
+    _cache_put(cache_key, articles_data, total_results)
+    return _rank(articles_data), None, fetch_meta
+
+
 def fetch_sector_news_newsapi(
     newsapi_client,
     sector_name, 
@@ -83,82 +331,46 @@ def fetch_sector_news_newsapi(
     from_date_obj,
     to_date_obj,
     max_articles_to_fetch=20, 
-    append_log_func=None
+    append_log_func=None,
+    priority=PRIORITY_INTERACTIVE,
+    deadline=None
 ):
     log_msg_prefix_local = f"[NewsAPIHelper][Sector: {sector_name}]"
 
-    # Define a local _log to pass to _process_newsapi_response for better context
-    def _local_log(message, level='info'):
-        full_message = f"{log_msg_prefix_local} {message}"
-        if level.lower() == 'error': logger.error(full_message)
-        elif level.lower() == 'warning': logger.warning(full_message)
-        else: logger.info(full_message)
-        if append_log_func: append_log_func(message, level.upper())
+    # Local _log passed down to _process_newsapi_response for better context
+    _local_log = make_log_func(logger, log_msg_prefix_local, append_log_func)
 
+    fetch_meta = {'pages_used': 0, 'total_results': 0}
 
     if not newsapi_client:
         msg = "NewsAPI client not available for fetching sector news."
         _local_log(msg, 'warning')
-        return [], msg
+        return [], msg, fetch_meta
 
-    sector_query_part = f"({' OR '.join(f'\"{k.strip()}\"' for k in sector_keywords_list if k.strip())})"
-    country_query_part = f"({' OR '.join(f'\"{k.strip()}\"' for k in country_keywords_list if k.strip())})"
-    
-    query_string = f"{sector_query_part} AND {country_query_part}" if sector_query_part != "()" and country_query_part != "()" else sector_query_part if country_query_part == "()" else country_query_part
-    
-    if query_string == "()" or query_string == " AND " or not query_string.strip():
+    query_string = build_newsapi_query(sector_keywords_list, country_keywords_list)
+    if not query_string:
         _local_log("No valid keywords for sector query construction.", "warning")
-        return [], "No valid keywords provided for NewsAPI sector query."
+        return [], "No valid keywords provided for NewsAPI sector query.", fetch_meta
 
     from_date_str = from_date_obj.strftime('%Y-%m-%d')
     to_date_str = to_date_obj.strftime('%Y-%m-%d')
     
     articles_data = []
     error_message_user = None
-    page_size_for_api = min(max_articles_to_fetch, 100)
-
-    _local_log(f"Fetching SECTOR news with query: '{query_string}', From: {from_date_str}, To: {to_date_str}, PageSize: {page_size_for_api}", "debug")
 
     try:
-        all_articles_response = newsapi_client.get_everything(
-            q=query_string,
-            from_param=from_date_str,
-            to=to_date_str,
-            language='en',
-            sort_by='relevancy', 
-            page_size=page_size_for_api
+        articles_data, error_message_user, fetch_meta = _fetch_newsapi_articles_paginated(
+            newsapi_client, query_string, f"sector '{sector_name}'", from_date_str, to_date_str,
+            max_articles_to_fetch, _local_log, rank_keywords=sector_keywords_list, priority=priority, deadline=deadline
         )
-
-        if all_articles_response['status'] == 'ok':
-            fetched_api_articles = all_articles_response['articles']
-            _local_log(f"API returned {all_articles_response['totalResults']} total results, received {len(fetched_api_articles)} articles in this call for sector.", "info")
-            
-            articles_data = _process_newsapi_response(
-                fetched_api_articles, 
-                max_articles_to_fetch, 
-                from_date_str, 
-                _local_log 
-            )
-            _local_log(f"Processed and returning {len(articles_data)} unique articles for LLM for sector '{sector_name}'.", "info")
-        else:
-            api_err_code = all_articles_response.get('code', 'N/A')
-            api_err_msg = all_articles_response.get('message', 'Unknown NewsAPI error')
-            error_message_user = f"NewsAPI.org Error for sector '{sector_name}': {api_err_msg} (Code: {api_err_code})"
-            _local_log(error_message_user, 'error')
-            if api_err_code == 'rateLimited':
-                _local_log("Rate limited by NewsAPI. Consider pausing or reducing request frequency.", 'warning')
-            elif 'too far in the past' in api_err_msg.lower() or 'maximumAllowedDate' in api_err_code: # Corrected key
-                _local_log("Query date range might be too old for NewsAPI free/developer tier.", 'warning')
-                error_message_user = f"NewsAPI: Date range too old ({from_date_str} to {to_date_str}). Max is usually ~30 days back for free tier."
-
+        _local_log("Processed and returning %d unique articles for LLM for sector '%s'.", "info", len(articles_data), sector_name)
     except Exception as e:
         err_msg = f"An exception occurred during NewsAPI fetch for sector '{sector_name}': {str(e)[:150]}"
         _local_log(err_msg, 'error')
         logger.exception(f"{log_msg_prefix_local} Full NewsAPI Fetch Exception for Sector")
         error_message_user = f"NewsAPI.org fetch exception for sector '{sector_name}': {str(e)[:100]}"
     
-    time.sleep(1.2) 
-    return articles_data, error_message_user
+    return articles_data, error_message_user, fetch_meta
 
 
 def fetch_stock_news_newsapi(
@@ -169,79 +381,229 @@ def fetch_stock_news_newsapi(
     from_date_obj,
     to_date_obj,
     max_articles_to_fetch=5, 
-    append_log_func=None
+    append_log_func=None,
+    priority=PRIORITY_INTERACTIVE,
+    deadline=None
 ):
     log_msg_prefix_local = f"[NewsAPIHelper][Stock: {stock_name}]"
 
-    def _local_log(message, level='info'): # Local log function for this scope
-        full_message = f"{log_msg_prefix_local} {message}"
-        if level.lower() == 'error': logger.error(full_message)
-        elif level.lower() == 'warning': logger.warning(full_message)
-        else: logger.info(full_message)
-        if append_log_func: append_log_func(message, level.upper())
+    _local_log = make_log_func(logger, log_msg_prefix_local, append_log_func) # Local log function for this scope
 
+    fetch_meta = {'pages_used': 0, 'total_results': 0}
 
     if not newsapi_client:
         msg = f"NewsAPI client not available for fetching news for stock '{stock_name}'."
         _local_log(msg, 'warning')
-        return [], msg
-
-    stock_query_part = f"({' OR '.join(f'\"{k.strip()}\"' for k in stock_specific_keywords if k.strip())})"
-    country_query_part = f"({' OR '.join(f'\"{k.strip()}\"' for k in country_keywords_list if k.strip())})"
+        return [], msg, fetch_meta
 
-    query_string = f"{stock_query_part} AND {country_query_part}" if stock_query_part != "()" and country_query_part != "()" else stock_query_part if country_query_part == "()" else country_query_part
-
-    if query_string == "()" or query_string == " AND " or not query_string.strip(): 
+    query_string = build_newsapi_query(stock_specific_keywords, country_keywords_list)
+    if not query_string:
         _local_log(f"No valid keywords for stock query construction for '{stock_name}'.", "warning")
-        return [], f"No valid keywords provided for NewsAPI query for stock '{stock_name}'."
+        return [], f"No valid keywords provided for NewsAPI query for stock '{stock_name}'.", fetch_meta
 
     from_date_str = from_date_obj.strftime('%Y-%m-%d')
     to_date_str = to_date_obj.strftime('%Y-%m-%d')
     
     articles_data = []
     error_message_user = None
-    page_size_for_api = min(max_articles_to_fetch, 100) 
 
-    _local_log(f"Fetching STOCK news with query: '{query_string}', From: {from_date_str}, To: {to_date_str}, PageSize: {page_size_for_api}", "debug")
-    
     try:
-        all_articles_response = newsapi_client.get_everything(
-            q=query_string,
-            from_param=from_date_str,
-            to=to_date_str,
-            language='en',
-            sort_by='relevancy', 
-            page_size=page_size_for_api
+        articles_data, error_message_user, fetch_meta = _fetch_newsapi_articles_paginated(
+            newsapi_client, query_string, f"stock '{stock_name}'", from_date_str, to_date_str,
+            max_articles_to_fetch, _local_log, rank_keywords=stock_specific_keywords, priority=priority, deadline=deadline
         )
-
-        if all_articles_response['status'] == 'ok':
-            fetched_api_articles = all_articles_response['articles']
-            _local_log(f"API returned {all_articles_response['totalResults']} total results, received {len(fetched_api_articles)} articles in this call for stock '{stock_name}'.", "info")
-            
-            articles_data = _process_newsapi_response(
-                fetched_api_articles,
-                max_articles_to_fetch,
-                from_date_str,
-                _local_log 
-            )
-            _local_log(f"Processed and returning {len(articles_data)} unique articles for LLM for stock '{stock_name}'.", "info")
-        else:
-            api_err_code = all_articles_response.get('code', 'N/A')
-            api_err_msg = all_articles_response.get('message', 'Unknown NewsAPI error')
-            error_message_user = f"NewsAPI.org Error for stock '{stock_name}': {api_err_msg} (Code: {api_err_code})"
-            _local_log(error_message_user, 'error')
-            if api_err_code == 'rateLimited':
-                _local_log("Rate limited by NewsAPI. Consider pausing or reducing request frequency.", 'warning')
-            elif 'too far in the past' in api_err_msg.lower() or 'maximumAllowedDate' in api_err_code:
-                _local_log("Query date range might be too old for NewsAPI free/developer tier.", 'warning')
-                error_message_user = f"NewsAPI: Date range too old ({from_date_str} to {to_date_str}). Max is usually ~30 days back for free tier."
-
-
+        _local_log("Processed and returning %d unique articles for LLM for stock '%s'.", "info", len(articles_data), stock_name)
     except Exception as e:
         err_msg = f"An exception occurred during NewsAPI fetch for stock '{stock_name}': {str(e)[:150]}"
         _local_log(err_msg, 'error')
         logger.exception(f"{log_msg_prefix_local} Full NewsAPI Fetch Exception for Stock")
         error_message_user = f"NewsAPI.org fetch exception for stock '{stock_name}': {str(e)[:100]}"
     
-    time.sleep(1.2) 
-    return articles_data, error_message_user
\ No newline at end of file
+    return articles_data, error_message_user, fetch_meta
+
+
+NEWSAPI_MAX_QUERY_LENGTH = 500 # NewsAPI rejects 'q' values longer than this
+
+
+def plan_packed_stock_queries(stock_keywords_map, country_keywords_list, max_query_length=NEWSAPI_MAX_QUERY_LENGTH):
+    """
+    Greedily packs stocks' alias lists into as few NewsAPI queries as the query length allows.
+    Returns a list of (stock_names_in_pack, query_string). A stock whose aliases alone exceed
+    the limit gets a pack of its own (NewsAPI will report the error for it as before).
+    """
+    packs = []
+    current_stocks, current_keywords = [], []
+    for stock_name, keywords in stock_keywords_map.items():
+        candidate_keywords = current_keywords + [k for k in keywords if k.strip()]
+        candidate_query = build_newsapi_query(candidate_keywords, country_keywords_list)
+        if current_stocks and (candidate_query is None or len(candidate_query) > max_query_length):
+            packs.append((current_stocks, build_newsapi_query(current_keywords, country_keywords_list)))
+            current_stocks, current_keywords = [], []
+            candidate_keywords = [k for k in keywords if k.strip()]
+        current_stocks.append(stock_name)
+        current_keywords = candidate_keywords
+    if current_stocks:
+        packs.append((current_stocks, build_newsapi_query(current_keywords, country_keywords_list)))
+    return packs
+
+
+def _alias_pattern(stock_name, keywords):
+    phrases = {k.strip().lower() for k in keywords if k.strip()}
+    phrases.add(stock_name.strip().lower())
+    alternatives = "|".join(re.escape(p) for p in sorted(phrases, key=len, reverse=True))
+    return re.compile(rf"(?<![a-z0-9])(?:{alternatives})(?![a-z0-9])")
+
+
+def build_alias_patterns(stock_keywords_map):
+    return {stock_name: _alias_pattern(stock_name, keywords) for stock_name, keywords in stock_keywords_map.items()}
+
+
+def tag_articles_by_alias(articles_data, alias_patterns):
+    """
+    Splits a shared article list per stock by word-bounded alias matching on the article text.
+    Buckets share the Article objects; an article matching several stocks is not copied.
+    """
+    buckets = {stock_name: [] for stock_name in alias_patterns}
+    for art in articles_data:
+        content_lower = art.content.lower()
+        for stock_name, pattern in alias_patterns.items():
+            if pattern.search(content_lower): buckets[stock_name].append(art)
+    return buckets
+
+
+def fetch_news_candidates_newsapi(
+    newsapi_client,
+    target_label,
+    query_string,
+    from_date_obj,
+    to_date_obj,
+    max_candidates,
+    append_log_func=None,
+    stop_when=None,
+    page_size_override=None,
+    priority=PRIORITY_INTERACTIVE,
+    deadline=None
+):
+    """
+    Fetches an un-ranked candidate pool for a prebuilt query, for callers (packed stock
+    queries, batch analysis) that tag and rank the articles themselves.
+    Returns (articles_data, error_message_user, fetch_meta).
+    """
+    log_msg_prefix_local = f"[NewsAPIHelper][{target_label}]"
+    _local_log = make_log_func(logger, log_msg_prefix_local, append_log_func)
+    fetch_meta = {'pages_used': 0, 'total_results': 0}
+
+    if not newsapi_client:
+        msg = f"NewsAPI client not available for fetching news for {target_label}."
+        _local_log(msg, 'warning')
+        return [], msg, fetch_meta
+    if not query_string:
+        return [], f"No valid keywords provided for NewsAPI query for {target_label}.", fetch_meta
+
+    try:
+        return _fetch_newsapi_articles_paginated(
+            newsapi_client, query_string, target_label,
+            from_date_obj.strftime('%Y-%m-%d'), to_date_obj.strftime('%Y-%m-%d'),
+            max_candidates, _local_log, stop_when=stop_when, page_size_override=page_size_override,
+            priority=priority, deadline=deadline
+        )
+    except Exception as e:
+        _local_log(f"An exception occurred during NewsAPI fetch for {target_label}: {str(e)[:150]}", 'error')
+        logger.exception(f"{log_msg_prefix_local} Full NewsAPI Fetch Exception")
+        return [], f"NewsAPI.org fetch exception for {target_label}: {str(e)[:100]}", fetch_meta
+
+
+def fetch_packed_stock_candidates(newsapi_client, pack_stocks, query_string, alias_patterns, pool_per_stock,
+                                  from_date_obj, to_date_obj, append_log_func=None, priority=PRIORITY_INTERACTIVE, deadline=None):
+    """Fetches one packed query, paginating until every stock in the pack has `pool_per_stock` tagged candidates."""
+    pack_patterns = [alias_patterns[stock_name] for stock_name in pack_stocks]
+
+    def _every_stock_has_pool(articles_data):
+        return all(
+            sum(1 for art in articles_data if pattern.search(art.content.lower())) >= pool_per_stock
+            for pattern in pack_patterns
+        )
+
+    return fetch_news_candidates_newsapi(
+        newsapi_client, f"stocks {', '.join(pack_stocks)}", query_string, from_date_obj, to_date_obj,
+        NEWSAPI_MAX_RESULTS_DEPTH, append_log_func, stop_when=_every_stock_has_pool,
+        page_size_override=min(100, pool_per_stock * len(pack_stocks)), priority=priority, deadline=deadline
+    )
+
+
+def needs_single_stock_fallback(pack_size, tagged_articles, pack_articles, pack_error, pack_meta):
+    """
+    True when a stock came back empty from a shared pack that was cut short (NewsAPI had more
+    results than were fetched), i.e. busier stocks may have crowded it out of the pages read.
+    """
+    return (PACKED_STOCK_FALLBACK_ENABLED and pack_size > 1 and not tagged_articles and not pack_error
+            and pack_meta.get('total_results', 0) > len(pack_articles))
+
+
+def fetch_single_stock_fallback(newsapi_client, stock_name, stock_keywords, country_keywords_list, pool_per_stock,
+                                from_date_obj, to_date_obj, append_log_func=None, priority=PRIORITY_INTERACTIVE, deadline=None):
+    """The stock's own query, for a stock crowded out of its pack. Returns (articles_data, error_message_user, fetch_meta)."""
+    make_log_func(logger, f"[NewsAPIHelper][Stock: {stock_name}]", append_log_func)(
+        "No articles from the packed query; retrying with a single-stock query.", "info")
+    return fetch_news_candidates_newsapi(
+        newsapi_client, f"stock '{stock_name}'", build_newsapi_query(stock_keywords, country_keywords_list),
+        from_date_obj, to_date_obj, pool_per_stock, append_log_func, priority=priority, deadline=deadline
+    )
+
+
+def rank_and_cut(articles_data, target_keywords_list, max_articles_to_return):
+    if BM25_RERANK_ENABLED:
+        return rerank_articles(articles_data, target_keywords_list, max_articles_to_return)
+    return articles_data[:max_articles_to_return]
+
+
+def fetch_stocks_news_newsapi_packed(
+    newsapi_client,
+    stock_keywords_map,
+    country_keywords_list,
+    from_date_obj,
+    to_date_obj,
+    max_articles_per_stock=5,
+    append_log_func=None,
+    priority=PRIORITY_INTERACTIVE,
+    deadline=None
+):
+    """
+    Multi-stock counterpart of fetch_stock_news_newsapi. Stocks are packed into shared queries
+    (see plan_packed_stock_queries), and each pack's results are split back per stock by local
+    alias matching, then BM25-ranked and cut per stock.
+    Returns (per_stock_results, newsapi_queries_used) where per_stock_results maps
+    stock_name -> (articles_data, error_message_user, fetch_meta), the same triple
+    fetch_stock_news_newsapi returns.
+    """
+    _local_log = make_log_func(logger, "[NewsAPIHelper][PackedStocks]", append_log_func)
+
+    pool_per_stock = max_articles_per_stock * (BM25_CANDIDATE_POOL_FACTOR if BM25_RERANK_ENABLED else 1)
+    alias_patterns = build_alias_patterns(stock_keywords_map)
+    packs = plan_packed_stock_queries(stock_keywords_map, country_keywords_list)
+    _local_log("Packed %d stock(s) into %d NewsAPI quer%s.", "info", len(stock_keywords_map), len(packs), 'y' if len(packs) == 1 else 'ies')
+    per_stock_results = {}
+    newsapi_queries_used = 0
+
+    for pack_stocks, query_string in packs:
+        pack_articles, pack_error, pack_meta = fetch_packed_stock_candidates(
+            newsapi_client, pack_stocks, query_string, alias_patterns, pool_per_stock,
+            from_date_obj, to_date_obj, append_log_func, priority, deadline
+        )
+        newsapi_queries_used += pack_meta['pages_used']
+        buckets = tag_articles_by_alias(pack_articles, {stock_name: alias_patterns[stock_name] for stock_name in pack_stocks})
+        for stock_name in pack_stocks:
+            # Shared query: pages_used is the pack's page count, reported for each stock in the pack.
+            candidates, stock_error, stock_meta = buckets[stock_name], pack_error, dict(pack_meta, packed_with=len(pack_stocks))
+            if needs_single_stock_fallback(len(pack_stocks), candidates, pack_articles, pack_error, pack_meta):
+                candidates, stock_error, fallback_meta = fetch_single_stock_fallback(
+                    newsapi_client, stock_name, stock_keywords_map[stock_name], country_keywords_list, pool_per_stock,
+                    from_date_obj, to_date_obj, append_log_func, priority, deadline
+                )
+                newsapi_queries_used += fallback_meta['pages_used']
+                stock_meta['fallback_pages_used'] = fallback_meta['pages_used']
+            stock_articles = rank_and_cut(candidates, stock_keywords_map[stock_name], max_articles_per_stock)
+            per_stock_results[stock_name] = (stock_articles, stock_error, stock_meta)
+            _local_log("Processed and returning %d unique articles for LLM for stock '%s'.", "info", len(stock_articles), stock_name)
+
+    return per_stock_results, newsapi_queries_used
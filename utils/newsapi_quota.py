@@ -0,0 +1,169 @@
+# utils/newsapi_quota.py
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from .rate_limiter import PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+NEWSAPI_DAILY_REQUEST_LIMIT = 100 # Developer tier
+BACKGROUND_RESERVE_FRACTION = 0.25 # Background work may not spend the last 25% of the day's budget
+INTERACTIVE_MIN_REMAINING = 1 # Interactive requests go cache-only once this few calls remain
+LEDGER_HISTORY_DAYS = 7
+
+
+def _key_id(api_key):
+    # The ledger file never contains the key itself
+    return hashlib.sha256((api_key or "").encode('utf-8')).hexdigest()[:12]
+
+
+def _today():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d')
+
+
+class QuotaLedger:
+    """
+    Per-API-key, per-UTC-day count of NewsAPI requests, persisted as a small JSON file so the
+    count survives restarts and is shared by the web app and CLI jobs using the same path.
+    Every change is a read-modify-write of the file under an flock on <path>.lock, so processes
+    add to each other's counts instead of overwriting them; reads pick up other processes'
+    writes when the file changes. With path=None the ledger is in-memory only.
+    """
+
+    def __init__(self, path=None, daily_limit=NEWSAPI_DAILY_REQUEST_LIMIT):
+        self.path = path
+        self.daily_limit = daily_limit
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._file_stamp = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory: os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            self._reload()
+
+    def _reload(self):
+        # Caller holds self._lock; re-reads the file only if another writer replaced it
+        if not self.path:
+            return
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._counts, self._file_stamp = {}, None
+            return
+        stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        if stamp == self._file_stamp:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._counts = json.load(f)
+            self._file_stamp = stamp
+        except (OSError, ValueError) as e:
+            logger.warning("Could not read NewsAPI quota ledger %s, keeping the last known counts: %s", self.path, e)
+
+    def _save(self):
+        # Caller holds self._lock and the file lock
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._counts, f)
+        os.replace(tmp_path, self.path)
+        stat = os.stat(self.path)
+        self._file_stamp = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def _update(self, api_key, decide):
+        """
+        Atomically: reloads the shared counts, calls decide(used_today) -> delta (0 for no change)
+        and records the delta. Returns the delta.
+        """
+        key_id, day = _key_id(api_key), _today()
+        with self._lock:
+            lock_file = open(f"{self.path}.lock", 'a') if self.path else None
+            try:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    self._reload()
+                per_key = self._counts.setdefault(key_id, {})
+                delta = decide(per_key.get(day, 0))
+                if not delta:
+                    return 0
+                per_key[day] = max(0, per_key.get(day, 0) + delta)
+                for old_day in sorted(per_key)[:-LEDGER_HISTORY_DAYS]:
+                    del per_key[old_day]
+                if lock_file is not None:
+                    try:
+                        self._save()
+                    except OSError as e:
+                        logger.warning("Could not persist NewsAPI quota ledger %s: %s", self.path, e)
+                return delta
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+
+    def record_calls(self, api_key, count=1):
+        """Adds `count` calls (negative to hand back reserved calls that were never made)."""
+        self._update(api_key, lambda used: count)
+
+    def used_today(self, api_key):
+        with self._lock:
+            self._reload()
+            return self._counts.get(_key_id(api_key), {}).get(_today(), 0)
+
+    def remaining(self, api_key):
+        return max(0, self.daily_limit - self.used_today(api_key))
+
+    def _admits(self, used, priority):
+        remaining = max(0, self.daily_limit - used)
+        if priority > PRIORITY_INTERACTIVE:
+            return remaining > self.daily_limit * BACKGROUND_RESERVE_FRACTION
+        return remaining >= INTERACTIVE_MIN_REMAINING
+
+    def admit(self, api_key, priority=PRIORITY_INTERACTIVE):
+        """True if a call at this priority could spend budget now (a check only; use reserve() to spend)."""
+        return self._admits(self.used_today(api_key), priority)
+
+    def reserve(self, api_key, priority=PRIORITY_INTERACTIVE):
+        """
+        Admits and records one call as a single atomic step, so concurrent callers cannot all pass
+        on the same remaining count. False means answer from cache only. A reserved call that is
+        not made after all is handed back with record_calls(api_key, -1).
+        """
+        return self._update(api_key, lambda used: 1 if self._admits(used, priority) else 0) == 1
+
+    def reserve_budget(self, api_key, max_calls=None, priority=PRIORITY_INTERACTIVE):
+        """
+        Atomically reserves every call reserve() would still admit at this priority (at most
+        `max_calls`) and returns how many, for work that spends the budget elsewhere (e.g. shard
+        processes). Calls not made after all are handed back with record_calls(api_key, -unused).
+        """
+        def _decide(used):
+            remaining = max(0, self.daily_limit - used)
+            if priority > PRIORITY_INTERACTIVE:
+                admitted = remaining - int(self.daily_limit * BACKGROUND_RESERVE_FRACTION)
+            else:
+                admitted = remaining - (INTERACTIVE_MIN_REMAINING - 1)
+            admitted = max(0, admitted)
+            return admitted if max_calls is None else min(admitted, max(0, max_calls))
+        return self._update(api_key, _decide)
+
+
+_ledger = QuotaLedger()
+
+
+def configure_ledger(path, daily_limit=NEWSAPI_DAILY_REQUEST_LIMIT):
+    global _ledger
+    _ledger = QuotaLedger(path, daily_limit)
+    return _ledger
+
+
+def get_ledger():
+    return _ledger
+
+
+def client_api_key(newsapi_client):
+    """NewsApiClient keeps its key on .auth; fall back to a shared bucket for other clients."""
+    return getattr(getattr(newsapi_client, 'auth', None), 'api_key', None) or "default"
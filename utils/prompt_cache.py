@@ -0,0 +1,156 @@
+# utils/prompt_cache.py
+import datetime
+import hashlib
+import logging
+import threading
+import time
+import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+# "gemini": upload the instruction prefix once via the context-caching API and reference it by handle
+# "local":  in-process stand-in (no caching API calls); the prefix goes out as the system instruction
+# "off":    prefix and suffix are sent together as one prompt, as before
+PROMPT_CACHE_BACKEND = "off"
+PROMPT_CACHE_TTL_SECONDS = 3600
+PROMPT_CACHE_REFRESH_MARGIN_SECONDS = 60 # Re-create a provider cache this long before it expires
+# Context caching needs an explicitly versioned model; "-latest" aliases are rejected
+PROMPT_CACHE_MODEL_NAME = "models/gemini-1.5-flash-002"
+
+# input_tokens_saved: reported by the provider; input_tokens_saved_estimate: the local stand-in's guess, never real savings
+prompt_cache_stats = {'requests': 0, 'prefix_uploads': 0, 'prefix_hits': 0, 'fallbacks': 0, 'input_tokens_saved': 0,
+                      'input_tokens_saved_estimate': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(stat, amount=1):
+    with _stats_lock:
+        prompt_cache_stats[stat] += amount
+
+
+def estimate_tokens(text):
+    return len(text) // 4 # Rough chars-per-token for English prose
+
+
+class CachedPrefix:
+    """Handle to an uploaded (or, for the local stand-in, notionally uploaded) instruction prefix."""
+    __slots__ = ('name', 'backend', 'prefix', 'token_estimate', 'expires_at', 'provider_cache')
+
+    def __init__(self, name, backend, prefix, expires_at, provider_cache=None):
+        self.name = name
+        self.backend = backend
+        self.prefix = prefix
+        self.token_estimate = estimate_tokens(prefix)
+        self.expires_at = expires_at
+        self.provider_cache = provider_cache
+
+
+class PrefixCache:
+    """
+    Keeps one handle per (model, prefix). model_for() returns the model to call and the text to
+    send: with a handle, only the variable suffix goes in the request.
+    If the provider refuses to cache a prefix (e.g. it is below the minimum cacheable size), the
+    prefix is remembered as uncacheable and calls fall back to sending it as the system instruction.
+    """
+
+    def __init__(self, backend=PROMPT_CACHE_BACKEND, ttl_seconds=PROMPT_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._handles = {}
+        self._uncacheable = set()
+        self._creating = {} # key -> Event, set once the in-flight create for that prefix finished
+
+    def _create(self, model_name, prefix, key):
+        expires_at = time.time() + self.ttl_seconds
+        if self.backend == "local":
+            return CachedPrefix(f"local/{key[1]}", "local", prefix, expires_at)
+        provider_cache = genai.caching.CachedContent.create(
+            model=PROMPT_CACHE_MODEL_NAME, display_name=f"news-analysis-{key[1]}",
+            system_instruction=prefix, ttl=datetime.timedelta(seconds=self.ttl_seconds)
+        )
+        return CachedPrefix(provider_cache.name, "gemini", prefix, expires_at, provider_cache)
+
+    def get_handle(self, model_name, prefix):
+        """
+        The live handle for this prefix (creating it if needed), or None if caching is off/unavailable.
+        The provider call runs outside the lock, once per prefix: concurrent callers wait for it,
+        or keep using the old handle while a refresh of a not-yet-expired one is in flight.
+        """
+        if self.backend not in ("gemini", "local"):
+            return None
+        key = (model_name, hashlib.blake2b(prefix.encode('utf-8'), digest_size=8).hexdigest())
+        while True:
+            with self._lock:
+                if key in self._uncacheable:
+                    return None
+                handle = self._handles.get(key)
+                now = time.time()
+                if handle is not None and handle.expires_at - PROMPT_CACHE_REFRESH_MARGIN_SECONDS > now:
+                    _count('prefix_hits')
+                    return handle
+                in_flight = self._creating.get(key)
+                if in_flight is None:
+                    in_flight = self._creating[key] = threading.Event()
+                    break
+                if handle is not None and handle.expires_at > now:
+                    _count('prefix_hits')
+                    return handle # Being refreshed, still valid
+            in_flight.wait()
+
+        handle = None
+        try:
+            handle = self._create(model_name, prefix, key)
+        except Exception as e:
+            logger.warning("Could not cache the instruction prefix for %s, sending it inline: %s", model_name, str(e)[:150])
+        with self._lock:
+            if handle is None:
+                self._uncacheable.add(key)
+                self._handles.pop(key, None)
+            else:
+                self._handles[key] = handle
+                _count('prefix_uploads')
+            self._creating.pop(key).set()
+        return handle
+
+    def model_for(self, model_name, prefix, suffix):
+        """Returns (model, prompt_text, handle) for one request."""
+        _count('requests')
+        if self.backend == "off":
+            return genai.GenerativeModel(model_name), prefix + suffix, None
+        handle = self.get_handle(model_name, prefix)
+        if handle is None:
+            _count('fallbacks')
+            return genai.GenerativeModel(model_name, system_instruction=prefix), suffix, None
+        if handle.backend == "gemini":
+            return genai.GenerativeModel.from_cached_content(handle.provider_cache), suffix, handle
+        return genai.GenerativeModel(model_name, system_instruction=prefix), suffix, handle
+
+    def record_usage(self, response, handle):
+        """
+        Adds the cached prefix tokens the provider reports to input_tokens_saved. The local stand-in
+        saves nothing (the prefix is still sent); its estimate goes to input_tokens_saved_estimate.
+        """
+        if handle is None:
+            return
+        if handle.backend == "gemini":
+            usage = getattr(response, 'usage_metadata', None)
+            saved = getattr(usage, 'cached_content_token_count', 0) or 0
+            if saved:
+                _count('input_tokens_saved', saved)
+        else:
+            _count('input_tokens_saved_estimate', handle.token_estimate)
+
+    def clear(self):
+        with self._lock:
+            self._handles.clear(); self._uncacheable.clear()
+
+
+prefix_cache = PrefixCache()
+
+
+def configure_prompt_cache(backend, ttl_seconds=PROMPT_CACHE_TTL_SECONDS, model_name=PROMPT_CACHE_MODEL_NAME):
+    global prefix_cache, PROMPT_CACHE_BACKEND, PROMPT_CACHE_TTL_SECONDS, PROMPT_CACHE_MODEL_NAME
+    PROMPT_CACHE_BACKEND, PROMPT_CACHE_TTL_SECONDS, PROMPT_CACHE_MODEL_NAME = backend, ttl_seconds, model_name
+    prefix_cache = PrefixCache(backend, ttl_seconds)
+    return prefix_cache
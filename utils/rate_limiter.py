@@ -0,0 +1,94 @@
+# utils/rate_limiter.py
+import heapq
+import itertools
+import threading
+import time
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class IntervalRateLimiter:
+    """
+    Thread-safe limiter that spaces calls at least `min_interval_seconds` apart.
+    Callers block in acquire() until their slot comes up, so concurrent page fetches
+    still hit the upstream API at the same pace as the old sequential sleep.
+    Waiters are served lowest `priority` value first (FIFO within a priority), so
+    interactive requests overtake queued background work.
+    """
+
+    def __init__(self, min_interval_seconds):
+        self.min_interval_seconds = min_interval_seconds
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._next_slot = 0.0
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE):
+        started = time.monotonic()
+        with self._cond:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._waiters, ticket)
+            while True:
+                now = time.monotonic()
+                is_head = self._waiters[0] == ticket
+                if is_head and now >= self._next_slot:
+                    heapq.heappop(self._waiters)
+                    self._next_slot = now + self.min_interval_seconds
+                    self._cond.notify_all()
+                    return now - started
+                self._cond.wait(self._next_slot - now if is_head else None)
+
+
+class AIMDConcurrencyLimiter:
+    """
+    Concurrency limit that adapts to upstream throttling: every `limit` successful calls raise
+    it by one (additive increase), a throttled call halves it (multiplicative decrease).
+    Only one decrease happens per generation of in-flight calls, so a burst of 429s from calls
+    that were all admitted under the old limit halves it once, not once per failure.
+    """
+
+    def __init__(self, initial_limit=2, min_limit=1, max_limit=16, decrease_factor=0.5):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self._cond = threading.Condition()
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._generation = 0
+        self.throttled_calls = 0
+
+    @property
+    def limit(self):
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self, timeout=None):
+        """
+        Blocks until a slot is free (at most `timeout` seconds; 0 = don't wait); returns the token to
+        pass to release(), or None if no slot freed up in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._in_flight >= self.limit:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            self._in_flight += 1
+            return self._generation
+
+    def release(self, token, throttled=False):
+        with self._cond:
+            self._in_flight -= 1
+            if throttled:
+                self.throttled_calls += 1
+                if token == self._generation:
+                    self._limit = max(float(self.min_limit), self._limit * self.decrease_factor)
+                    self._generation += 1
+            else:
+                self._limit = min(float(self.max_limit), self._limit + 1.0 / self.limit)
+            self._cond.notify_all()
@@ -0,0 +1,172 @@
+# utils/request_profiling.py
+import contextvars
+import cProfile
+import hmac
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile-Token" # Must carry PROFILING_ADMIN_TOKEN
+PROFILING_ADMIN_TOKEN = None # None/empty: profiling cannot be requested at all
+PROFILING_DIR = "data/profiles"
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 30
+TOP_FUNCTIONS = 8
+
+_active_profile = contextvars.ContextVar("active_request_profile", default=None)
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started_here = False # Tracing someone else started (e.g. PYTHONTRACEMALLOC) is left running
+
+
+def configure_profiling(admin_token, directory=PROFILING_DIR):
+    global PROFILING_ADMIN_TOKEN, PROFILING_DIR
+    PROFILING_ADMIN_TOKEN, PROFILING_DIR = admin_token or None, directory
+
+
+def is_authorized(header_value):
+    """True if the request's profile header carries the admin token (constant-time compare)."""
+    if not PROFILING_ADMIN_TOKEN or not header_value:
+        return False
+    return hmac.compare_digest(header_value.encode('utf-8'), PROFILING_ADMIN_TOKEN.encode('utf-8'))
+
+
+@contextmanager
+def stage(name):
+    """Adds the block's duration to the active request profile's `name` stage; free when not profiling."""
+    profile = _active_profile.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, time.perf_counter() - started)
+
+
+def propagate(func):
+    """Wraps `func` to run in a copy of the caller's context, so stages in executor threads reach the request's profile."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(func, *args, **kwargs)
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_started_here
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0:
+            _tracemalloc_started_here = not tracemalloc.is_tracing()
+            if _tracemalloc_started_here:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users, _tracemalloc_started_here
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0 and _tracemalloc_started_here:
+            tracemalloc.stop()
+            _tracemalloc_started_here = False
+
+
+class RequestProfile:
+    """
+    Profiles one request: cProfile on the request thread, tracemalloc snapshots before and after,
+    and per-stage wall time from stage() blocks in any thread that inherited the request's context.
+    Stage times from worker threads overlap, so they can add up to more than the request's wall time;
+    'other_ms' is the request-thread time not covered by a stage.
+    tracemalloc is process-wide: allocations of concurrent requests show up in the diff as well.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:6]}"
+        self._stages = {}
+        self._lock = threading.Lock()
+        self._thread_id = None
+        self._own_stage_seconds = 0.0
+        self._profiler = None
+        self._context_token = None
+        self.wall_seconds = None
+        self._snapshots = None
+        self.peak_traced_bytes = None
+
+    def add_stage(self, name, seconds):
+        with self._lock:
+            total = self._stages.setdefault(name, [0.0, 0])
+            total[0] += seconds; total[1] += 1
+            if threading.get_ident() == self._thread_id:
+                self._own_stage_seconds += seconds
+
+    def __enter__(self):
+        self._thread_id = threading.get_ident()
+        _start_tracemalloc()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        self._snapshots = [before]
+        self._context_token = _active_profile.set(self)
+        self._profiler = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._profiler.disable()
+        self.wall_seconds = time.perf_counter() - self._started
+        _active_profile.reset(self._context_token)
+        self._snapshots.append(tracemalloc.take_snapshot())
+        self.peak_traced_bytes = tracemalloc.get_traced_memory()[1]
+        _stop_tracemalloc()
+        return False
+
+    def _top_functions(self):
+        stats = pstats.Stats(self._profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS] # by own (total) time
+        return [{'function': f"{os.path.basename(filename)}:{line}({name})", 'own_ms': round(own * 1000, 1), 'calls': calls}
+                for (filename, line, name), (_, calls, own, _, _) in rows]
+
+    def stage_breakdown(self):
+        with self._lock:
+            stages = {name: {'ms': round(seconds * 1000, 1), 'calls': count}
+                      for name, (seconds, count) in sorted(self._stages.items(), key=lambda item: -item[1][0])}
+            own = self._own_stage_seconds
+        return {
+            'profile_id': self.profile_id,
+            'wall_ms': round(self.wall_seconds * 1000, 1),
+            'stages': stages,
+            'other_ms': round(max(0.0, self.wall_seconds - own) * 1000, 1),
+            'top_functions': self._top_functions(),
+            'peak_traced_kb': round(self.peak_traced_bytes / 1024, 1),
+        }
+
+    def save(self, directory=None):
+        """Writes <id>.prof (pstats/snakeviz), <id>.alloc.txt (top allocation growth) and <id>.json; returns the paths."""
+        directory = directory or PROFILING_DIR
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, self.profile_id)
+        paths = {'cprofile': f"{base}.prof", 'allocations': f"{base}.alloc.txt", 'summary': f"{base}.json"}
+        self._profiler.dump_stats(paths['cprofile'])
+
+        before, after = self._snapshots
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+        diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+        with open(paths['allocations'], 'w', encoding='utf-8') as f:
+            f.write(f"Top {TOP_ALLOCATIONS} allocation sites by growth during {self.profile_id} (peak traced {self.peak_traced_bytes / 1024:.1f} KiB)\n")
+            for stat in diff[:TOP_ALLOCATIONS]:
+                f.write(f"{stat}\n")
+
+        stream = io.StringIO()
+        pstats.Stats(self._profiler, stream=stream).sort_stats('cumulative').print_stats(40)
+        with open(paths['summary'], 'w', encoding='utf-8') as f:
+            json.dump({**self.stage_breakdown(), 'label': self.label, 'cprofile_top': stream.getvalue()}, f, indent=2)
+        return paths
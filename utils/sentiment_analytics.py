@@ -0,0 +1,263 @@
+# utils/sentiment_analytics.py
+import logging
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_MAX_DAYS = 180 # Trailing calendar days the statistics cover
+ROLLING_WINDOW_DAYS = 14
+MIN_OVERLAP_DAYS = 5 # Fewer common days than this gives no correlation
+MAX_LAG_DAYS = 5
+TOP_PAIRS = 10
+METRICS = ('vader', 'llm')
+
+_AGGREGATE_SQL = {
+    # Daily mean of article VADER scores per target
+    'vader': "SELECT t.target_type, t.target_name, t.day, AVG(a.vader_score) FROM target_articles t "
+             "JOIN articles a ON a.content_hash = t.content_hash WHERE t.day >= ? AND a.vader_score IS NOT NULL "
+             "GROUP BY t.target_type, t.target_name, t.day",
+    # Daily mean of stored Gemini scores per target
+    'llm': "SELECT target_type, target_name, day, AVG(llm_score) FROM analyses WHERE day >= ? AND llm_score IS NOT NULL "
+           "GROUP BY target_type, target_name, day",
+}
+
+
+class SentimentPanel:
+    """
+    Daily score per (target_type, target_name, day), kept in sync with the article store
+    incrementally: a refresh re-aggregates only the days from the earliest day touched by rows
+    added since the last refresh. Scores filled in later for old articles (backfill VADER
+    scoring) force one full reload. `version` changes whenever the values do.
+    """
+
+    def __init__(self, store, metric='vader'):
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}'; expected one of {', '.join(METRICS)}.")
+        self.store = store
+        self.metric = metric
+        self.version = 0
+        self._values = {}
+        self._marks = None
+        self._matrices = {}
+
+    def _current_marks(self):
+        if self.metric == 'vader':
+            (last_link, unscored), = self.store.execute(
+                "SELECT (SELECT IFNULL(MAX(rowid), 0) FROM target_articles), (SELECT COUNT(*) FROM articles WHERE vader_score IS NULL)")
+            return last_link, unscored
+        (last_analysis,), = self.store.execute("SELECT IFNULL(MAX(analysis_id), 0) FROM analyses")
+        return last_analysis, 0
+
+    def _first_touched_day(self, marks):
+        if self._marks is None or marks[1] < self._marks[1]:
+            return "" # First load, or old articles got scored: reload everything
+        if self.metric == 'vader':
+            sql = "SELECT MIN(day) FROM target_articles WHERE rowid > ?"
+        else:
+            sql = "SELECT MIN(day) FROM analyses WHERE analysis_id > ?"
+        (first_day,), = self.store.execute(sql, (self._marks[0],))
+        return first_day
+
+    def refresh(self):
+        """Pulls new days from the store; returns True if anything changed."""
+        marks = self._current_marks()
+        if marks == self._marks:
+            return False
+        from_day = self._first_touched_day(marks)
+        if from_day is not None:
+            self._values = {key: value for key, value in self._values.items() if key[2] < from_day}
+            for target_type, target_name, day, value in self.store.execute(_AGGREGATE_SQL[self.metric], (from_day,)):
+                self._values[(target_type, target_name, day)] = value
+            self.version += 1
+            self._matrices = {}
+            logger.debug("Sentiment panel (%s) reloaded from %s: %d values.", self.metric, from_day or "the start", len(self._values))
+        self._marks = marks
+        return from_day is not None
+
+    def matrix(self, target_type, max_days=ANALYTICS_MAX_DAYS):
+        """(names, days, values) with values[i, d] the score of names[i] on days[d], NaN where there is none."""
+        cached = self._matrices.get((target_type, max_days))
+        if cached is not None:
+            return cached
+        entries = [(name, day, value) for (kind, name, day), value in self._values.items() if kind == target_type]
+        if not entries:
+            result = ([], [], np.empty((0, 0)))
+        else:
+            last_day = datetime.strptime(max(day for _, day, _ in entries), '%Y-%m-%d')
+            first_day = max(datetime.strptime(min(day for _, day, _ in entries), '%Y-%m-%d'), last_day - timedelta(days=max_days - 1))
+            days = [(first_day + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range((last_day - first_day).days + 1)]
+            day_index = {day: index for index, day in enumerate(days)}
+            names = sorted({name for name, day, _ in entries if day in day_index})
+            name_index = {name: index for index, name in enumerate(names)}
+            values = np.full((len(names), len(days)), np.nan)
+            for name, day, value in entries:
+                if day in day_index:
+                    values[name_index[name], day_index[day]] = value
+            result = (names, days, values)
+        self._matrices[(target_type, max_days)] = result
+        return result
+
+
+def _pearson(n, sx, sy, sxx, syy, sxy, min_periods):
+    # Correlation from pairwise-complete sums; NaN where overlap is short or a side is constant
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sxy - sx * sy
+        var_x = n * sxx - sx * sx
+        var_y = n * syy - sy * sy
+        r = cov / np.sqrt(var_x * var_y)
+    r[(n < min_periods) | (var_x <= 1e-12) | (var_y <= 1e-12)] = np.nan
+    return np.clip(r, -1.0, 1.0)
+
+
+def _pair_sums(x):
+    """Pairwise-complete sums (n, sx, sy, sxx, syy, sxy) of every row pair of x, per column: shape (rows, rows, cols)."""
+    mask = ~np.isnan(x)
+    a = np.where(mask, x, 0.0); m = mask.astype(float)
+    return (m[:, None, :] * m[None, :, :], a[:, None, :] * m[None, :, :], m[:, None, :] * a[None, :, :],
+            (a * a)[:, None, :] * m[None, :, :], m[:, None, :] * (a * a)[None, :, :], a[:, None, :] * a[None, :, :])
+
+
+def rolling_correlations(x, window, min_periods=MIN_OVERLAP_DAYS):
+    """Correlation of every row pair over each trailing `window` columns: shape (rows, rows, cols - window + 1)."""
+    if x.shape[1] < window:
+        return np.full((x.shape[0], x.shape[0], 0), np.nan)
+    windowed = []
+    for total in _pair_sums(x):
+        cumulative = np.concatenate([np.zeros(total.shape[:2] + (1,)), np.cumsum(total, axis=2)], axis=2)
+        windowed.append(cumulative[:, :, window:] - cumulative[:, :, :-window])
+    return _pearson(*windowed, min(min_periods, window))
+
+
+def full_correlation(x, min_periods=MIN_OVERLAP_DAYS):
+    return _pearson(*(total.sum(axis=2) for total in _pair_sums(x)), min_periods)
+
+
+def lagged_correlations(x, max_lag, min_periods=MIN_OVERLAP_DAYS):
+    """
+    out[k + max_lag, i, j] = corr(x_i[t], x_j[t + k]) over the days both exist, for k in -max_lag..max_lag.
+    A peak at k > 0 means row i leads row j by k days.
+    """
+    rows, cols = x.shape
+    out = np.full((2 * max_lag + 1, rows, rows), np.nan)
+    for lag in range(-max_lag, max_lag + 1):
+        if abs(lag) >= cols:
+            continue
+        lead, follow = (x[:, :cols - lag], x[:, lag:]) if lag >= 0 else (x[:, -lag:], x[:, :cols + lag])
+        ml, mf = ~np.isnan(lead), ~np.isnan(follow)
+        a, b = np.where(ml, lead, 0.0), np.where(mf, follow, 0.0)
+        ml, mf = ml.astype(float), mf.astype(float)
+        out[lag + max_lag] = _pearson(ml @ mf.T, a @ mf.T, ml @ b.T, (a * a) @ mf.T, ml @ (b * b).T, a @ b.T, min_periods)
+    return out
+
+
+def constituent_dispersion(stock_values, membership):
+    """
+    Per sector and day: mean, standard deviation and count of its constituents' scores.
+    membership is (sectors, stocks) 0/1; stock_values is (stocks, days).
+    """
+    mask = ~np.isnan(stock_values)
+    a = np.where(mask, stock_values, 0.0)
+    count = membership @ mask.astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (membership @ a) / count
+        std = np.sqrt(np.maximum((membership @ (a * a)) / count - mean * mean, 0.0))
+    std[count < 2] = np.nan
+    return mean, std, count
+
+
+def _clean(values, digits=4):
+    # JSON-safe nested lists: NaN -> None
+    array = np.round(np.asarray(values, dtype=float), digits)
+    return np.where(np.isnan(array), None, array).tolist()
+
+
+class SentimentAnalytics:
+    """
+    Cross-sector statistics over the stored daily sentiment series: rolling and full-range
+    correlations between sectors, lead-lag cross-correlations, and each sector's dispersion
+    against its constituent stocks. Reads only the article store (no upstream calls); reports
+    are cached per parameter set and recomputed only after the panel picked up new data.
+    """
+
+    def __init__(self, store, sectors_config):
+        self.store = store
+        self.sectors_config = sectors_config
+        self._panels = {}
+        self._reports = {}
+        self._lock = threading.Lock()
+
+    def report(self, metric='vader', window=ROLLING_WINDOW_DAYS, max_lag=MAX_LAG_DAYS, min_periods=MIN_OVERLAP_DAYS,
+               max_days=ANALYTICS_MAX_DAYS):
+        with self._lock:
+            panel = self._panels.get(metric)
+            if panel is None:
+                panel = self._panels[metric] = SentimentPanel(self.store, metric)
+            panel.refresh()
+            key = (metric, window, max_lag, min_periods, max_days)
+            cached = self._reports.get(key)
+            if cached is not None and cached[0] == panel.version:
+                return dict(cached[1], cached=True)
+            result = self._compute(panel, window, max_lag, min_periods, max_days)
+            self._reports[key] = (panel.version, result)
+            return dict(result, cached=False)
+
+    def _compute(self, panel, window, max_lag, min_periods, max_days):
+        sectors, days, x = panel.matrix("sector", max_days)
+        result = {'metric': panel.metric, 'window_days': window, 'max_lag_days': max_lag,
+                  'days': [days[0], days[-1]] if days else [], 'sectors': sectors}
+        if not sectors:
+            return dict(result, correlation=None, top_pairs=[], lead_lag=[], dispersion={})
+
+        full = full_correlation(x, min_periods)
+        rolling = rolling_correlations(x, window, min_periods)
+        latest = rolling[:, :, -1] if rolling.shape[2] else np.full_like(full, np.nan)
+        result['correlation'] = {'full': _clean(full), 'rolling_latest': _clean(latest)}
+
+        pairs = [(i, j) for i in range(len(sectors)) for j in range(i + 1, len(sectors)) if not np.isnan(latest[i, j])]
+        pairs.sort(key=lambda pair: -abs(latest[pair]))
+        result['top_pairs'] = [{'a': sectors[i], 'b': sectors[j], 'rolling_latest': round(float(latest[i, j]), 4),
+                                'full': _clean(full[i, j]), 'series_start': days[window - 1], 'series': _clean(rolling[i, j])}
+                               for i, j in pairs[:TOP_PAIRS]]
+
+        lagged = lagged_correlations(x, max_lag, min_periods)
+        lead_lag = []
+        for i in range(len(sectors)):
+            for j in range(i + 1, len(sectors)):
+                curve = lagged[:, i, j]
+                if np.all(np.isnan(curve)):
+                    continue
+                best = int(np.nanargmax(np.abs(curve)))
+                lag = best - max_lag
+                leader, follower = (sectors[i], sectors[j]) if lag >= 0 else (sectors[j], sectors[i])
+                lead_lag.append({'leader': leader, 'follower': follower, 'lag_days': abs(lag), 'corr': round(float(curve[best]), 4),
+                                 'corr_same_day': _clean(curve[max_lag])})
+        lead_lag.sort(key=lambda item: (-(item['lag_days'] > 0), -abs(item['corr'])))
+        result['lead_lag'] = lead_lag
+
+        stock_names, stock_days, stock_x = panel.matrix("stock", max_days)
+        dispersion = {}
+        if stock_names:
+            # Align the stock matrix to the sector days
+            aligned = np.full((len(stock_names), len(days)), np.nan)
+            day_index = {day: index for index, day in enumerate(stock_days)}
+            columns = [(d, day_index[day]) for d, day in enumerate(days) if day in day_index]
+            if columns:
+                target, source = zip(*columns)
+                aligned[:, list(target)] = stock_x[:, list(source)]
+            stock_index = {name: index for index, name in enumerate(stock_names)}
+            membership = np.zeros((len(sectors), len(stock_names)))
+            for s, sector in enumerate(sectors):
+                for stock in self.sectors_config.get(sector, {}).get("stocks", {}):
+                    if stock in stock_index:
+                        membership[s, stock_index[stock]] = 1.0
+            mean, std, count = constituent_dispersion(aligned, membership)
+            for s, sector in enumerate(sectors):
+                if not membership[s].any():
+                    continue
+                dispersion[sector] = {'constituent_mean': _clean(mean[s]), 'dispersion': _clean(std[s]),
+                                      'sector_minus_constituents': _clean(x[s] - mean[s]), 'constituents_with_data': count[s].astype(int).tolist()}
+        result['dispersion'] = dispersion
+        result['dispersion_days'] = days
+        return result
@@ -0,0 +1,227 @@
+# utils/sharding.py
+import heapq
+import json
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from . import batch_analysis, gemini_utils, llm_concurrency, newsapi_helpers, newsapi_quota
+from .article import Article
+from .log_utils import make_log_func
+from .rate_limiter import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+
+logger = logging.getLogger(__name__)
+
+SHARD_COUNT = 4
+SHARD_BATCH_WORKERS = 4 # Task-graph workers inside each shard process
+SHARD_LOOKBACK_DAYS = 7
+SHARD_MAX_ARTICLES_SECTOR = 5
+SHARD_MAX_ARTICLES_STOCK = 3
+
+
+def load_universe(path):
+    """Reads a universe file shaped like NIFTY_SECTORS_QUERY_CONFIG ({sector: {newsapi_keywords, stocks: {stock: [keywords]}}})."""
+    with open(path, 'r', encoding='utf-8') as f:
+        universe = json.load(f)
+    if not isinstance(universe, dict) or not all(isinstance(cfg, dict) for cfg in universe.values()):
+        raise ValueError(f"{path}: expected an object of sector configs")
+    return universe
+
+
+def _unit_cost(sector_config):
+    # One sector fetch and LLM call, plus one LLM call per stock; the stocks' packed fetches are cheap in comparison
+    return 1 + len(sector_config.get("stocks", {}))
+
+
+def partition_universe(sectors_config, num_shards, sector_names=None):
+    """
+    Splits the universe into at most `num_shards` shards of whole sectors (a sector's stocks stay
+    with it, so the sector fetch and the stocks' packed queries are shared inside one shard; a stock
+    listed under several sectors is analyzed once, with the first of them).
+    Largest sectors go first onto the least-loaded shard, which keeps shard sizes within one sector
+    of each other. Returns a list of {sector_name: sector_config}.
+    """
+    sectors = [(name, cfg) for name, cfg in sectors_config.items() if not sector_names or name in sector_names]
+    sectors.sort(key=lambda item: (-_unit_cost(item[1]), item[0]))
+    num_shards = max(1, min(num_shards, len(sectors)))
+    heap = [(0, index) for index in range(num_shards)]
+    shards = [{} for _ in range(num_shards)]
+    for name, cfg in sectors:
+        load, index = heapq.heappop(heap)
+        shards[index][name] = cfg
+        heapq.heappush(heap, (load + _unit_cost(cfg), index))
+    return [shard for shard in shards if shard]
+
+
+def _assign_stocks(sectors_config, shards):
+    # A stock listed under several sectors is analyzed once, by the shard holding the first of them
+    shard_of_sector = {name: index for index, shard in enumerate(shards) for name in shard}
+    stock_targets = [[] for _ in shards]; seen = set()
+    for sector_name, sector_config in sectors_config.items():
+        if sector_name not in shard_of_sector:
+            continue
+        for stock_name in sector_config.get("stocks", {}):
+            if stock_name not in seen:
+                seen.add(stock_name)
+                stock_targets[shard_of_sector[sector_name]].append((sector_name, stock_name))
+    return stock_targets
+
+
+def _split_budget(total_calls, shards):
+    # Shares proportional to shard cost; every shard gets at least one call when the total allows it
+    costs = [sum(_unit_cost(cfg) for cfg in shard.values()) for shard in shards]
+    total_cost = sum(costs) or 1
+    floor = 1 if total_calls >= len(shards) else 0
+    spread = total_calls - floor * len(shards)
+    shares = [floor + spread * cost // total_cost for cost in costs]
+    for index in sorted(range(len(shards)), key=lambda i: -costs[i])[:total_calls - sum(shares)]:
+        shares[index] += 1
+    return shares
+
+
+def run_shard(spec):
+    """
+    Runs in a shard process. The shard gets its own share of everything that is rate-limited:
+    an in-memory quota ledger holding `call_budget` NewsAPI calls, NewsAPI pacing stretched by the
+    shard count (the configured interval stays the aggregate pace), and 1/N of the Gemini
+    concurrency. Both are derived from the coordinator's settings carried in the spec.
+    Caches are process-local. Returns plain data for the coordinator to merge.
+    """
+    started = time.monotonic()
+    num_shards = spec['num_shards']
+    gemini_utils.configure_sectors_config(spec['universe'])
+    newsapi_quota.configure_ledger(None, spec['call_budget'])
+    # Scaled from the coordinator's configured values in the spec, never from this process's globals:
+    # a reused pool worker would otherwise scale its own already-scaled settings again
+    newsapi_helpers.configure_newsapi(None, spec['newsapi_min_call_interval_seconds'] * num_shards)
+    llm_concurrency.configure_concurrency(
+        max(1, spec['gemini_initial_concurrency'] // num_shards), spec['gemini_min_concurrency'],
+        max(1, spec['gemini_max_concurrency'] // num_shards)
+    )
+    _log = make_log_func(logger, f"[Shard {spec['shard_index']}]")
+
+    client, err = newsapi_helpers.get_newsapi_org_client(spec['newsapi_api_key'])
+    if not client:
+        return {'shard_index': spec['shard_index'], 'error': f"NewsAPI client unavailable: {err}", 'results': [], 'articles': {},
+                'calls_used': 0, 'elapsed_seconds': time.monotonic() - started}
+
+    sector_targets = list(spec['universe'])
+    stock_targets = [tuple(pair) for pair in spec['stock_targets']]
+    from_date, to_date = datetime.strptime(spec['from_date'], '%Y-%m-%d'), datetime.strptime(spec['to_date'], '%Y-%m-%d')
+    _log("%d sector(s), %d stock(s), budget %d NewsAPI call(s).", 'info', len(sector_targets), len(stock_targets), spec['call_budget'])
+
+    graph = batch_analysis.plan_batch_analysis(
+        client, spec['gemini_api_key'], sector_targets, stock_targets, from_date, to_date,
+        f"{spec['from_date']} to {spec['to_date']}", spec['max_articles_sector'], spec['max_articles_stock'],
+        spec.get('custom_prompt', ""), priority=PRIORITY_INTERACTIVE # The coordinator already applied the caller's priority to the budget
+    )
+    results, errors = graph.run(max_workers=spec['batch_workers'])
+    articles = {}
+    for kind, targets in (("sector", [(name, name) for name in sector_targets]),
+                          ("stock", [(batch_analysis.stock_target_key(*pair), pair[1]) for pair in stock_targets])):
+        for task_key, name in targets:
+            scored = results.get(f"score:{kind}:{task_key}")
+            articles[f"{kind}:{name}"] = [art.to_dict() for art in scored[0]] if scored else []
+    return {
+        'shard_index': spec['shard_index'],
+        'error': None,
+        'results': batch_analysis.collect_batch_results(results, errors, sector_targets, stock_targets),
+        'articles': articles,
+        'calls_used': newsapi_quota.get_ledger().used_today(spec['newsapi_api_key']),
+        'elapsed_seconds': time.monotonic() - started,
+    }
+
+
+def _store_shard(store, shard_result, day, run_id):
+    with store.transaction():
+        for key, article_dicts in shard_result['articles'].items():
+            target_type, target_name = key.split(":", 1)
+            store.add_articles(target_type, target_name, [Article.from_dict(data) for data in article_dicts])
+        for result in shard_result['results']:
+            kind = result['target_type']
+            name = result['sector_name'] if kind == 'sector' else result['stock_name']
+            store.add_analysis(
+                kind, name, day, result[f'gemini_analysis_{kind}'], result[f'avg_vader_score_{kind}'],
+                result[f'num_articles_for_llm_{kind}'], result['sector_name'], run_id, result[f'error_message_{kind}']
+            )
+
+
+def run_sharded(store, sectors_config, newsapi_api_key, gemini_api_key, num_shards=SHARD_COUNT, sector_names=None,
+                include_stocks=True, lookback_days=SHARD_LOOKBACK_DAYS, max_calls=None, priority=PRIORITY_BACKGROUND,
+                max_articles_sector=SHARD_MAX_ARTICLES_SECTOR, max_articles_stock=SHARD_MAX_ARTICLES_STOCK,
+                batch_workers=SHARD_BATCH_WORKERS, run_id=None, process_initializer=None, initargs=(), append_log_func=None):
+    """
+    Coordinator: partitions the universe, runs one spawned process per shard and merges each
+    shard's articles and analyses into `store` as it finishes (this process is the only writer).
+    The NewsAPI budget is reserved in the shared quota ledger once, up front (respecting the
+    background reserve at PRIORITY_BACKGROUND), and split across shards by size; as each shard
+    finishes, the part of its share it did not use is handed back. A shard that crashed keeps its
+    whole share counted, since it may have made those calls. `process_initializer(*initargs)` runs first in
+    every shard process, e.g. to apply the same configure_* calls as the app.
+    Returns a summary dict.
+    """
+    _log = make_log_func(logger, "[Shards]", append_log_func)
+    started = time.monotonic()
+    run_id = run_id or time.strftime('%Y%m%d-%H%M%S')
+    shards = partition_universe(sectors_config, num_shards, sector_names)
+    if not shards:
+        return {'run_id': run_id, 'shards': [], 'error': "No sectors selected."}
+
+    ledger = newsapi_quota.get_ledger()
+    # Reserved, not just read: other processes spending the same key meanwhile cannot overdraw it
+    budget = ledger.reserve_budget(newsapi_api_key, max_calls, priority)
+    shares = _split_budget(budget, shards)
+    stock_targets = _assign_stocks(sectors_config, shards) if include_stocks else [[] for _ in shards]
+
+    today = datetime.now().date()
+    from_date = today - timedelta(days=max(1, lookback_days) - 1)
+    specs = [{
+        'shard_index': index, 'num_shards': len(shards), 'universe': shard, 'stock_targets': stocks, 'call_budget': share, 'newsapi_api_key': newsapi_api_key, 'gemini_api_key': gemini_api_key,
+        'from_date': from_date.strftime('%Y-%m-%d'), 'to_date': today.strftime('%Y-%m-%d'),
+        'max_articles_sector': max_articles_sector, 'max_articles_stock': max_articles_stock, 'batch_workers': batch_workers,
+        'newsapi_min_call_interval_seconds': newsapi_helpers.NEWSAPI_MIN_CALL_INTERVAL_SECONDS,
+        'gemini_initial_concurrency': llm_concurrency.GEMINI_INITIAL_CONCURRENCY, 'gemini_min_concurrency': llm_concurrency.GEMINI_MIN_CONCURRENCY,
+        'gemini_max_concurrency': llm_concurrency.GEMINI_MAX_CONCURRENCY,
+    } for index, (shard, share, stocks) in enumerate(zip(shards, shares, stock_targets))]
+    _log("Run %s: %d shard(s) over %d sector(s), NewsAPI budget %d call(s) split %s.", 'info',
+         run_id, len(shards), sum(len(s) for s in shards), budget, shares)
+
+    summaries = []; total_calls = 0
+    context = multiprocessing.get_context("spawn") # Fresh interpreters: no inherited locks, caches or client sessions
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=context, initializer=process_initializer, initargs=initargs) as pool:
+        futures = {pool.submit(run_shard, spec): spec for spec in specs}
+        for future in as_completed(futures):
+            spec = futures[future]
+            try:
+                shard_result = future.result()
+            except Exception as e: # The shard's reservation stays spent: its calls are unknown
+                _log("Shard %d failed: %s", 'error', spec['shard_index'], e)
+                summaries.append({'shard': spec['shard_index'], 'sectors': list(spec['universe']), 'error': str(e)[:200]})
+                continue
+            _store_shard(store, shard_result, today.strftime('%Y-%m-%d'), run_id)
+            unused = spec['call_budget'] - shard_result['calls_used']
+            if unused > 0:
+                ledger.record_calls(newsapi_api_key, -unused)
+            total_calls += shard_result['calls_used']
+            failed = sum(1 for r in shard_result['results'] if r.get(f"error_message_{r['target_type']}"))
+            summaries.append({
+                'shard': shard_result['shard_index'], 'sectors': list(spec['universe']), 'targets': len(shard_result['results']),
+                'failed_targets': failed, 'newsapi_calls': shard_result['calls_used'], 'call_budget': spec['call_budget'],
+                'seconds': round(shard_result['elapsed_seconds'], 2), 'error': shard_result['error'],
+            })
+            _log("Shard %d merged: %d target(s), %d failed, %d NewsAPI call(s), %.1fs.", 'info', shard_result['shard_index'],
+                 len(shard_result['results']), failed, shard_result['calls_used'], shard_result['elapsed_seconds'])
+
+    elapsed = time.monotonic() - started
+    targets = sum(s.get('targets', 0) for s in summaries)
+    return {
+        'run_id': run_id,
+        'shards': sorted(summaries, key=lambda s: s['shard']),
+        'targets': targets,
+        'newsapi_calls': total_calls,
+        'newsapi_budget': budget,
+        'seconds': round(elapsed, 2),
+        'targets_per_second': round(targets / elapsed, 3) if elapsed else None,
+        'store': store.stats(),
+    }
@@ -0,0 +1,81 @@
+# utils/task_graph.py
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .request_profiling import stage, propagate
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamTaskError(Exception):
+    """Recorded in the errors dict for tasks skipped because a dependency failed."""
+
+
+class TaskGraph:
+    """
+    Minimal dependency-aware executor. Tasks are added with the ids of the tasks they depend on
+    and are called with those tasks' results as positional arguments, in the order given.
+    Every task runs as soon as its last dependency finishes, so independent branches
+    (e.g. one sector's LLM call and another sector's fetch) overlap.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def add(self, task_id, func, deps=(), allow_failed_deps=False):
+        """With allow_failed_deps the task still runs when dependencies fail, receiving None for each failed one."""
+        if task_id in self._tasks:
+            raise ValueError(f"Duplicate task id: {task_id}")
+        missing = [dep for dep in deps if dep not in self._tasks]
+        if missing:
+            raise ValueError(f"Task {task_id} depends on unknown task(s): {missing}")
+        self._tasks[task_id] = (func, tuple(deps), allow_failed_deps)
+        return task_id
+
+    def __contains__(self, task_id):
+        return task_id in self._tasks
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def run(self, max_workers=4):
+        """Returns (results, errors): dicts keyed by task id. A failed task's dependents are not run."""
+        results, errors = {}, {}
+        dependents = {task_id: [] for task_id in self._tasks}
+        pending_deps = {}
+        for task_id, (_, deps, _) in self._tasks.items():
+            pending_deps[task_id] = len(deps)
+            for dep in deps:
+                dependents[dep].append(task_id)
+
+        def _finish(task_id, ready):
+            for child in dependents[task_id]:
+                pending_deps[child] -= 1
+                if pending_deps[child] == 0:
+                    ready.append(child)
+
+        ready = [task_id for task_id, count in pending_deps.items() if count == 0]
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while ready or running:
+                while ready:
+                    task_id = ready.pop(0)
+                    func, deps, allow_failed_deps = self._tasks[task_id]
+                    failed_deps = [dep for dep in deps if dep in errors]
+                    if failed_deps and not allow_failed_deps:
+                        errors[task_id] = UpstreamTaskError(f"Skipped: dependency {failed_deps[0]} failed.")
+                        _finish(task_id, ready)
+                        continue
+                    running[executor.submit(propagate(func), *[results.get(dep) for dep in deps])] = task_id
+                if not running:
+                    break
+                with stage("batch.task_wait"):
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_id = running.pop(future)
+                    try:
+                        results[task_id] = future.result()
+                    except Exception as e:
+                        logger.exception("Task %s failed", task_id)
+                        errors[task_id] = e
+                    _finish(task_id, ready)
+        return results, errors
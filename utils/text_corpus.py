@@ -0,0 +1,204 @@
+# utils/text_corpus.py
+import fcntl
+import logging
+import mmap
+import os
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TEXT_CORPUS_DIR = None # None/empty: article text stays in Python strings
+CORPUS_TAIL_MAX = 4096 # Appended entries looked up through a dict until the sorted index is rebuilt
+
+INDEX_DTYPE = np.dtype([('hash', '<u8'), ('offset', '<u8'), ('length', '<u4')]) # 20 bytes per article
+
+
+def _hash_key(content_hash):
+    return int(content_hash, 16) # content hashes are 16 hex digits (8-byte blake2b)
+
+
+class TextCorpus:
+    """
+    Append-only article text keyed by content hash: corpus.bin holds the UTF-8 texts back to back
+    and corpus.idx one fixed-width (hash, offset, length) record per text. Both are memory-mapped
+    read-only, so every process that opens the same directory shares the same page-cache pages
+    and Python holds no long-lived per-article strings. Only view() is zero-copy; text() decodes
+    a new str on every call. Appends from several processes are serialized with
+    an flock on the index file; readers pick them up on their next lookup miss.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.data_path = os.path.join(directory, "corpus.bin")
+        self.index_path = os.path.join(directory, "corpus.idx")
+        for path in (self.data_path, self.index_path):
+            open(path, 'ab').close()
+        self._lock = threading.RLock()
+        self._data_map = None; self._data_size = 0
+        self._index = np.zeros(0, dtype=INDEX_DTYPE); self._indexed = 0
+        self._sorted_hashes = np.zeros(0, dtype='<u8'); self._sorted_rows = np.zeros(0, dtype=np.int64)
+        self._tail = {} # hash key -> index row, for rows after the last sort
+        with open(self.index_path, 'ab') as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                self._drop_torn_record(index_file)
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+        self._refresh()
+
+    def _drop_torn_record(self, index_file):
+        # A writer that died mid-record leaves a partial one; later records would be misaligned behind it.
+        # Callers hold the index flock. Its text bytes in corpus.bin just become unreferenced.
+        size = os.fstat(index_file.fileno()).st_size
+        whole = size - size % INDEX_DTYPE.itemsize
+        if whole != size:
+            logger.warning("Dropping a torn %d-byte record at the end of %s", size - whole, self.index_path)
+            os.ftruncate(index_file.fileno(), whole)
+
+    def _refresh(self):
+        """Maps whatever has been appended since the last call (by any process)."""
+        with self._lock:
+            count = os.path.getsize(self.index_path) // INDEX_DTYPE.itemsize
+            if count != self._indexed:
+                self._index = np.memmap(self.index_path, dtype=INDEX_DTYPE, mode='r', shape=(count,)) if count else np.zeros(0, dtype=INDEX_DTYPE)
+                if count - len(self._sorted_rows) > CORPUS_TAIL_MAX or count < self._indexed:
+                    order = np.argsort(self._index['hash'], kind='stable')
+                    self._sorted_hashes = np.ascontiguousarray(self._index['hash'][order]); self._sorted_rows = order
+                    self._tail = {}
+                else:
+                    new_hashes = self._index['hash'][self._indexed:count]
+                    self._tail.update((int(h), self._indexed + i) for i, h in enumerate(new_hashes))
+                self._indexed = count
+            data_size = os.path.getsize(self.data_path)
+            if data_size != self._data_size:
+                # The old map is not closed: memoryviews handed out earlier may still point into it
+                with open(self.data_path, 'rb') as f:
+                    self._data_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if data_size else None
+                self._data_size = data_size
+
+    def _row(self, key):
+        row = self._tail.get(key)
+        if row is not None:
+            return row
+        position = np.searchsorted(self._sorted_hashes, key)
+        if position < len(self._sorted_hashes) and self._sorted_hashes[position] == key:
+            return int(self._sorted_rows[position])
+        return None
+
+    def _locate(self, content_hash):
+        key = _hash_key(content_hash)
+        with self._lock:
+            row = self._row(key)
+            if row is None:
+                self._refresh() # Another process may have appended it
+                row = self._row(key)
+            if row is None:
+                return None
+            record = self._index[row]
+            return self._data_map, int(record['offset']), int(record['length'])
+
+    def __contains__(self, content_hash):
+        return self._locate(content_hash) is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._indexed
+
+    def view(self, content_hash):
+        """Zero-copy memoryview of the UTF-8 bytes, or None if the hash is unknown."""
+        located = self._locate(content_hash)
+        if located is None:
+            return None
+        data_map, offset, length = located
+        return memoryview(data_map)[offset:offset + length]
+
+    def text(self, content_hash):
+        """The text decoded from the mapping (a transient str), or None if the hash is unknown."""
+        located = self._locate(content_hash)
+        if located is None:
+            return None
+        data_map, offset, length = located
+        return data_map[offset:offset + length].decode('utf-8')
+
+    def append_many(self, items):
+        """Appends (content_hash, text) pairs not stored yet; returns the number added."""
+        with self._lock, open(self.index_path, 'ab') as index_file:
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                self._drop_torn_record(index_file)
+                self._refresh()
+                new_items = {}
+                for content_hash, text in items:
+                    key = _hash_key(content_hash)
+                    if key not in new_items and self._row(key) is None:
+                        new_items[key] = text.encode('utf-8')
+                if not new_items:
+                    return 0
+                records = np.zeros(len(new_items), dtype=INDEX_DTYPE)
+                with open(self.data_path, 'ab') as data_file:
+                    offset = data_file.seek(0, os.SEEK_END)
+                    for i, (key, encoded) in enumerate(new_items.items()):
+                        records[i] = (key, offset, len(encoded))
+                        offset += len(encoded)
+                    data_file.write(b"".join(new_items.values()))
+                    data_file.flush(); os.fsync(data_file.fileno()) # Texts land before the index records that point at them
+                index_file.write(records.tobytes())
+                index_file.flush()
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+            self._refresh()
+            return len(new_items)
+
+    def stats(self):
+        with self._lock:
+            return {'articles': self._indexed, 'text_bytes': self._data_size, 'index_bytes': self._indexed * INDEX_DTYPE.itemsize,
+                    'unsorted_tail': len(self._tail)}
+
+
+_corpus = None
+_corpus_lock = threading.Lock()
+
+
+def configure_corpus(directory):
+    global TEXT_CORPUS_DIR, _corpus
+    with _corpus_lock:
+        TEXT_CORPUS_DIR, _corpus = directory or None, None
+    return get_corpus()
+
+
+def get_corpus():
+    """The process-wide corpus at TEXT_CORPUS_DIR, or None when the corpus is disabled."""
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None and TEXT_CORPUS_DIR:
+            _corpus = TextCorpus(TEXT_CORPUS_DIR)
+        return _corpus
+
+
+def to_corpus_articles(articles, corpus=None, append=True):
+    """
+    Moves the articles' text into the corpus and returns CorpusArticle stand-ins (unchanged if the corpus is disabled).
+    With append=False nothing is written: only articles already in the corpus are swapped for stand-ins.
+    """
+    from .article import CorpusArticle
+    corpus = corpus if corpus is not None else get_corpus() # An empty corpus is falsy (__len__)
+    if corpus is None:
+        return list(articles)
+    articles = list(articles)
+    if append:
+        corpus.append_many((art.content_hash, art.content) for art in articles if not isinstance(art, CorpusArticle))
+    return [CorpusArticle(corpus, art.content_hash, art.date, art.uri, art.source, art.vader_score)
+            if not isinstance(art, CorpusArticle) and (append or art.content_hash in corpus) else art
+            for art in articles]
+
+
+def materialize_articles(articles):
+    """
+    Plain Articles for a request's hot path: each CorpusArticle is decoded once here, instead of
+    once per `content` read in tagging, ranking and prompt building.
+    """
+    from .article import Article, CorpusArticle
+    return [Article(art.content, art.date, art.uri, art.source, art.vader_score, art.content_hash) if isinstance(art, CorpusArticle) else art
+            for art in articles]
@@ -0,0 +1,319 @@
+# utils/watchlist.py
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from . import newsapi_helpers, newsapi_quota, gemini_utils
+from .article import Article
+from .log_utils import make_log_func
+from .rate_limiter import PRIORITY_BACKGROUND
+from .sentiment_analyzer import get_vader_sentiment_score, get_average_vader_score, get_sentiment_label_from_score
+
+logger = logging.getLogger(__name__)
+
+WATCHLIST_STATE_PATH = "data/watchlist_state.json"
+WATCHLIST_EVENTS_PATH = "data/watchlist_events.jsonl"
+WATCHLIST_POLL_SECONDS = 1800 # 0 disables the background monitor
+WATCHLIST_LOOKBACK_DAYS = 3 # First poll of a stock starts this far back
+WATCHLIST_MAX_ARTICLES = 15 # Newest articles kept per stock and sent to Gemini
+WATCHLIST_SCORE_THRESHOLD = 0.2 # Gemini score move that counts as a change even without a label flip
+FEED_MAX_EVENTS = 500
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def parse_watchlist(spec, sectors_config):
+    """
+    "Sector:Stock" or bare "Stock" items, comma-separated (a bare name is looked up in the sector config).
+    Returns {stock: sector} for the configured stocks; unknown names are logged and skipped.
+    """
+    watchlist = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        sector_name, _, stock_name = item.rpartition(":")
+        sector_name, stock_name = sector_name.strip(), stock_name.strip()
+        if not sector_name:
+            sector_name = next((name for name, conf in sectors_config.items() if stock_name in conf.get("stocks", {})), "")
+        if stock_name not in sectors_config.get(sector_name, {}).get("stocks", {}):
+            logger.warning("Watchlist entry '%s' is not a configured stock; skipping.", item)
+            continue
+        watchlist[stock_name] = sector_name
+    return watchlist
+
+
+class ChangeFeed:
+    """
+    Append-only feed of change events: kept in memory for subscribers (since()/wait_for()) and
+    appended to a JSONL file so the history survives restarts. Event ids increase monotonically.
+    """
+
+    def __init__(self, path=WATCHLIST_EVENTS_PATH, max_events=FEED_MAX_EVENTS):
+        self.path = path
+        self._events = deque(maxlen=max_events)
+        self._cond = threading.Condition()
+        self._last_id = 0
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            self._events.append(json.loads(line))
+                if self._events: self._last_id = self._events[-1]['id']
+            except (OSError, ValueError) as e:
+                logger.warning("Could not read watchlist event feed %s: %s", path, e)
+
+    def append(self, event):
+        with self._cond:
+            self._last_id += 1
+            event = {'id': self._last_id, 'time': datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT), **event}
+            self._events.append(event)
+            if self.path:
+                try:
+                    directory = os.path.dirname(self.path)
+                    if directory: os.makedirs(directory, exist_ok=True)
+                    with open(self.path, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(event) + "\n")
+                except OSError as e:
+                    logger.warning("Could not persist watchlist event %d: %s", event['id'], e)
+            self._cond.notify_all()
+        return event
+
+    def since(self, last_id=0):
+        with self._cond:
+            return [event for event in self._events if event['id'] > last_id]
+
+    def wait_for(self, last_id=0, timeout=15.0):
+        """Events newer than `last_id`, blocking up to `timeout` seconds for the first one."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._last_id > last_id, timeout=timeout)
+            return [event for event in self._events if event['id'] > last_id]
+
+
+class WatchlistMonitor:
+    """
+    Polls a fixed stock watchlist cheaply. Stocks are packed into shared NewsAPI queries, and each
+    poll asks only for articles published after the oldest per-stock cursor in the pack (sorted by
+    publishedAt, one page), i.e. usually one call per pack returning nothing or a handful of new
+    articles. Only stocks that received new articles get VADER and a Gemini re-analysis (which the
+    incremental path turns into a delta update). A label flip or a score move of at least
+    WATCHLIST_SCORE_THRESHOLD is appended to the change feed. New articles only join a stock's
+    kept set once their analysis succeeds; until then they wait in 'pending' and are retried
+    when the stock's pack is next polled (the pack cursor has already moved past them).
+    Calls run at background priority, so the quota ledger's interactive reserve is never touched;
+    packs are polled least-recently-polled first, so a short budget still rotates through all of them.
+    """
+
+    def __init__(self, watchlist, sectors_config, country_keywords, state_path=None, feed=None, score_threshold=None):
+        self.watchlist = watchlist
+        self.sectors_config = sectors_config
+        self.country_keywords = country_keywords
+        self.state_path = state_path
+        self.feed = feed or ChangeFeed(None)
+        self.score_threshold = WATCHLIST_SCORE_THRESHOLD if score_threshold is None else score_threshold
+        self._lock = threading.Lock() # One poll at a time
+        self._state_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.last_poll = None
+        self._stocks = self._load_state()
+        keywords_map = {stock: sectors_config[sector]["stocks"][stock] for stock, sector in watchlist.items()}
+        self._packs = newsapi_helpers.plan_packed_stock_queries(keywords_map, country_keywords)
+        self._alias_patterns = newsapi_helpers.build_alias_patterns(keywords_map)
+        self._pack_polled_at = {query: 0.0 for _, query in self._packs}
+
+    def _load_state(self):
+        stocks = {}
+        if self.state_path and os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    stocks = json.load(f).get('stocks', {})
+            except (OSError, ValueError) as e:
+                logger.warning("Could not read watchlist state %s, starting fresh: %s", self.state_path, e)
+        for stock_name, sector_name in self.watchlist.items():
+            stocks.setdefault(stock_name, {'sector': sector_name, 'cursor': None, 'last_published_at': None, 'articles': [],
+                                           'analysis': None, 'avg_vader_score': None, 'last_checked': None, 'last_analyzed': None})
+            stocks[stock_name].setdefault('pending', []) # State saved before failed analyses were retried
+        return {name: entry for name, entry in stocks.items() if name in self.watchlist}
+
+    def _save_state(self):
+        if not self.state_path:
+            return
+        directory = os.path.dirname(self.state_path)
+        if directory: os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with self._state_lock:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'stocks': self._stocks}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def snapshot(self):
+        """Per-stock status for the API (without the stored article texts)."""
+        with self._state_lock:
+            stocks = {name: {key: value for key, value in entry.items() if key not in ('articles', 'pending')}
+                      | {'num_articles': len(entry['articles']), 'num_pending': len(entry['pending'])}
+                      for name, entry in self._stocks.items()}
+        return {'stocks': stocks, 'packs': len(self._packs), 'last_poll': self.last_poll,
+                'poll_seconds': WATCHLIST_POLL_SECONDS, 'running': self._thread is not None and self._thread.is_alive()}
+
+    def _pack_from(self, pack_stocks):
+        lookback_start = (datetime.now(timezone.utc) - timedelta(days=WATCHLIST_LOOKBACK_DAYS)).strftime(TIMESTAMP_FORMAT)
+        cursors = [self._stocks[stock]['cursor'] or lookback_start for stock in pack_stocks]
+        return max(min(cursors), lookback_start)
+
+    def _fetch_pack(self, newsapi_client, pack_stocks, query, _log):
+        """New articles per stock for one pack, or None when the quota refused the call."""
+        api_key = newsapi_quota.client_api_key(newsapi_client)
+        ledger = newsapi_quota.get_ledger()
+        if not ledger.reserve(api_key, PRIORITY_BACKGROUND):
+            return None
+        newsapi_helpers.acquire_call_slot(PRIORITY_BACKGROUND)
+        from_ts = self._pack_from(pack_stocks)
+        try:
+            response = newsapi_client.get_everything(q=query, from_param=from_ts, language='en', sort_by='publishedAt', page_size=100, page=1)
+        except Exception as e: # NewsAPIException, network errors: skip this pack, keep polling the rest
+            _log("NewsAPI request polling %s failed: %s", 'warning', ", ".join(pack_stocks), str(e)[:200])
+            return {}
+        if response.get('status') != 'ok':
+            _log("NewsAPI error polling %s: %s", 'warning', ", ".join(pack_stocks), response.get('message'))
+            return {}
+        raw_articles = response.get('articles') or []
+        if len(raw_articles) < (response.get('totalResults') or 0):
+            _log("More than one page of new articles for %s since %s; keeping the newest %d.", 'info', ", ".join(pack_stocks), from_ts, len(raw_articles))
+
+        articles = []
+        for raw in raw_articles:
+            content = newsapi_helpers.extract_article_content(raw)
+            stamp = (raw.get('publishedAt') or '')[:19]
+            if content and stamp:
+                articles.append((stamp + 'Z', Article(content, stamp[:10], raw.get('url') or '', (raw.get('source') or {}).get('name') or 'N/A', None)))
+        newest_in_pack = max((stamp for stamp, _ in articles), default=None)
+
+        new_by_stock = {}
+        buckets = newsapi_helpers.tag_articles_by_alias([art for _, art in articles], {s: self._alias_patterns[s] for s in pack_stocks})
+        stamps = {id(art): stamp for stamp, art in articles}
+        for stock_name in pack_stocks:
+            entry = self._stocks[stock_name]
+            known = {a['content_hash'] for a in entry['articles'] + entry['pending']}
+            fresh = [(stamps[id(art)], art) for art in buckets[stock_name]
+                     if stamps[id(art)] > (entry['last_published_at'] or '') and art.content_hash not in known]
+            if fresh:
+                new_by_stock[stock_name] = fresh
+            # Everything up to the pack's newest article has been seen for every stock in it
+            if newest_in_pack and newest_in_pack > (entry['cursor'] or ''):
+                entry['cursor'] = newest_in_pack
+            entry['last_checked'] = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+        return new_by_stock
+
+    def _refresh_stock(self, stock_name, fresh, gemini_api_key, _log):
+        entry = self._stocks[stock_name]
+        for stamp, art in fresh:
+            art.vader_score = get_vader_sentiment_score(art.content)
+        new_articles = entry['pending'] + [{'content': art.content, 'date': art.date, 'uri': art.uri, 'source': art.source,
+                                            'vader_score': art.vader_score, 'content_hash': art.content_hash, 'published_at': stamp}
+                                           for stamp, art in fresh]
+        stored = sorted(entry['articles'] + new_articles, key=lambda a: a['published_at'], reverse=True)[:WATCHLIST_MAX_ARTICLES]
+
+        articles = [Article(a['content'], a['date'], a['uri'], a['source'], a['vader_score'], a['content_hash']) for a in stored]
+        days = sorted(a['date'] for a in stored)
+        # New articles arrived, so always re-analyze: a reused (stale) analysis would never produce a change event
+        analysis, err = gemini_utils.analyze_news_with_gemini(
+            gemini_api_key, articles, stock_name, f"{days[0]} to {days[-1]}", target_type="stock", reuse=False
+        )
+        if err:
+            # Nothing is committed, so the next poll of this stock's pack retries with these articles
+            entry['pending'] = new_articles
+            _log("Gemini re-analysis for %s failed, %d new article(s) kept pending: %s", 'warning', stock_name, len(new_articles), err)
+            return None
+        previous = entry['analysis']
+        entry['articles'] = stored
+        entry['pending'] = []
+        entry['last_published_at'] = max([entry['last_published_at'] or ''] + [a['published_at'] for a in new_articles])
+        entry['avg_vader_score'] = get_average_vader_score([a['vader_score'] for a in stored])
+        entry['analysis'] = {key: analysis.get(key) for key in ('overall_sentiment', 'sentiment_score_llm', 'summary', 'analysis_mode')}
+        entry['last_analyzed'] = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+        return self._change_event(stock_name, previous, entry, len(new_articles))
+
+    def _change_event(self, stock_name, previous, entry, new_articles):
+        current = entry['analysis']
+        old_label = previous.get('overall_sentiment') if previous else None
+        old_score = previous.get('sentiment_score_llm') if previous else None
+        new_score = current.get('sentiment_score_llm') or 0.0
+        label_changed = old_label is not None and old_label != current.get('overall_sentiment')
+        score_delta = new_score - old_score if isinstance(old_score, (int, float)) else None
+        if not label_changed and (score_delta is None or abs(score_delta) < self.score_threshold):
+            return None
+        return self.feed.append({
+            'type': 'sentiment_change', 'stock': stock_name, 'sector': entry['sector'],
+            'previous_label': old_label, 'label': current.get('overall_sentiment'),
+            'previous_score': old_score, 'score': new_score, 'score_delta': round(score_delta, 3) if score_delta is not None else None,
+            'avg_vader_score': entry['avg_vader_score'], 'new_articles': new_articles,
+            'vader_label': get_sentiment_label_from_score(entry['avg_vader_score']), 'summary': current.get('summary'),
+        })
+
+    def poll(self, newsapi_client, gemini_api_key, append_log_func=None):
+        """One pass over the packs; returns {'calls', 'stocks_refreshed', 'events', 'skipped_packs'}."""
+        _log = make_log_func(logger, "[Watchlist]", append_log_func)
+        summary = {'calls': 0, 'stocks_refreshed': [], 'events': [], 'skipped_packs': 0}
+        with self._lock:
+            packs = sorted(self._packs, key=lambda pack: self._pack_polled_at[pack[1]])
+            for index, (pack_stocks, query) in enumerate(packs):
+                new_by_stock = self._fetch_pack(newsapi_client, pack_stocks, query, _log)
+                if new_by_stock is None:
+                    summary['skipped_packs'] = len(packs) - index
+                    _log("NewsAPI background budget used up; %d pack(s) left for the next poll.", 'info', summary['skipped_packs'])
+                    break
+                summary['calls'] += 1
+                self._pack_polled_at[query] = time.time()
+                retries = [stock for stock in pack_stocks if stock not in new_by_stock and self._stocks[stock]['pending']]
+                for stock_name, fresh in list(new_by_stock.items()) + [(stock, []) for stock in retries]:
+                    event = self._refresh_stock(stock_name, fresh, gemini_api_key, _log)
+                    summary['stocks_refreshed'].append(stock_name)
+                    if event: summary['events'].append(event)
+            self.last_poll = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+            try:
+                self._save_state()
+            except OSError as e:
+                _log("Could not persist watchlist state: %s", 'warning', e)
+        _log("Poll done: %d call(s), %d stock(s) refreshed, %d change event(s).", 'info',
+             summary['calls'], len(summary['stocks_refreshed']), len(summary['events']))
+        return summary
+
+    def start(self, client_factory, gemini_api_key_func, interval_seconds=None):
+        """
+        Background polling every `interval_seconds`. `client_factory()` returns the NewsAPI client (or None)
+        and `gemini_api_key_func()` the Gemini key, both looked up per poll so key changes are picked up.
+        """
+        interval_seconds = interval_seconds or WATCHLIST_POLL_SECONDS
+        if self._thread is not None or not interval_seconds or not self.watchlist:
+            return False
+
+        def _run():
+            while not self._stop.is_set():
+                try:
+                    newsapi_client = client_factory()
+                    if newsapi_client is not None:
+                        self.poll(newsapi_client, gemini_api_key_func())
+                except Exception:
+                    logger.exception("Watchlist poll failed")
+                self._stop.wait(interval_seconds)
+
+        with self._start_lock:
+            if self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=_run, name="watchlist-monitor", daemon=True)
+            self._thread.start()
+        logger.info("Watchlist monitor started for %d stock(s), polling every %ds.", len(self.watchlist), interval_seconds)
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+
+def configure_watchlist(poll_seconds, lookback_days=WATCHLIST_LOOKBACK_DAYS, max_articles=WATCHLIST_MAX_ARTICLES, score_threshold=WATCHLIST_SCORE_THRESHOLD):
+    global WATCHLIST_POLL_SECONDS, WATCHLIST_LOOKBACK_DAYS, WATCHLIST_MAX_ARTICLES, WATCHLIST_SCORE_THRESHOLD
+    WATCHLIST_POLL_SECONDS, WATCHLIST_LOOKBACK_DAYS, WATCHLIST_MAX_ARTICLES, WATCHLIST_SCORE_THRESHOLD = poll_seconds, lookback_days, max_articles, score_threshold